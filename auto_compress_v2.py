@@ -7,6 +7,8 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from PIL import Image, ImageOps, ImageFilter, ImageEnhance
 
+import durable_write
+
 # 預設設定，如果 config.json 讀取失敗會用這組
 DEFAULT_CONFIG = {
     "watch_folder": "./photos_original",
@@ -25,14 +27,19 @@ DEFAULT_CONFIG = {
     }
 }
 
+# 外框疊合時的區塊大小 (像素)
+FRAME_TILE = 64
+
 class ImageProcessor:
     def __init__(self, config):
         self.config = config
+        self._frame_tile_cache = {}
         
     def load_watermark_assets(self):
         """預先載入浮水印或外框圖片以提升效能"""
         self.watermark_img = None
         self.frame_img = None
+        self._frame_tile_cache = {}
         
         proc_config = self.config.get('processing', {})
         
@@ -100,9 +107,9 @@ class ImageProcessor:
         # 但為了保持外框解析度，我們先計算外框的縮放比例
         frame_ratio = target_size / max(frame.size)
         new_frame_size = (int(frame.width * frame_ratio), int(frame.height * frame_ratio))
-        frame_resized = frame.resize(new_frame_size, Image.Resampling.LANCZOS)
+        frame_tiles = self._frame_tiles(new_frame_size)
         
-        final_canvas = Image.new("RGB", frame_resized.size, (255, 255, 255))
+        final_canvas = Image.new("RGB", new_frame_size, (255, 255, 255))
         
         if mode == 'cover':
             # 滿版裁切 (Center Crop)
@@ -121,9 +128,30 @@ class ImageProcessor:
             final_canvas.paste(img_copy, (pos_x, pos_y))
             
         # 疊上外框 (Frame 必須是 PNG 透明圖層)
-        final_canvas.paste(frame_resized, (0, 0), frame_resized)
+        # 只處理外框有不透明像素的區塊，中間透明的部分不動
+        for box, tile in frame_tiles:
+            final_canvas.paste(tile, box[:2], tile)
         return final_canvas
 
+    def _frame_tiles(self, frame_size):
+        """
+        外框縮放後切成 FRAME_TILE 大小的區塊，只保留有不透明像素的區塊 [(box, RGBA 區塊)]。
+        同一輸出尺寸只計算一次。
+        """
+        cache = self._frame_tile_cache
+        if frame_size not in cache:
+            frame_resized = self.frame_img.resize(frame_size, Image.Resampling.LANCZOS)
+            alpha = frame_resized.getchannel("A")
+            tiles = []
+            for top in range(0, frame_size[1], FRAME_TILE):
+                for left in range(0, frame_size[0], FRAME_TILE):
+                    box = (left, top, min(left + FRAME_TILE, frame_size[0]), min(top + FRAME_TILE, frame_size[1]))
+                    if alpha.crop(box).getbbox():
+                        tiles.append((box, frame_resized.crop(box)))
+            cache.clear()  # 只留目前的尺寸
+            cache[frame_size] = tiles
+        return cache[frame_size]
+
     def _apply_watermark(self, img):
         """套用浮水印邏輯"""
         wm_config = self.config['processing']['watermark']
@@ -166,10 +194,12 @@ class ImageProcessor:
         x = max(0, min(x, img.width - wm.width))
         y = max(0, min(y, img.height - wm.height))
         
-        # 由於要保留底圖，且浮水印有透明度，需將主圖轉為 RGBA 疊合後再轉回 RGB
-        img_rgba = img.convert("RGBA")
-        img_rgba.alpha_composite(wm, (x, y))
-        return img_rgba.convert("RGB")
+        # 由於要保留底圖，且浮水印有透明度，只把浮水印所在區域轉為 RGBA 疊合後再貼回
+        box = (x, y, x + wm.width, y + wm.height)
+        region = img.crop(box).convert("RGBA")
+        region.alpha_composite(wm)
+        img.paste(region.convert("RGB"), box[:2])
+        return img
 
 
 class Watcher(FileSystemEventHandler):
@@ -200,11 +230,13 @@ class Watcher(FileSystemEventHandler):
         output_path = os.path.join(self.output_folder, name + ".jpg")
         
         try:
-            img.save(
-                output_path, 
-                "JPEG", 
-                quality=self.jpeg_quality, 
-                optimize=True, 
+            # 先寫暫存檔再 rename，同步腳本與網頁不會讀到寫一半的 JPEG
+            durable_write.save_image(
+                img,
+                output_path,
+                "JPEG",
+                quality=self.jpeg_quality,
+                optimize=True,
                 progressive=self.progressive
             )
             print(f"✅ 完成: {os.path.basename(output_path)}")
@@ -216,8 +248,7 @@ class Watcher(FileSystemEventHandler):
             files = [f for f in os.listdir(self.output_folder) if f.lower().endswith(('.jpg', '.jpeg'))]
             files.sort(key=lambda x: os.path.getmtime(os.path.join(self.output_folder, x)), reverse=True)
             manifest_path = os.path.join(self.output_folder, 'manifest.json')
-            with open(manifest_path, 'w', encoding='utf-8') as f:
-                json.dump(files, f, ensure_ascii=False, indent=2)
+            durable_write.write_json(manifest_path, files)
         except:
             pass
 
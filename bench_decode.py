@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark: publish with and without JPEG draft (DCT-scaled) decoding.
+
+Usage:
+    python3 bench_decode.py                      # synthetic 24 MP / 45 MP frames
+    python3 bench_decode.py photo1.jpg ...       # real camera frames
+    python3 bench_decode.py --scale 1.5 ...      # with a zoom crop applied
+
+Each measurement runs in a fresh process so peak RSS is per configuration.
+Reports decode time (open + draft + load), total publish time and peak RSS.
+"""
+
+import os
+import sys
+import time
+import copy
+import tempfile
+import resource
+import multiprocessing
+
+from PIL import Image, ImageFilter
+
+BENCH_CONFIG = {
+    "max_size": 1600,
+    "jpeg_quality": 85,
+    "processing": {
+        "sharpen": True,
+        "progressive": True,
+        "fused_pipeline": True,
+        "draft_decode": True,
+        "watermark": {"enabled": False},
+    },
+    "renditions": {"enabled": False},  # Primary output only
+}
+RUNS = 3
+
+
+def peak_rss_mb():
+    # Linux: VmHWM is this process image only (ru_maxrss also counts the parent's peak before exec)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measure(path, draft, scale, queue):
+    import math
+    from image_processor import ImageProcessor
+    from render_plan import plan_geometry, draft_reduction
+
+    config = copy.deepcopy(BENCH_CONFIG)
+    config["processing"]["draft_decode"] = draft
+    processor = ImageProcessor(config)
+
+    decode_times, total_times = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = os.path.join(tmp, "out.jpg")
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            with Image.open(path) as img:
+                if draft:
+                    plan = plan_geometry(img.size, img.getexif().get(0x0112, 1), scale=scale,
+                                         max_size=config["max_size"])
+                    reduction = draft_reduction(plan)
+                    if reduction > 1:
+                        img.draft(None, (math.ceil(img.width / reduction), math.ceil(img.height / reduction)))
+                img.load()
+                decoded_size = img.size
+            decode_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            processor.process_image(path, dest, scale=scale)
+            total_times.append(time.perf_counter() - start)
+
+    queue.put({
+        "decoded_size": decoded_size,
+        "decode_ms": min(decode_times) * 1000,
+        "total_ms": min(total_times) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+
+def measure(path, draft, scale):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(path, draft, scale, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def synthetic_frames(folder):
+    frames = []
+    for width, height in ((6000, 4000), (8192, 5464)):
+        path = os.path.join(folder, f"synthetic_{width}x{height}.jpg")
+        noise = Image.effect_noise((width // 8, height // 8), 60).resize((width, height), Image.Resampling.BICUBIC)
+        img = Image.merge("RGB", (noise, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                                  Image.linear_gradient("L").resize((width, height))))
+        img.filter(ImageFilter.DETAIL).save(path, "JPEG", quality=95)
+        frames.append(path)
+    return frames
+
+
+def main():
+    args = sys.argv[1:]
+    scale = 1.0
+    if "--scale" in args:
+        i = args.index("--scale")
+        scale = float(args[i + 1])
+        del args[i:i + 2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args or synthetic_frames(tmp)
+        print(f"{'frame':<32} {'mode':<6} {'decoded':>11} {'decode':>9} {'publish':>9} {'peak RSS':>10}")
+        for path in paths:
+            for draft in (False, True):
+                r = measure(path, draft, scale)
+                print(f"{os.path.basename(path):<32} {'draft' if draft else 'full':<6} "
+                      f"{r['decoded_size'][0]:>5}x{r['decoded_size'][1]:<5} "
+                      f"{r['decode_ms']:>7.0f}ms {r['total_ms']:>7.0f}ms {r['peak_rss_mb']:>8.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JPEG encoder settings (jpeg_encoder.py) over a corpus.
+
+Usage:
+    python3 bench_encoder.py                     # synthetic busy / dark / smooth frames
+    python3 bench_encoder.py photos_web/ a.jpg   # real photos (files or folders)
+
+Every image is fitted to 1600 px like a publish, then encoded with each
+configuration below. Reports per configuration: mean and max size, total
+size relative to the current fixed-quality setting, chosen quality, SSIM
+against the uncompressed frame and encode time (including the search).
+"""
+
+import os
+import sys
+import time
+from PIL import Image, ImageDraw, ImageFilter
+
+import jpeg_encoder
+
+MAX_SIZE = 1600
+
+CONFIGS = [
+    ("fixed q85 4:2:0 (current)", {"mode": "fixed", "quality": 85}),
+    ("fixed q85 4:4:4", {"mode": "fixed", "quality": 85, "subsampling": "4:4:4"}),
+    ("fixed q85 baseline", {"mode": "fixed", "quality": 85, "progressive": False}),
+    ("fixed q85 baseline no opt", {"mode": "fixed", "quality": 85, "progressive": False, "optimize": False}),
+    ("size <= 300 KB", {"mode": "size", "target_kb": 300}),
+    ("size <= 500 KB", {"mode": "size", "target_kb": 500}),
+    ("ssim >= 0.98", {"mode": "ssim", "min_ssim": 0.98}),
+    ("ssim >= 0.99", {"mode": "ssim", "min_ssim": 0.99}),
+    ("ssim >= 0.99, <= 400 KB", {"mode": "ssim", "min_ssim": 0.99, "max_kb": 400}),
+]
+
+
+def synthetic_corpus():
+    """Busy stage shot, dark ballroom shot, smooth backdrop"""
+    size = (MAX_SIZE, 1067)
+    noise = Image.effect_noise(size, 80)
+    busy = Image.merge("RGB", (noise, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                               Image.linear_gradient("L").resize(size)))
+    draw = ImageDraw.Draw(busy)
+    for i in range(40):
+        x, y = (i * 97) % size[0], (i * 53) % size[1]
+        draw.rectangle((x, y, x + 120, y + 60), fill=(255, 30 * (i % 8), 20))
+
+    dark = Image.effect_noise((size[0] // 4, size[1] // 4), 10).resize(size, Image.Resampling.BICUBIC)
+    dark = Image.merge("RGB", (dark.point(lambda v: v // 6), dark.point(lambda v: v // 8), dark.point(lambda v: v // 5)))
+
+    smooth = Image.linear_gradient("L").resize(size).filter(ImageFilter.GaussianBlur(20))
+    smooth = Image.merge("RGB", (smooth, smooth.transpose(Image.Transpose.FLIP_LEFT_RIGHT), smooth))
+    return [("synthetic-busy", busy), ("synthetic-dark", dark), ("synthetic-smooth", smooth)]
+
+
+def load_corpus(args):
+    paths = []
+    for arg in args:
+        if os.path.isdir(arg):
+            paths += sorted(os.path.join(arg, f) for f in os.listdir(arg)
+                            if not f.startswith('.') and f.lower().endswith(('.jpg', '.jpeg', '.png')))
+        else:
+            paths.append(arg)
+    corpus = []
+    for path in paths:
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+            img.thumbnail((MAX_SIZE, MAX_SIZE), Image.Resampling.LANCZOS)
+            corpus.append((os.path.basename(path), img))
+    return corpus
+
+
+def main():
+    corpus = load_corpus(sys.argv[1:]) if sys.argv[1:] else synthetic_corpus()
+    if not corpus:
+        sys.exit("No images found")
+    references = [jpeg_encoder.SSIMReference(img) for _, img in corpus]
+    print(f"{len(corpus)} image(s) at <= {MAX_SIZE}px\n")
+    print(f"{'configuration':<28} {'mean KB':>8} {'max KB':>8} {'total':>7} {'quality':>9} "
+          f"{'SSIM':>7} {'min SSIM':>9} {'encode':>9}")
+
+    baseline_total = None
+    for label, overrides in CONFIGS:
+        settings = dict(jpeg_encoder.DEFAULT_SETTINGS, **overrides)
+        progressive = settings.pop("progressive", True)  # Progressive scans imply optimized Huffman tables
+        sizes, qualities, scores, times = [], [], [], []
+        for (_, img), reference in zip(corpus, references):
+            start = time.perf_counter()
+            data, info = jpeg_encoder.encode_jpeg(img, settings, progressive)
+            times.append(time.perf_counter() - start)
+            sizes.append(len(data))
+            qualities.append(info["quality"])
+            scores.append(reference.score(data))
+        total = sum(sizes)
+        baseline_total = baseline_total or total
+        print(f"{label:<28} {total / len(sizes) / 1024:>8.0f} {max(sizes) / 1024:>8.0f} "
+              f"{total / baseline_total * 100:>6.0f}% {min(qualities):>4}-{max(qualities):<4} "
+              f"{sum(scores) / len(scores):>7.4f} {min(scores):>9.4f} {sum(times) / len(times) * 1000:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
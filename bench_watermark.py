@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: region-only overlay compositing vs full-frame RGBA round trips.
+
+Usage:
+    python3 bench_watermark.py
+
+Compares, on a 1600px output frame:
+  - server watermark: whole frame -> RGBA -> alpha_composite -> RGB
+    vs image_processor.composite_region (watermark bounding box only)
+  - auto_compress_v2 frame overlay: paste of the full-canvas frame with its
+    alpha as mask vs pasting only the frame tiles that have opaque pixels
+Both paths must produce identical pixels.
+"""
+
+import time
+from PIL import Image, ImageChops, ImageDraw
+
+from image_processor import composite_region
+
+RUNS = 50
+FRAME_SIZE = (1600, 1067)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        result = fn()
+    return (time.perf_counter() - start) / RUNS * 1000, result
+
+
+def sample_frame():
+    img = Image.linear_gradient("L").resize(FRAME_SIZE).convert("RGB")
+    ImageDraw.Draw(img).ellipse((200, 200, 900, 800), fill=(200, 40, 90))
+    return img
+
+
+def bench_watermark():
+    base = sample_frame()
+    logo = Image.new("RGBA", (320, 80), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).rounded_rectangle((0, 0, 319, 79), 16, fill=(255, 255, 255, 170))
+    x, y = FRAME_SIZE[0] - logo.width - 50, FRAME_SIZE[1] - logo.height - 50
+
+    def full_frame():
+        rgba = base.convert("RGBA")
+        rgba.alpha_composite(logo, (x, y))
+        return rgba.convert("RGB")
+
+    def region_only():
+        return composite_region(base.copy(), logo, x, y)
+
+    t_full, a = timed(full_frame)
+    t_region, b = timed(region_only)
+    t_copy, _ = timed(base.copy)  # region_only pays for a copy here; the publish path does not
+    assert ImageChops.difference(a, b).getbbox() is None, "watermark output differs"
+    print(f"watermark  full-frame {t_full:6.2f} ms   region-only {t_region - t_copy:6.2f} ms")
+
+
+def bench_frame():
+    from auto_compress_v2 import ImageProcessor as CompressProcessor
+
+    # 40px decorative border, transparent center
+    frame = Image.new("RGBA", (3200, 2134), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(frame)
+    draw.rectangle((0, 0, 3199, 2133), outline=(240, 200, 120, 255), width=80)
+    draw.text((120, 1980), "LIVE EVENT", fill=(255, 255, 255, 230))
+
+    processor = CompressProcessor({"processing": {"frame": {"enabled": True, "mode": "contain"}}})
+    processor.frame_img = frame
+    photo = sample_frame()
+    target = max(FRAME_SIZE)
+
+    def full_canvas():
+        ratio = target / max(frame.size)
+        size = (int(frame.width * ratio), int(frame.height * ratio))
+        frame_resized = frame.resize(size, Image.Resampling.LANCZOS)
+        canvas = Image.new("RGB", size, (255, 255, 255))
+        img_copy = photo.copy()
+        img_copy.thumbnail(size, Image.Resampling.LANCZOS)
+        canvas.paste(img_copy, ((size[0] - img_copy.width) // 2, (size[1] - img_copy.height) // 2))
+        canvas.paste(frame_resized, (0, 0), frame_resized)
+        return canvas
+
+    t_full, a = timed(full_canvas)
+    t_tiles, b = timed(lambda: processor._apply_frame(photo, target))
+    assert ImageChops.difference(a, b).getbbox() is None, "frame output differs"
+    print(f"frame      full-canvas {t_full:6.2f} ms   opaque tiles {t_tiles:6.2f} ms")
+
+
+if __name__ == "__main__":
+    bench_watermark()
+    bench_frame()
@@ -0,0 +1,366 @@
+"""
+Ingest catalog for the camera buffer folder.
+
+Watches the buffer folder (watchdog, or a periodic listdir when watchdog is
+not installed), waits until a camera/tethering write has finished, reads the
+EXIF header once per file and keeps the catalog sorted by capture time in
+memory, so /api/buffer never has to list or stat the folder.
+
+Listeners registered with add_listener(fn) are called as
+fn("buffer-added", [entries]) / fn("buffer-removed", [filenames]) from the
+catalog's worker thread.
+"""
+
+import os
+import time
+import json
+import base64
+import bisect
+import logging
+import threading
+from datetime import datetime
+from PIL import Image
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Fall back to polling the folder
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SETTLE_SECONDS = 1.0     # A file must be quiet this long before it is ingested
+POLL_INTERVAL = 2        # Folder listing interval when watchdog is unavailable
+RESCAN_INTERVAL = 60     # Safety-net listing interval with watchdog
+INCOMPLETE_GIVE_UP = 300  # Seconds to keep waiting for a truncated JPEG to finish
+
+# EXIF tags
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_SUBSEC_ORIGINAL = 0x9291
+
+
+def is_buffer_image(filename: str) -> bool:
+    # Skip macOS hidden files (._ prefix) and .DS_Store
+    return not filename.startswith('.') and filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def is_write_complete(path: str) -> bool:
+    """JPEGs must end with the EOI marker (FF D9); other files just need to be non-empty"""
+    try:
+        if not path.lower().endswith(('.jpg', '.jpeg')):
+            return os.path.getsize(path) > 0
+        with open(path, 'rb') as f:
+            f.seek(-2, os.SEEK_END)
+            return f.read(2) == b'\xff\xd9'
+    except OSError:
+        return False
+
+
+def _parse_exif_time(value, subsec=None):
+    try:
+        ts = datetime.strptime(str(value).strip('\x00 '), "%Y:%m:%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError):
+        return None
+    if subsec:
+        try:
+            ts += float("0." + str(subsec).strip('\x00 '))
+        except ValueError:
+            pass
+    return ts
+
+
+def read_metadata(path: str, stat) -> dict:
+    """Capture time, camera, orientation and dimensions from the file header (pixels are not decoded)"""
+    entry = {
+        "filename": os.path.basename(path),
+        "capture_time": stat.st_mtime,
+        "capture_source": "mtime",
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "camera": None,
+        "orientation": 1,
+        "width": None,
+        "height": None,
+    }
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            exif = img.getexif()
+    except Exception as e:
+        logger.warning(f"Could not read image header for {entry['filename']}: {e}")
+        return entry
+
+    orientation = exif.get(TAG_ORIENTATION, 1) or 1
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width  # Displayed dimensions
+    entry.update(width=width, height=height, orientation=orientation)
+
+    camera = " ".join(str(exif.get(tag, "")).strip('\x00 ') for tag in (TAG_MAKE, TAG_MODEL)).strip()
+    if camera:
+        entry["camera"] = camera
+
+    exif_ifd = exif.get_ifd(EXIF_IFD)
+    capture_time = _parse_exif_time(exif_ifd.get(TAG_DATETIME_ORIGINAL), exif_ifd.get(TAG_SUBSEC_ORIGINAL)) \
+        or _parse_exif_time(exif.get(TAG_DATETIME))
+    if capture_time is not None:
+        entry["capture_time"] = capture_time
+        entry["capture_source"] = "exif"
+    return entry
+
+
+def encode_cursor(entry) -> str:
+    raw = json.dumps([entry["capture_time"], entry["filename"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        capture_time, filename = json.loads(raw)
+        return (float(capture_time), str(filename))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class _BufferEventHandler(FileSystemEventHandler):
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.catalog.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.catalog.touch(event.src_path)
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self.catalog.touch(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.catalog.touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.catalog.touch(event.src_path)
+            self.catalog.touch(event.dest_path)
+
+
+class BufferCatalog:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.RLock()
+        self._entries = {}   # filename -> metadata entry
+        self._order = []     # sorted (capture_time, filename), oldest first
+        self._pending = {}   # filename -> (last event time, first seen time)
+        self._listeners = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+        self.ready = False
+
+    # --- lifecycle ---
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="buffer-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._stop_observer()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def set_folder(self, folder: str):
+        """Switch to another buffer folder (rebuilds the catalog)"""
+        self.stop()
+        with self._lock:
+            removed = list(self._entries)
+            self.folder = folder
+            self._entries.clear()
+            self._order.clear()
+            self._pending.clear()
+            self.ready = False
+        if removed:
+            self._notify("buffer-removed", removed)
+        self.start()
+
+    def _start_observer(self):
+        if Observer is None:
+            logger.info("watchdog not installed, polling the buffer folder")
+            return
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_BufferEventHandler(self), self.folder, recursive=False)
+            self._observer.start()
+        except Exception as e:
+            logger.warning(f"Buffer watcher unavailable ({e}), polling instead")
+            self._observer = None
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+
+    # --- ingest ---
+    def touch(self, path: str):
+        """Something happened to this file; (re)check it once it has settled"""
+        name = os.path.basename(path)
+        if not is_buffer_image(name):
+            return
+        now = time.monotonic()
+        with self._lock:
+            first_seen = self._pending.get(name, (now, now))[1]
+            self._pending[name] = (now, first_seen)
+        self._wake.set()
+
+    def discard(self, filename: str):
+        """Drop a file the server itself moved away (no buffer-removed event)"""
+        with self._lock:
+            self._discard_locked(filename)
+            self._pending.pop(filename, None)
+
+    def _run(self):
+        self._start_observer()
+        self._rescan()
+        self.ready = True
+        logger.info(f"Buffer catalog: {len(self._entries)} photos in {self.folder}")
+        interval = RESCAN_INTERVAL if self._observer is not None else POLL_INTERVAL
+        next_rescan = time.monotonic() + interval
+        while not self._stop.is_set():
+            timeout = self._process_pending()
+            now = time.monotonic()
+            if now >= next_rescan:
+                self._rescan()
+                next_rescan = now + interval
+            self._wake.wait(min(timeout, max(0.0, next_rescan - now)))
+            self._wake.clear()
+
+    def _rescan(self):
+        """One listdir: queue unknown files, drop files that disappeared"""
+        try:
+            on_disk = {f for f in os.listdir(self.folder) if is_buffer_image(f)}
+        except OSError as e:
+            logger.warning(f"Cannot list buffer folder {self.folder}: {e}")
+            return
+        now = time.monotonic()
+        with self._lock:
+            gone = [f for f in self._entries if f not in on_disk]
+            for f in gone:
+                self._discard_locked(f)
+            for f in on_disk:
+                if f not in self._entries and f not in self._pending:
+                    # Already-settled files (startup scan) don't need to wait
+                    self._pending[f] = (now - SETTLE_SECONDS, now)
+        if gone:
+            self._notify("buffer-removed", gone)
+        self._process_pending()
+
+    def _process_pending(self) -> float:
+        """Ingest files that have been quiet for SETTLE_SECONDS; returns seconds until the next check"""
+        now = time.monotonic()
+        with self._lock:
+            ready = [f for f, (last, _) in self._pending.items() if now - last >= SETTLE_SECONDS]
+        added, removed = [], []
+        for name in ready:
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                with self._lock:
+                    self._pending.pop(name, None)
+                    if self._discard_locked(name):
+                        removed.append(name)
+                continue
+            if not is_write_complete(path):
+                with self._lock:
+                    last, first_seen = self._pending.get(name, (now, now))
+                    if now - first_seen > INCOMPLETE_GIVE_UP:
+                        logger.warning(f"Giving up on incomplete file: {name}")
+                        self._pending.pop(name, None)
+                    else:
+                        self._pending[name] = (now, first_seen)  # Still being written
+                continue
+            with self._lock:
+                known = self._entries.get(name)
+            if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+                with self._lock:
+                    self._pending.pop(name, None)
+                continue
+            entry = read_metadata(path, stat)
+            with self._lock:
+                pending = self._pending.get(name)
+                if pending and pending[0] > now:
+                    continue  # Touched again while we were reading it
+                self._pending.pop(name, None)
+                self._discard_locked(name)
+                self._entries[name] = entry
+                bisect.insort(self._order, (entry["capture_time"], name))
+            added.append(entry)
+        if removed:
+            self._notify("buffer-removed", removed)
+        if added:
+            self._notify("buffer-added", added)
+        with self._lock:
+            if not self._pending:
+                return RESCAN_INTERVAL
+            oldest = min(last for last, _ in self._pending.values())
+        return max(0.05, SETTLE_SECONDS - (time.monotonic() - oldest))
+
+    def _discard_locked(self, filename: str) -> bool:
+        entry = self._entries.pop(filename, None)
+        if entry is None:
+            return False
+        key = (entry["capture_time"], filename)
+        i = bisect.bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+        return True
+
+    def _notify(self, event_type, payload):
+        for fn in self._listeners:
+            try:
+                fn(event_type, payload)
+            except Exception as e:
+                logger.error(f"Buffer catalog listener failed: {e}")
+
+    # --- queries ---
+    def page(self, cursor: str = None, limit: int = 0):
+        """
+        Entries newest first, starting after `cursor` (from a previous page).
+        limit=0 returns everything. Returns (entries, next_cursor or None).
+        """
+        with self._lock:
+            end = len(self._order)
+            if cursor:
+                end = bisect.bisect_left(self._order, decode_cursor(cursor))
+            start = max(0, end - limit) if limit > 0 else 0
+            keys = self._order[start:end]
+            entries = [self._entries[f] for _, f in reversed(keys)]
+        next_cursor = encode_cursor(entries[-1]) if limit > 0 and start > 0 and entries else None
+        return entries, next_cursor
+
+    def get(self, filename: str):
+        with self._lock:
+            return self._entries.get(filename)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fused single-pass geometry (render_plan.render) vs the original
+step-by-step pipeline (render_plan.render_reference) on full-size photos.
+
+Usage:
+    python3 check_render_parity.py                 # synthetic 6000x4000 test image
+    python3 check_render_parity.py photo1.jpg ...  # real photos
+
+Runs every combination of EXIF orientation, rotation, straighten, scale and
+exposure (192 cases per photo, several minutes on a slow machine) and reports
+per-image times for both pipelines plus any case outside the tolerances
+below. The fast pass/fail parity tests are tests/test_render_parity.py.
+"""
+
+import io
+import sys
+import math
+import time
+import itertools
+from PIL import Image, ImageChops, ImageDraw, ImageEnhance, ImageFilter, ImageStat
+
+from render_plan import plan_geometry, render, render_reference
+
+MAX_SIZE = 1600
+MAX_MEAN_DIFF = 1.5   # Mean absolute difference per channel (0-255)
+MIN_PSNR = 32.0       # dB
+
+ORIENTATIONS = [1, 3, 6, 8]
+ROTATIONS = [0, 90, 180, 270]
+STRAIGHTENS = [0.0, -3.5, 2.0]
+SCALES = [1.0, 1.6]
+EXPOSURES = [0.0, 0.7]
+
+
+def synthetic_image(width=6000, height=4000):
+    """Photo-like test image: smooth gradients, hard edges and fine texture"""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width // 4, height // 4), 40).resize((width, height), Image.Resampling.BICUBIC)
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        x, y = (i * 487) % width, (i * 331) % height
+        draw.ellipse((x, y, x + width // 6, y + height // 6), outline=(255, 255, 255), width=12)
+        draw.rectangle((y, x % height, y + 300, x % height + 200), fill=(20 * i, 200, 90))
+    return img.filter(ImageFilter.GaussianBlur(1))
+
+
+def with_orientation(img, orientation):
+    """Encode img as a JPEG carrying the given EXIF orientation tag"""
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=92, exif=exif)
+    buf.seek(0)
+    return Image.open(buf)
+
+
+def compare(a, b):
+    diff = ImageChops.difference(a, b)
+    mean = sum(ImageStat.Stat(diff).mean) / 3
+    mse = sum(ImageStat.Stat(diff).sum2) / (3 * a.width * a.height)
+    psnr = float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+    return mean, psnr
+
+
+def fused(img, exposure, rotation, straighten, scale):
+    orientation = img.getexif().get(0x0112, 1)
+    plan = plan_geometry(img.size, orientation, rotation, straighten, scale, MAX_SIZE)
+    out = render(img.convert("RGB") if img.mode != "RGB" else img, plan)
+    if exposure != 0.0:
+        out = ImageEnhance.Brightness(out).enhance(2 ** exposure)
+    return out
+
+
+def check(source, label):
+    failures = 0
+    t_ref = t_fused = 0.0
+    cases = list(itertools.product(ORIENTATIONS, ROTATIONS, STRAIGHTENS, SCALES, EXPOSURES))
+    for orientation, rotation, straighten, scale, exposure in cases:
+        img = with_orientation(source, orientation)
+        img.load()
+
+        start = time.perf_counter()
+        expected = render_reference(img, exposure, rotation, straighten, scale, MAX_SIZE)
+        t_ref += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = fused(img, exposure, rotation, straighten, scale)
+        t_fused += time.perf_counter() - start
+
+        case = f"orient={orientation} rot={rotation} str={straighten} scale={scale} exp={exposure}"
+        if actual.size != expected.size:
+            print(f"❌ {label} {case}: size {actual.size} != {expected.size}")
+            failures += 1
+            continue
+        mean, psnr = compare(actual, expected)
+        ok = mean <= MAX_MEAN_DIFF and psnr >= MIN_PSNR
+        if not ok:
+            failures += 1
+        if not ok or "-v" in sys.argv:
+            print(f"{'✅' if ok else '❌'} {label} {case}: mean diff {mean:.2f}, PSNR {psnr:.1f} dB")
+
+    print(f"{label}: {len(cases) - failures}/{len(cases)} within tolerance; "
+          f"reference {t_ref / len(cases) * 1000:.0f} ms, fused {t_fused / len(cases) * 1000:.0f} ms per image")
+    return failures
+
+
+def main():
+    paths = [a for a in sys.argv[1:] if not a.startswith("-")]
+    failures = 0
+    if paths:
+        for path in paths:
+            with Image.open(path) as img:
+                failures += check(img.convert("RGB"), path)
+    else:
+        failures += check(synthetic_image(), "synthetic")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Crash-safe writes for files other processes read while we write them.
+
+The web folder is watched by the R2 sync daemon and served to galleries, so a
+file written in place can be uploaded or fetched half-written. write_bytes()
+writes a hidden temp file in the same directory, fsyncs it, renames it over
+the target (atomic on POSIX and Windows) and fsyncs the directory so the
+rename itself survives a power cut. Readers see the old file or the complete
+new one, never a prefix.
+
+Temp files are named ".<name>.<random>.tmp": folder watchers and scans that
+skip dotfiles never pick them up (see is_temp_name()).
+"""
+
+import io
+import os
+import json
+import tempfile
+
+TEMP_SUFFIX = ".tmp"
+
+# mkstemp creates 0600 files; published files keep the usual umask-based mode
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def is_temp_name(name: str) -> bool:
+    """Whether name is an in-progress write_bytes() temp file"""
+    return name.startswith(".") and name.endswith(TEMP_SUFFIX)
+
+
+def _fsync_dir(folder: str):
+    # Directory fsync persists the rename; not available on Windows
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_bytes(path: str, data: bytes, durable: bool = True):
+    """Atomically replace path with data (durable=False skips the fsyncs)"""
+    folder, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=TEMP_SUFFIX, dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if durable:
+        _fsync_dir(folder)
+
+
+def write_json(path: str, obj, indent=2, durable: bool = True):
+    write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8"), durable)
+
+
+def save_image(img, path: str, format: str = "JPEG", durable: bool = True, **options):
+    """img.save() to path via write_bytes()"""
+    buf = io.BytesIO()
+    img.save(buf, format, **options)
+    write_bytes(path, buf.getvalue(), durable)
@@ -0,0 +1,105 @@
+"""
+In-process event bus for the admin dashboard.
+
+Server code calls bus.publish("published", {...}); every connected dashboard
+receives it over Server-Sent Events (/api/events). Recent events are kept in a
+ring buffer so a client that reconnects with Last-Event-ID gets what it missed;
+if it fell too far behind it is told to resync (reload the full lists).
+"""
+
+import json
+import asyncio
+import logging
+import itertools
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = 500       # Events kept for Last-Event-ID replay
+SUBSCRIBER_QUEUE = 1000  # Pending events per client before it is forced to resync
+KEEPALIVE_SECONDS = 15
+
+
+class EventBus:
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._subscribers = set()
+        self._loop = None
+
+    def bind(self, loop):
+        """Remember the server's event loop so publish() can be called from other threads"""
+        self._loop = loop
+
+    def publish(self, event_type: str, data: dict):
+        """Emit an event to every subscriber (safe to call from any thread)"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event_type, data)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, event_type, data)
+
+    def _dispatch(self, event_type, data):
+        event = {"id": next(self._ids), "event": event_type, "data": data}
+        self._history.append(event)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and tell it to reload
+                self._subscribers.discard(queue)
+                queue.overflowed = True
+
+    def _replay(self, last_event_id):
+        """Events after last_event_id, or None if they are no longer in the buffer"""
+        if not self._history or self._history[0]["id"] > last_event_id + 1 \
+                or self._history[-1]["id"] < last_event_id:
+            return None  # Too old, or from before a server restart
+        return [e for e in self._history if e["id"] > last_event_id]
+
+    async def stream(self, last_event_id: int = None):
+        """Async iterator of SSE-formatted strings for one client"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        queue.overflowed = False
+        self._subscribers.add(queue)
+        try:
+            if last_event_id is not None:
+                missed = self._replay(last_event_id)
+                if missed is None:
+                    yield format_sse({"id": None, "event": "resync", "data": {}})
+                else:
+                    for event in missed:
+                        yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if queue.overflowed:
+                        yield format_sse({"id": None, "event": "resync", "data": {}})
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if queue.overflowed and queue.empty():
+                    yield format_sse({"id": None, "event": "resync", "data": {}})
+                    return
+        finally:
+            self._subscribers.discard(queue)
+
+    def stats(self):
+        return {"subscribers": len(self._subscribers), "last_event_id": self._history[-1]["id"] if self._history else 0}
+
+
+def format_sse(event) -> str:
+    lines = []
+    if event.get("id") is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event['data'], ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
@@ -25,8 +25,8 @@ export async function onRequest(context) {
   }
   
   try {
-    // 從 R2 取得物件
-    const object = await env.GALLERY.get(r2Path);
+    // 從 R2 取得物件（帶 If-None-Match 時，ETag 相同就不傳內容）
+    const object = await env.GALLERY.get(r2Path, { onlyIf: request.headers });
     
     if (!object) {
       return new Response('Photo not found', { status: 404 });
@@ -34,6 +34,7 @@ export async function onRequest(context) {
     
     // 取得物件內容
     const headers = new Headers();
+    headers.set('ETag', object.httpEtag);
     
     // 設定 Content-Type
     if (r2Path.endsWith('.jpg') || r2Path.endsWith('.jpeg')) {
@@ -42,6 +43,8 @@ export async function onRequest(context) {
       headers.set('Content-Type', 'image/png');
     } else if (r2Path.endsWith('.webp')) {
       headers.set('Content-Type', 'image/webp');
+    } else if (r2Path.endsWith('.avif')) {
+      headers.set('Content-Type', 'image/avif');
     } else if (r2Path.endsWith('.json')) {
       headers.set('Content-Type', 'application/json');
     } else {
@@ -49,18 +52,29 @@ export async function onRequest(context) {
     }
     
     // 設定緩存策略
-    // 照片: 長期緩存（1年）
-    // manifest.json: 短期緩存（5分鐘），但前端會加時間戳繞過
-    if (r2Path.endsWith('.json')) {
-      headers.set('Cache-Control', 'public, max-age=300, must-revalidate');
-    } else {
+    // renditions/、manifest-chunks/（檔名含內容雜湊）與帶 ?v=<內容雜湊> 的照片主檔: 內容不會改變，長期緩存（1年）
+    // 沒有版本的照片主檔: 檔名可能在取消發布後被新照片重用，每次向邊緣驗證 ETag
+    // manifest-head.json / manifest-delta.json: 每次都向邊緣驗證 ETag，沒變就 304（只有幾百 bytes）
+    // manifest.json（舊版完整列表）: 短期緩存
+    if (r2Path.includes('manifest-chunks/') || r2Path.includes('renditions/') || url.searchParams.has('v')) {
       headers.set('Cache-Control', 'public, max-age=31536000, immutable');
+    } else if (r2Path.endsWith('manifest-head.json') || r2Path.endsWith('manifest-delta.json')) {
+      headers.set('Cache-Control', 'public, max-age=0, must-revalidate');
+    } else if (r2Path.endsWith('.json')) {
+      headers.set('Cache-Control', 'public, max-age=10, must-revalidate');
+    } else {
+      headers.set('Cache-Control', 'public, max-age=0, must-revalidate');
     }
     
     // CORS 標頭（如果需要）
     headers.set('Access-Control-Allow-Origin', '*');
     headers.set('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS');
     
+    // ETag 相符：R2 只回傳 metadata（沒有 body）
+    if (!('body' in object)) {
+      return new Response(null, { status: 304, headers: headers });
+    }
+    
     // 返回物件內容
     return new Response(object.body, {
       status: 200,
@@ -0,0 +1,120 @@
+"""
+Publish/unpublish history backed by SQLite (WAL mode).
+
+Replaces the old history.json read-modify-write: counters are incremented in
+a single transaction, so concurrent publishes can't lose counts, and reads are
+served from an in-memory cache so listing endpoints never touch the disk.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+EMPTY_HISTORY = {"published": 0, "unpublished": 0}
+
+
+def history_key(filename: str) -> str:
+    """History is tracked per web output name (always .jpg)"""
+    name, ext = os.path.splitext(filename)
+    return name + ".jpg"
+
+
+class HistoryStore:
+    def __init__(self, db_path: str, legacy_json_path: str = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " filename TEXT PRIMARY KEY,"
+            " published INTEGER NOT NULL DEFAULT 0,"
+            " unpublished INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if legacy_json_path:
+            self._migrate_json(legacy_json_path)
+        self._cache = {
+            row[0]: {"published": row[1], "unpublished": row[2]}
+            for row in self._conn.execute("SELECT filename, published, unpublished FROM history")
+        }
+        logger.info(f"History store: {len(self._cache)} entries in {db_path}")
+
+    def _migrate_json(self, json_path: str):
+        """One-shot import of the legacy history.json (the JSON file is left untouched)"""
+        if not os.path.exists(json_path):
+            return
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return
+        try:
+            with open(json_path, "r") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read legacy history file {json_path}: {e}")
+            return
+        rows = [
+            (filename, int(counts.get("published", 0)), int(counts.get("unpublished", 0)))
+            for filename, counts in legacy.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check inside the write lock in case another process migrated first
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return
+                self._conn.executemany(
+                    "INSERT INTO history (filename, published, unpublished) VALUES (?, ?, ?) "
+                    "ON CONFLICT(filename) DO UPDATE SET "
+                    " published = published + excluded.published,"
+                    " unpublished = unpublished + excluded.unpublished",
+                    rows
+                )
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (json_path,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Migrated {len(rows)} history entries from {json_path}")
+
+    def record(self, filenames, action: str):
+        """Increment the publish/unpublish counter for each file in one transaction"""
+        if action not in ("publish", "unpublish"):
+            raise ValueError(f"Unknown history action: {action}")
+        column = "published" if action == "publish" else "unpublished"
+        keys = [history_key(f) for f in filenames]
+        if not keys:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO history (filename, {column}) VALUES (?, 1) "
+                    f"ON CONFLICT(filename) DO UPDATE SET {column} = {column} + 1",
+                    [(k,) for k in keys]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for k in keys:
+                entry = self._cache.setdefault(k, dict(EMPTY_HISTORY))
+                entry[column] += 1
+
+    def get(self, filename: str):
+        entry = self._cache.get(history_key(filename))
+        return dict(entry) if entry else dict(EMPTY_HISTORY)
+
+    def get_many(self, filenames):
+        """Batched lookup for listing endpoints: {filename: counts}"""
+        with self._lock:
+            return {f: dict(self._cache.get(history_key(f), EMPTY_HISTORY)) for f in filenames}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
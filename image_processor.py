@@ -0,0 +1,342 @@
+"""
+Image processing pipeline shared by the FastAPI server and the publish worker pool.
+
+Kept free of FastAPI/server imports so worker processes can import it cheaply.
+"""
+
+import os
+import json
+import math
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageFilter, ImageEnhance, ImageDraw, ImageFont
+
+from render_plan import plan_geometry, draft_reduction, render, render_reference, fit_size
+import renditions
+import jpeg_encoder
+import durable_write
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_TAG = 0x0112
+WATERMARK_CACHE_SIZE = 32  # Rendered watermark tiles kept (one per output size, plus preview-scaled copies)
+
+def composite_region(img, overlay, x, y):
+    """
+    Alpha-composite an RGBA overlay onto an RGB image in place, touching only
+    the overlay's bounding box (same pixels as converting the whole frame to
+    RGBA, compositing and converting back).
+    """
+    box = (x, y, x + overlay.width, y + overlay.height)
+    region = img.crop(box).convert("RGBA")
+    region.alpha_composite(overlay)
+    img.paste(region.convert("RGB"), box[:2])
+    return img
+
+class ImageProcessor:
+    def __init__(self, config, source_cache=None):
+        self.config = config
+        self.source_cache = source_cache  # source_proxy.ProxyCache, or None to decode every publish
+        self.watermark_img = None
+        self._watermark_cache = OrderedDict()  # (w, h, preview w, type, settings hash) -> (tile, x, y) or None
+        self._font_cache = {}
+        self._lock = threading.RLock()  # The server renders previews from several threads
+        self.load_assets()
+
+    def load_assets(self):
+        # Settings or the watermark file changed: drop rendered tiles
+        self._watermark_cache.clear()
+        self.watermark_img = None
+        wm_conf = self.config['processing']['watermark']
+        if wm_conf['enabled']:
+            if wm_conf.get('type', 'image') == 'image' and os.path.exists(wm_conf.get('image_path', '')):
+                try:
+                    self.watermark_img = Image.open(wm_conf['image_path']).convert("RGBA")
+                    logger.info("Watermark image loaded successfully.")
+                except Exception as e:
+                    logger.error(f"Failed to load watermark image: {e}")
+            # Text watermark doesn't need pre-loading
+
+    def process_image(self, source_path: str, dest_path: str, exposure: float = 0.0,
+                       rotation: int = 0, straighten: float = 0.0, scale: float = 1.0):
+        """
+        Applies edits (exposure, rotation, straighten, scale) and watermark to an image and saves it,
+        plus the configured renditions (see renditions.py).
+        Returns the renditions sidecar dict, or None when renditions are disabled.
+
+        Args:
+            rotation: 90° increments (0, 90, 180, 270)
+            straighten: Fine angle adjustment (-5 to +5 degrees), will crop to remove black edges
+            scale: Zoom level (1.0 = 100%, >1.0 = zoom in with center crop)
+        """
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"Source file not found: {source_path}")
+
+        try:
+            # 1-6. Orientation, rotation, straighten, crops, fit to max size (+ exposure)
+            img = self._render_source(source_path, exposure, rotation, straighten, scale)
+
+            # 7. Sharpen
+            if self.config["processing"]["sharpen"]:
+                img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
+
+            # 8. Watermark
+            img = self._apply_watermark(img)
+
+            # 9. Encode the primary JPEG (fixed quality, or searched for a byte/SSIM target)
+            data, encoding = jpeg_encoder.encode_jpeg(
+                img, jpeg_encoder.settings_from(self.config), self.config["processing"]["progressive"])
+            jpeg_options = encoding["save_options"]
+
+            # 10. Smaller sizes / WebP / AVIF from the same in-memory image.
+            # Written before the primary so watchers never see a photo without its renditions.
+            meta = None
+            settings = renditions.settings_from(self.config)
+            if settings["enabled"]:
+                meta = renditions.write_renditions(img, dest_path, data, settings, jpeg_options)
+
+            # Temp file + fsync + rename: the sync daemon and galleries never see a partial JPEG
+            durable_write.write_bytes(dest_path, data)
+
+            count = len(meta["renditions"]) if meta else 1
+            logger.info(f"Processed: {os.path.basename(source_path)} -> {dest_path} "
+                       f"(Exp:{exposure}, Rot:{rotation}, Str:{straighten}, Scale:{scale}, "
+                       f"{count} rendition(s), q{encoding['quality']} {len(data) // 1024}KB)")
+            return meta
+
+        except Exception as e:
+            logger.error(f"Processing failed for {source_path}: {e}")
+            raise e
+
+    def _render_source(self, source_path, exposure, rotation, straighten, scale):
+        """The source oriented, edited and fitted to max_size: from the cached proxy when there is one"""
+        max_size = self.config["max_size"]
+        processing = self.config["processing"]
+        if not processing.get("fused_pipeline", True):
+            with Image.open(source_path) as img:
+                return render_reference(img, exposure, rotation, straighten, scale, max_size)
+
+        cache = self.source_cache
+        proxy = cache.peek(source_path) if cache is not None else None
+        if proxy is not None:
+            plan = plan_geometry(proxy.source_size, proxy.orientation, rotation, straighten, scale, max_size)
+            if proxy.oversample(plan) >= 1.0:
+                # Frame already decoded by an earlier publish in this process: no disk read, no decode
+                img = render(proxy.image, plan)
+            else:
+                proxy = None  # Zoomed in past the proxy's resolution: decode the original
+
+        if proxy is None:
+            # One resample straight to output size; exposure on the small image
+            with Image.open(source_path) as img:
+                orientation = img.getexif().get(ORIENTATION_TAG, 1)
+                plan = plan_geometry(img.size, orientation, rotation, straighten, scale, max_size)
+                if cache is not None and cache.oversample(img, plan) >= 1.0:
+                    # Decided from the header: the proxy this decode builds is enough, keep it for republishes
+                    img = render(cache.put(source_path, img).image, plan)
+                else:
+                    if processing.get("draft_decode", True):
+                        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when the output is small enough
+                        reduction = draft_reduction(plan)
+                        if reduction > 1:
+                            img.draft(None, (math.ceil(img.width / reduction), math.ceil(img.height / reduction)))
+                    if img.mode != "RGB":
+                        img = img.convert("RGB")
+                    img = render(img, plan)
+
+        if exposure != 0.0:
+            img = ImageEnhance.Brightness(img).enhance(2 ** exposure)
+        return img
+
+    def render_preview(self, proxy, exposure: float = 0.0, rotation: int = 0,
+                       straighten: float = 0.0, scale: float = 1.0, width: int = 1024):
+        """
+        The publish pipeline (geometry, exposure, sharpen, watermark) applied to a
+        source_proxy.SourceProxy, at most `width` px on the long edge. Framing,
+        crops and watermark placement are those of process_image() at max_size,
+        scaled down; nothing is written.
+        """
+        plan = plan_geometry(proxy.source_size, proxy.orientation, rotation, straighten, scale,
+                             self.config["max_size"])
+        full_size = plan.output_size
+        if max(full_size) > width:
+            plan = plan.resized(fit_size(full_size[0], full_size[1], width))
+        ratio = plan.output_size[0] / full_size[0]
+
+        img = render(proxy.image, plan)
+        if exposure != 0.0:
+            img = ImageEnhance.Brightness(img).enhance(2 ** exposure)
+        if self.config["processing"]["sharpen"]:
+            img = img.filter(ImageFilter.UnsharpMask(radius=2 * ratio, percent=150, threshold=3))
+        return self._apply_watermark(img, full_size)
+
+    def _apply_watermark(self, img, full_size=None):
+        """full_size: the publish output size img stands in for (previews), default img.size"""
+        wm_conf = self.config['processing']['watermark']
+        if not wm_conf.get('enabled', False):
+            return img
+
+        full_size = tuple(full_size or img.size)
+        preview_width = img.width if full_size != img.size else None
+        tile = self._watermark_tile(*full_size, preview_width)
+        if tile is not None:
+            composite_region(img, *tile)
+        return img
+
+    def _watermark_tile(self, img_width, img_height, preview_width=None):
+        """
+        Ready-to-composite (RGBA tile, x, y) for this output size, or None.
+        preview_width: the publish-size tile and its placement shrunk for a
+        preview that wide. Output sizes cluster on a few dimensions, so tiles
+        are cached by (size, preview width, type, settings); load_assets()
+        clears the cache.
+        """
+        wm_conf = self.config['processing']['watermark']
+        settings_key = json.dumps(wm_conf, sort_keys=True, default=str)
+        key = (img_width, img_height, preview_width, wm_conf.get('type', 'image'),
+               hashlib.sha1(settings_key.encode('utf-8')).hexdigest())
+        with self._lock:
+            if key in self._watermark_cache:
+                self._watermark_cache.move_to_end(key)
+                return self._watermark_cache[key]
+
+            if preview_width is None:
+                tile = self._render_watermark(img_width, img_height)
+            else:
+                tile = self._watermark_tile(img_width, img_height)
+                if tile is not None:
+                    wm, x, y = tile
+                    ratio = preview_width / img_width
+                    wm = wm.resize((max(1, round(wm.width * ratio)), max(1, round(wm.height * ratio))),
+                                   Image.Resampling.LANCZOS)
+                    tile = (wm, round(x * ratio), round(y * ratio))
+            self._watermark_cache[key] = tile
+            while len(self._watermark_cache) > WATERMARK_CACHE_SIZE:
+                self._watermark_cache.popitem(last=False)
+            return tile
+
+    def _load_font(self, font_size):
+        """Resolve the text watermark font once per size"""
+        if font_size in self._font_cache:
+            return self._font_cache[font_size]
+        try:
+            # Try to load a font that supports Chinese characters
+            # macOS system fonts that support Chinese
+            font_paths = [
+                "/System/Library/Fonts/PingFang.ttc",  # PingFang (supports Chinese)
+                "/System/Library/Fonts/STHeiti Light.ttc",  # STHeiti (supports Chinese)
+                "/System/Library/Fonts/STHeiti Medium.ttc",
+                "/System/Library/Fonts/Helvetica.ttc",
+                "/System/Library/Fonts/Arial.ttf",
+            ]
+            font = None
+            for font_path in font_paths:
+                try:
+                    if font_path.endswith('.ttc'):
+                        # TTC files may contain multiple fonts, try index 0
+                        font = ImageFont.truetype(font_path, font_size, index=0)
+                        break
+                    else:
+                        font = ImageFont.truetype(font_path, font_size)
+                        break
+                except:
+                    continue
+            if font is None:
+                font = ImageFont.load_default()
+        except:
+            font = ImageFont.load_default()
+        self._font_cache[font_size] = font
+        return font
+
+    def _render_watermark(self, img_width, img_height):
+        wm_conf = self.config['processing']['watermark']
+        watermark_type = wm_conf.get('type', 'image')
+        margin = wm_conf.get('margin', 50)
+        position = wm_conf.get('position', 'bottom-right')
+
+        if watermark_type == 'text':
+            # Text watermark
+            text = wm_conf.get('text', '')
+            if not text:
+                return None
+
+            # Create text image
+            font_size = wm_conf.get('text_font_size', 24)
+            text_color = tuple(wm_conf.get('text_color', (255, 255, 255, 200)))
+            font = self._load_font(font_size)
+
+            # Create a temporary image to measure text size
+            temp_img = Image.new('RGBA', (1, 1))
+            temp_draw = ImageDraw.Draw(temp_img)
+            bbox = temp_draw.textbbox((0, 0), text, font=font)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+
+            # Create text image with background
+            text_img = Image.new('RGBA', (text_width + 20, text_height + 10), (0, 0, 0, 0))
+            text_draw = ImageDraw.Draw(text_img)
+            text_draw.text((10, 5), text, font=font, fill=text_color)
+
+            # Calculate position
+            x, y = self._calculate_watermark_position(img_width, img_height, text_width + 20, text_height + 10, position, margin)
+            return text_img, x, y
+
+        elif watermark_type == 'image' and self.watermark_img:
+            # Image watermark
+            wm = self.watermark_img
+
+            # Scale
+            scale = wm_conf.get('scale_percentage', 20) / 100
+            target_wm_width = int(min(img_width, img_height) * scale)
+            wm_ratio = target_wm_width / wm.width
+            new_wm_size = (int(wm.width * wm_ratio), int(wm.height * wm_ratio))
+            wm = wm.resize(new_wm_size, Image.Resampling.LANCZOS)
+
+            # Opacity
+            opacity = wm_conf.get('opacity', 0.8)
+            if opacity < 1.0:
+                alpha = wm.split()[3]
+                alpha = ImageEnhance.Brightness(alpha).enhance(opacity)
+                wm.putalpha(alpha)
+
+            # Calculate position
+            x, y = self._calculate_watermark_position(img_width, img_height, wm.width, wm.height, position, margin)
+            return wm, x, y
+
+        return None
+
+    def _calculate_watermark_position(self, img_width, img_height, wm_width, wm_height, position, margin):
+        """Calculate watermark position based on position string"""
+        if position == "bottom-right":
+            x = img_width - wm_width - margin
+            y = img_height - wm_height - margin
+        elif position == "bottom-left":
+            x = margin
+            y = img_height - wm_height - margin
+        elif position == "top-right":
+            x = img_width - wm_width - margin
+            y = margin
+        elif position == "top-left":
+            x = margin
+            y = margin
+        elif position == "center":
+            x = (img_width - wm_width) // 2
+            y = (img_height - wm_height) // 2
+        elif position == "top-center":
+            x = (img_width - wm_width) // 2
+            y = margin
+        elif position == "bottom-center":
+            x = (img_width - wm_width) // 2
+            y = img_height - wm_height - margin
+        else:
+            # Default to bottom-right
+            x = img_width - wm_width - margin
+            y = img_height - wm_height - margin
+        
+        # Safety bounds
+        x = max(0, min(x, img_width - wm_width))
+        y = max(0, min(y, img_height - wm_height))
+        
+        return x, y
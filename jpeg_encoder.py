@@ -0,0 +1,182 @@
+"""
+JPEG encoder with per-image quality search.
+
+A fixed quality makes busy stage shots huge and dark ballroom shots tiny.
+encode_jpeg() can instead:
+
+  mode "fixed"   encode once at `quality` (the original behaviour)
+  mode "size"    highest quality whose output fits `target_kb`
+  mode "ssim"    lowest quality whose output keeps SSIM >= `min_ssim`
+                 against the uncompressed image (optionally capped at max_kb)
+
+Both searches are a bounded binary search over [min_quality, max_quality]
+(at most ~log2(range) encodes, each memoized). Chroma subsampling and Huffman
+table optimization are explicit settings.
+
+SSIM is computed on luma with 8x8 non-overlapping windows (Pillow only, no
+numpy); it tracks the usual Gaussian-window SSIM closely enough to rank
+qualities.
+"""
+
+import io
+import logging
+from PIL import Image, ImageMath
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "mode": "fixed",         # "fixed" | "size" | "ssim"
+    "quality": None,         # Fixed quality (None = config jpeg_quality)
+    "target_kb": 400,        # Byte budget for mode "size"
+    "min_ssim": 0.985,       # Perceptual floor for mode "ssim"
+    "max_kb": None,          # Optional hard cap for mode "ssim" (wins over min_ssim)
+    "min_quality": 60,
+    "max_quality": 92,
+    "subsampling": "4:2:0",  # "4:4:4" | "4:2:2" | "4:2:0" | "auto" (Pillow default)
+    "optimize": True,        # Optimized Huffman tables (smaller, slightly slower)
+}
+
+SUBSAMPLING = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}
+
+SSIM_WINDOW = 8
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def settings_from(config) -> dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get("jpeg_encoder") or {})
+    if settings["quality"] is None:
+        settings["quality"] = config.get("jpeg_quality", 85)
+    return settings
+
+
+def _lambda(fn, **images):
+    # ImageMath.lambda_eval is Pillow >= 10.3; older versions only have the string form
+    if hasattr(ImageMath, "lambda_eval"):
+        return ImageMath.lambda_eval(lambda a: fn(*(a[k] for k in images)), **images)
+    args = ", ".join(images)
+    return ImageMath.eval(f"fn({args})", fn=fn, **images)
+
+
+class SSIMReference:
+    """Block statistics of the uncompressed image, computed once per search"""
+
+    def __init__(self, img):
+        self.size = img.size
+        self.x = img.convert("L").convert("F")
+        self.mu_x = self.x.reduce(SSIM_WINDOW)
+        self.var_x = _lambda(lambda sq, mu: sq - mu * mu,
+                             sq=_lambda(lambda x: x * x, x=self.x).reduce(SSIM_WINDOW), mu=self.mu_x)
+
+    def score(self, jpeg_bytes) -> float:
+        with Image.open(io.BytesIO(jpeg_bytes)) as decoded:
+            y = decoded.convert("L").convert("F")
+        mu_y = y.reduce(SSIM_WINDOW)
+        var_y = _lambda(lambda sq, mu: sq - mu * mu, sq=_lambda(lambda v: v * v, v=y).reduce(SSIM_WINDOW), mu=mu_y)
+        cov = _lambda(lambda xy, mx, my: xy - mx * my,
+                      xy=_lambda(lambda a, b: a * b, a=self.x, b=y).reduce(SSIM_WINDOW), mx=self.mu_x, my=mu_y)
+        ssim_map = _lambda(
+            lambda mx, my, vx, vy, c: ((mx * my * 2 + _C1) * (c * 2 + _C2)) /
+                                      ((mx * mx + my * my + _C1) * (vx + vy + _C2)),
+            mx=self.mu_x, my=mu_y, vx=self.var_x, vy=var_y, c=cov)
+        # Mean of the map (ImageStat bins float images into a 256-level histogram, so average with a BOX resize)
+        return ssim_map.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+
+
+def ssim(a, b_jpeg_bytes) -> float:
+    """SSIM of an encoded JPEG against the image it was encoded from"""
+    return SSIMReference(a).score(b_jpeg_bytes)
+
+
+def save_jpeg(img, **options) -> bytes:
+    """img encoded as JPEG bytes"""
+    buf = io.BytesIO()
+    try:
+        img.save(buf, "JPEG", **options)
+    except OSError:
+        if not (options.get("optimize") or options.get("progressive")):
+            raise
+        # Pillow gives libjpeg a w*h byte buffer for optimized/progressive output;
+        # frames that compress to more than 1 byte/pixel (noise at high quality or
+        # 4:4:4) overflow it. Fall back to a streamed baseline encode.
+        logger.warning(f"JPEG over {img.width}x{img.height} bytes, saving as baseline without optimization")
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", **dict(options, optimize=False, progressive=False))
+    return buf.getvalue()
+
+
+def _save_options(settings, progressive):
+    options = {"optimize": bool(settings["optimize"]), "progressive": bool(progressive)}
+    if settings["subsampling"] in SUBSAMPLING:
+        options["subsampling"] = SUBSAMPLING[settings["subsampling"]]
+    return options
+
+
+def _highest_fitting(encode, lo, hi, budget):
+    """Highest quality in [lo, hi] whose output fits budget bytes (lo if nothing does)"""
+    best = lo
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if len(encode(mid)) <= budget:
+            best, lo = mid, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def encode_jpeg(img, settings: dict, progressive: bool = True):
+    """
+    Encode img according to settings (see DEFAULT_SETTINGS).
+    Returns (jpeg bytes, info) where info has quality, bytes, encodes and ssim
+    (ssim only when it was measured), plus save_options for encoding related
+    images (renditions) the same way.
+    """
+    options = _save_options(settings, progressive)
+    encoded = {}
+
+    def encode(quality):
+        if quality not in encoded:
+            encoded[quality] = save_jpeg(img, quality=quality, **options)
+        return encoded[quality]
+
+    probes = {}
+
+    def probe(quality):
+        # Huffman optimization and progressive scans are lossless, so SSIM only
+        # depends on quality/subsampling: score fast baseline encodes
+        if quality not in probes:
+            probes[quality] = save_jpeg(img, quality=quality, subsampling=options.get("subsampling", -1))
+        return probes[quality]
+
+    mode = settings["mode"]
+    lo, hi = int(settings["min_quality"]), int(settings["max_quality"])
+    info = {"mode": mode}
+
+    if mode == "size" and settings.get("target_kb"):
+        quality = _highest_fitting(encode, lo, hi, int(settings["target_kb"] * 1024))
+    elif mode == "ssim":
+        # Lowest quality that still meets the SSIM floor (max_quality if none does)
+        reference = SSIMReference(img)
+        scores = {}
+        best = hi
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            scores[mid] = reference.score(probe(mid))
+            if scores[mid] >= settings["min_ssim"]:
+                best, hi = mid, mid - 1
+            else:
+                lo = mid + 1
+        quality = best
+        budget = int(settings["max_kb"] * 1024) if settings.get("max_kb") else None
+        if budget and len(encode(quality)) > budget:
+            # Byte budget wins over the perceptual floor
+            quality = _highest_fitting(encode, int(settings["min_quality"]), quality - 1, budget)
+        info["ssim"] = round(scores.get(quality) or reference.score(probe(quality)), 5)
+    else:
+        quality = int(settings["quality"])
+
+    data = encode(quality)
+    info.update(quality=quality, bytes=len(data), encodes=len(encoded) + len(probes),
+                save_options=dict(options, quality=quality))
+    return data, info
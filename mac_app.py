@@ -10,6 +10,7 @@ import threading
 import webbrowser
 import subprocess
 import signal
+import multiprocessing
 from pathlib import Path
 
 # Determine the base path (for PyInstaller bundled app)
@@ -138,4 +139,6 @@ class LiveEventApp(rumps.App):
 
 
 if __name__ == "__main__":
+    # Required for the publish worker pool (spawned processes) in the frozen app
+    multiprocessing.freeze_support()
     LiveEventApp().run()
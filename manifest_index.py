@@ -0,0 +1,199 @@
+"""
+In-memory index of published photos (the web folder).
+
+Loaded once at startup, then updated incrementally on publish/unpublish so
+neither manifest.json nor /api/live needs to rescan and re-verify the whole
+folder. Entries are kept sorted by publish time (file mtime).
+
+write_manifest() also emits the versioned head/delta/chunk files described in
+manifest_versions.py; their state is kept in a hidden file in the web folder
+so versions stay monotonic across restarts. Each entry carries the photo's
+renditions sidecar (renditions.py), read once when the file is indexed.
+"""
+
+import os
+import bisect
+import logging
+import threading
+from PIL import Image
+
+import manifest_versions
+import renditions
+import durable_write
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = manifest_versions.LEGACY_NAME
+MANIFEST_STATE_NAME = ".manifest-state.json"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def is_publishable_name(filename: str) -> bool:
+    # Skip macOS hidden files (._ prefix), .DS_Store, and manifest.json
+    if filename.startswith('.') or filename == MANIFEST_NAME:
+        return False
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class ManifestIndex:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.RLock()
+        self._entries = {}  # filename -> {"filename", "mtime", "size", "renditions" (sidecar or None)}
+        self._order = []    # sorted list of (mtime, filename), oldest first
+        self._rejected = {}  # filename -> (mtime, size) of files that failed validation
+        self._manifest_state = None  # manifest_versions state, loaded on first write
+
+    def load(self):
+        """Full scan of the web folder (startup / folder change only)"""
+        with self._lock:
+            self._entries.clear()
+            self._order.clear()
+            self._rejected.clear()
+            if not os.path.exists(self.folder):
+                logger.warning(f"Web folder does not exist: {self.folder}")
+                return
+            for f in os.listdir(self.folder):
+                if is_publishable_name(f):
+                    self.add(f, verify=True)
+            logger.info(f"Manifest index loaded: {len(self._entries)} photos")
+
+    def set_folder(self, folder: str):
+        with self._lock:
+            self.folder = folder
+            self._manifest_state = None
+            self.load()
+
+    def _check_file(self, filename: str, verify: bool):
+        """Return the index entry for a file, or None if it is missing/empty/invalid"""
+        file_path = os.path.join(self.folder, filename)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if not os.path.isfile(file_path) or stat.st_size == 0:
+            logger.warning(f"Skipping empty or non-regular file: {filename}")
+            return None
+        if verify:
+            try:
+                with Image.open(file_path) as img:
+                    img.verify()
+            except Exception as img_error:
+                logger.warning(f"Skipping invalid image file: {filename} ({img_error})")
+                return None
+        return {"filename": filename, "mtime": stat.st_mtime, "size": stat.st_size,
+                "renditions": renditions.load_sidecar(self.folder, filename)}
+
+    def add(self, filename: str, verify: bool = True) -> bool:
+        """Add (or refresh) one published file. verify=False if the caller already validated it."""
+        entry = self._check_file(filename, verify)
+        with self._lock:
+            self._discard_locked(filename)
+            if entry is None:
+                try:
+                    stat = os.stat(os.path.join(self.folder, filename))
+                    self._rejected[filename] = (stat.st_mtime, stat.st_size)
+                except OSError:
+                    pass
+                return False
+            self._rejected.pop(filename, None)
+            self._entries[filename] = entry
+            bisect.insort(self._order, (entry["mtime"], filename))
+            return True
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._discard_locked(filename)
+
+    def _discard_locked(self, filename: str):
+        entry = self._entries.pop(filename, None)
+        if entry is None:
+            return
+        key = (entry["mtime"], filename)
+        i = bisect.bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+
+    def reconcile(self):
+        """
+        Cheap consistency check against the folder (one listdir, no per-file opens
+        for files we already know). Picks up files written by other tools.
+        """
+        with self._lock:
+            try:
+                on_disk = {f for f in os.listdir(self.folder) if is_publishable_name(f)}
+            except OSError:
+                return
+            known = set(self._entries)
+            for f in known - on_disk:
+                self._discard_locked(f)
+            for f in on_disk - known:
+                if f in self._rejected:
+                    # Don't re-verify a broken file until it changes
+                    try:
+                        stat = os.stat(os.path.join(self.folder, f))
+                    except OSError:
+                        continue
+                    if self._rejected[f] == (stat.st_mtime, stat.st_size):
+                        continue
+                self.add(f, verify=True)
+            for f in set(self._rejected) - on_disk:
+                del self._rejected[f]
+
+    def entries(self):
+        """Entries sorted newest first"""
+        with self._lock:
+            return [self._entries[f] for _, f in reversed(self._order)]
+
+    def filenames(self):
+        with self._lock:
+            return [f for _, f in reversed(self._order)]
+
+    def get(self, filename: str):
+        with self._lock:
+            return self._entries.get(filename)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _write_file(self, relative_name: str, data: bytes):
+        """Write one file atomically (durable_write: temp, fsync, rename)"""
+        path = os.path.join(self.folder, relative_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        durable_write.write_bytes(path, data)
+
+    def _load_manifest_state(self):
+        try:
+            with open(os.path.join(self.folder, MANIFEST_STATE_NAME), 'r', encoding='utf-8') as f:
+                return manifest_versions.load_state(f.read())
+        except OSError:
+            return manifest_versions.empty_state()
+
+    def write_manifest(self):
+        """
+        Write manifest.json plus the versioned head/delta/chunk files.
+        Unchanged chunks are left alone; chunks retired two versions ago are deleted.
+        """
+        with self._lock:
+            # Publish callbacks run in threads: snapshot and write under one lock so versions stay in order
+            entries = self.entries()
+            files = [e["filename"] for e in entries]
+            previous = self._manifest_state or self._load_manifest_state()
+            state = manifest_versions.next_state(
+                previous, [renditions.manifest_entry(e["filename"], e["renditions"]) for e in entries])
+            if state is previous and os.path.exists(os.path.join(self.folder, manifest_versions.HEAD_NAME)):
+                return files
+            for name, data in manifest_versions.render_files(state):
+                if name.startswith(manifest_versions.CHUNK_DIR + "/") and \
+                        os.path.exists(os.path.join(self.folder, name)):
+                    continue  # Content-addressed: already written
+                self._write_file(name, data)
+            self._write_file(MANIFEST_STATE_NAME, manifest_versions.dump_state(state).encode('utf-8'))
+            for name in previous["retired"]:
+                if name not in state["chunks"]:
+                    try:
+                        os.remove(os.path.join(self.folder, name))
+                    except OSError:
+                        pass
+            self._manifest_state = state
+        return files
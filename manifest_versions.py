@@ -0,0 +1,157 @@
+"""
+Versioned, paginated manifest format for the public gallery.
+
+Next to the legacy manifest.json (full filename list) the publish pipeline
+writes:
+
+  manifest-head.json            tiny, polled by guests:
+                                {"version", "total", "delta_from", "chunks": [...]}
+  manifest-delta.json           recent changes: {"version", "delta_from",
+                                "changes": [{"v", "add": [entries], "remove": [names],
+                                             "insert": [[index, entry], ...]}]}
+  manifest-chunks/<i>-<hash>.json
+                                immutable pages of the full list of entries
+                                (content-addressed, so they can be cached forever)
+
+An entry is {"name"} plus, for photos published with renditions, "v" (hash
+of the primary JPEG, requested as <name>?v=<v>), "width", "height" and
+"renditions": [{"src", "width", "height", "type", "bytes"}]
+(see renditions.manifest_entry()).
+
+A client at version c polls the head; if it is unchanged nothing else is
+fetched. If c >= delta_from it applies the changes with v > c from the delta
+file, otherwise it reloads the chunks listed in the head (newest chunk first).
+A change drops the removed names, prepends "add", then (if present) splices
+each "insert" entry in at its index of the new list, in ascending order:
+photos uploaded out of publish order (a backlog drained newest first) land
+between older entries without resetting the change log.
+
+State (version, entry list, change log, chunk names) is a plain dict so the
+local web folder and the R2 ledger can persist it however they like.
+"""
+
+import json
+import hashlib
+
+LEGACY_NAME = "manifest.json"
+HEAD_NAME = "manifest-head.json"
+DELTA_NAME = "manifest-delta.json"
+CHUNK_DIR = "manifest-chunks"
+
+CHUNK_SIZE = 200          # Photos per chunk, counted from the oldest photo
+MAX_DELTA_VERSIONS = 50   # Versions kept in the delta file before clients must reload
+
+
+def empty_state():
+    return {"version": 0, "delta_from": 0, "photos": [], "changes": [], "chunks": [], "retired": []}
+
+
+def _dumps(data, indent=None):
+    return json.dumps(data, ensure_ascii=False, indent=indent, separators=None if indent else (",", ":"))
+
+
+def as_entry(photo):
+    """Accept bare filenames (legacy state / callers without metadata)"""
+    return {"name": photo} if isinstance(photo, str) else photo
+
+
+def next_state(state, photos):
+    """
+    Return the state for a new entry list (newest first). The version only
+    moves when the list actually changed; additions (at the top or in between)
+    and removals are recorded in the change log, anything else (reordering,
+    changed metadata) resets it.
+    """
+    state = state or empty_state()
+    photos = [as_entry(p) for p in photos]
+    previous = state["photos"]
+    if photos == previous and state["version"] > 0:
+        return state
+
+    version = state["version"] + 1
+    previous_names = {p["name"] for p in previous}
+    current_names = {p["name"] for p in photos}
+    kept = [p for p in previous if p["name"] in current_names]
+    removed = [p["name"] for p in previous if p["name"] not in current_names]
+    changes = list(state["changes"])
+    delta_from = state["delta_from"]
+
+    if state["version"] > 0 and [p for p in photos if p["name"] in previous_names] == kept:
+        # Leading new entries are a plain prepend; later ones are inserted at their final index
+        head = 0
+        while head < len(photos) and photos[head]["name"] not in previous_names:
+            head += 1
+        change = {"v": version, "add": photos[:head], "remove": removed}
+        inserts = [[i, p] for i, p in enumerate(photos) if i >= head and p["name"] not in previous_names]
+        if inserts:
+            change["insert"] = inserts
+        changes.append(change)
+        while len(changes) > MAX_DELTA_VERSIONS:
+            delta_from = changes.pop(0)["v"]
+    else:
+        changes = []
+        delta_from = version
+
+    chunks = [name for name, _ in render_chunks(photos)]
+    retired = [c for c in state["chunks"] if c not in set(chunks)]
+    return {
+        "version": version,
+        "delta_from": delta_from,
+        "photos": photos,
+        "changes": changes,
+        "chunks": chunks,
+        "retired": retired,
+    }
+
+
+def render_chunks(photos):
+    """[(relative_name, bytes)] newest chunk first; chunk i holds photos [i*CHUNK_SIZE, ...) counted from the oldest"""
+    oldest_first = list(reversed(photos))
+    chunks = []
+    for i in range(0, len(oldest_first), CHUNK_SIZE):
+        page = list(reversed(oldest_first[i:i + CHUNK_SIZE]))
+        data = _dumps(page).encode("utf-8")
+        digest = hashlib.sha1(data).hexdigest()[:10]
+        chunks.append((f"{CHUNK_DIR}/{i // CHUNK_SIZE}-{digest}.json", data))
+    chunks.reverse()
+    return chunks
+
+
+def render_files(state):
+    """
+    All manifest files for a state as [(relative_name, bytes)], in safe
+    upload order: chunks first, then the delta, the head, and the legacy list,
+    so a head never points at a chunk that isn't there yet.
+    """
+    files = render_chunks(state["photos"])
+    files.append((DELTA_NAME, _dumps({
+        "version": state["version"],
+        "delta_from": state["delta_from"],
+        "changes": state["changes"],
+    }).encode("utf-8")))
+    files.append((HEAD_NAME, _dumps({
+        "version": state["version"],
+        "total": len(state["photos"]),
+        "delta_from": state["delta_from"],
+        "chunks": state["chunks"],
+    }).encode("utf-8")))
+    files.append((LEGACY_NAME, _dumps([p["name"] for p in state["photos"]], indent=2).encode("utf-8")))
+    return files
+
+
+def load_state(data):
+    """Parse a persisted state blob, falling back to an empty state"""
+    try:
+        state = json.loads(data) if data else None
+    except ValueError:
+        state = None
+    if not isinstance(state, dict) or "version" not in state:
+        return empty_state()
+    base = empty_state()
+    base.update(state)
+    base["photos"] = [as_entry(p) for p in base["photos"]]
+    return base
+
+
+def dump_state(state):
+    return _dumps(state)
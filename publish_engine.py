@@ -0,0 +1,338 @@
+"""
+Publish executor: runs ImageProcessor jobs in a pool of warm worker processes
+so decoding/encoding never blocks the FastAPI event loop.
+
+Each worker builds its own ImageProcessor once (watermark asset preloaded) and
+only rebuilds it when the engine's config generation changes, e.g. after the
+watermark settings are edited. Each worker also keeps decoded proxies of the
+frames it published recently (source_proxy.py), so republishing a frame with
+another crop or exposure skips the decode. Every worker is its own
+single-process pool and jobs for a source go back to the worker that
+published it last, so a republish finds its proxy and no frame is cached
+twice; source_cache_mb is split evenly between the workers.
+"""
+
+import os
+import uuid
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from image_processor import ImageProcessor
+from renditions import remove_renditions
+from source_proxy import ProxyCache
+
+logger = logging.getLogger(__name__)
+
+# How many finished jobs / batches to remember for status lookups
+MAX_TRACKED_JOBS = 500
+MAX_TRACKED_BATCHES = 50
+# Source -> worker assignments remembered for cache affinity
+MAX_TRACKED_SOURCES = 1000
+
+# --- Worker process side ---
+_worker_processor = None
+_worker_generation = None
+_worker_sources = None  # Decoded source proxies; survives processor rebuilds
+_worker_cache_share = 1.0  # This worker's fraction of source_cache_mb
+
+
+def _source_cache(config):
+    """This worker's proxy cache (its share of source_cache_mb), or None when source_cache_mb is 0"""
+    global _worker_sources
+    max_bytes = int(config.get("source_cache_mb", 0) * _worker_cache_share * 1024 * 1024)
+    # Decode at a DCT scale that keeps >= 1.5x max_size, like draft decoding does, and keep that
+    # decode as is: a bound of 3x max_size means JPEG proxies never need a resample of their own
+    proxy_size = 3 * config["max_size"]
+    if max_bytes <= 0:
+        _worker_sources = None
+    elif _worker_sources is None or _worker_sources.max_size != proxy_size:
+        _worker_sources = ProxyCache(proxy_size, max_bytes, min_size=int(config["max_size"] * 1.5))
+    else:
+        _worker_sources.max_bytes = max_bytes
+    return _worker_sources
+
+
+def _init_worker(config, generation, cache_share=1.0):
+    """Pool initializer: load the processor (and its watermark) once per worker"""
+    global _worker_processor, _worker_generation, _worker_cache_share
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    _worker_cache_share = cache_share
+    _worker_processor = ImageProcessor(config, _source_cache(config))
+    _worker_generation = generation
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _run_publish(config, generation, source_path, dest_path, edits):
+    """Process one image inside a worker; returns the output size in bytes"""
+    global _worker_processor, _worker_generation
+    if _worker_processor is None or generation != _worker_generation:
+        _worker_processor = ImageProcessor(config, _source_cache(config))
+        _worker_generation = generation
+
+    # process_image() writes through durable_write (temp, fsync, rename): if it
+    # returns, dest_path is the complete JPEG, so no re-read/verify is needed
+    try:
+        _worker_processor.process_image(source_path, dest_path, **edits)
+    except Exception:
+        # Renditions are written first; don't leave them behind without their primary
+        if not os.path.exists(dest_path):
+            remove_renditions(os.path.dirname(dest_path), os.path.basename(dest_path))
+        raise
+    return os.path.getsize(dest_path)
+
+
+# --- Server side ---
+class PublishEngine:
+    def __init__(self, config, workers: int = 0):
+        self.config = config
+        self.workers = workers if workers > 0 else max(1, (os.cpu_count() or 2) - 1)
+        self.generation = 0
+        self.jobs = OrderedDict()  # job_id -> job dict (oldest first)
+        self.reserved = set()      # Output filenames claimed by queued/running jobs
+        self.batches = OrderedDict()  # batch_id -> batch dict (oldest first)
+        self._tasks = {}           # job_id -> asyncio.Task while the job is in flight
+        self._batch_events = {}    # batch_id -> list of progress events (replayed to late subscribers)
+        self._batch_conditions = {}  # batch_id -> asyncio.Condition signalled on each new event
+        self._executors = []       # One single-process pool per worker, so jobs can be routed to a worker
+        self._load = []            # Queued + running jobs per worker
+        self._homes = OrderedDict()  # source path -> worker that last published it (least recent first)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.config, self.generation, 1 / self.workers),
+        )
+
+    def start(self):
+        """Create the workers and force every one to spawn (and load assets) now"""
+        if self._executors:
+            return
+        self._executors = [self._new_executor() for _ in range(self.workers)]
+        self._load = [0] * self.workers
+        for executor in self._executors:
+            executor.submit(_warm_up)
+        logger.info(f"Publish engine started with {self.workers} worker(s)")
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+        self._homes.clear()
+
+    def _assign(self, source_path: str) -> int:
+        """
+        Worker for a job: the one that last published this source (its proxy is cached there),
+        else the least busy, spreading new sources evenly so every worker's cache share is used
+        """
+        worker = self._homes.pop(source_path, None)
+        if worker is None:
+            sources = Counter(self._homes.values())
+            worker = min(range(self.workers), key=lambda i: (self._load[i], sources[i]))
+        self._homes[source_path] = worker
+        while len(self._homes) > MAX_TRACKED_SOURCES:
+            self._homes.popitem(last=False)
+        self._load[worker] += 1
+        return worker
+
+    def reload(self):
+        """Config or assets changed: workers rebuild their processor on the next job"""
+        self.generation += 1
+
+    def submit(self, source_path: str, dest_path: str, edits: dict, on_done=None) -> dict:
+        """
+        Queue a publish job and return its status dict immediately.
+        on_done(job) runs in a thread (it writes history and manifest files) after a successful render;
+        the job is already "done" then, and an on_done error is only logged and kept in job["error"].
+        Must be called from within the running event loop.
+        """
+        self.start()
+        job_id = uuid.uuid4().hex[:12]
+        dest_filename = os.path.basename(dest_path)
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "source": os.path.basename(source_path),
+            "published_as": dest_filename,
+            "edits": edits,
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "size_kb": None,
+            "error": None,
+        }
+        self.jobs[job_id] = job
+        self.reserved.add(dest_filename)
+        self._trim_jobs()
+        worker = self._assign(source_path)
+        task = asyncio.get_running_loop().create_task(self._run(job, worker, source_path, dest_path, on_done))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job
+
+    def submit_batch(self, items, on_batch_done=None) -> dict:
+        """
+        Queue several publish jobs at once; they fan out across all workers.
+        items: list of (source_path, dest_path, edits)
+        on_batch_done(batch, jobs) runs once, in a thread, when every
+        job has finished, so history/manifest can be written a single time.
+        """
+        batch_id = uuid.uuid4().hex[:12]
+        jobs = [self.submit(source_path, dest_path, edits) for source_path, dest_path, edits in items]
+        batch = {
+            "id": batch_id,
+            "status": "running",
+            "total": len(jobs),
+            "done": 0,
+            "failed": 0,
+            "job_ids": [job["id"] for job in jobs],
+            "submitted_at": time.time(),
+            "finished_at": None,
+        }
+        self.batches[batch_id] = batch
+        self._batch_events[batch_id] = []
+        self._batch_conditions[batch_id] = asyncio.Condition()
+        self._trim_batches()
+        asyncio.get_running_loop().create_task(self._run_batch(batch, jobs, on_batch_done))
+        return batch
+
+    async def _run_batch(self, batch, jobs, on_batch_done):
+        async def track(job):
+            task = self._tasks.get(job["id"])
+            if task is not None:
+                await task
+            if job["status"] == "done":
+                batch["done"] += 1
+            else:
+                batch["failed"] += 1
+            await self._emit(batch["id"], "item", {
+                "job_id": job["id"],
+                "source": job["source"],
+                "published_as": job["published_as"],
+                "status": job["status"],
+                "size_kb": job["size_kb"],
+                "error": job["error"],
+                "done": batch["done"],
+                "failed": batch["failed"],
+                "total": batch["total"],
+            })
+
+        await asyncio.gather(*(track(job) for job in jobs))
+        if on_batch_done:
+            try:
+                # History, manifest index and manifest files are fsync'd writes: keep them off the loop
+                await asyncio.to_thread(on_batch_done, batch, jobs)
+            except Exception as e:
+                logger.error(f"Batch {batch['id']} finalize failed: {e}")
+        batch["status"] = "completed"
+        batch["finished_at"] = time.time()
+        logger.info(f"📦 Batch {batch['id']}: {batch['done']}/{batch['total']} published, {batch['failed']} failed")
+        await self._emit(batch["id"], "complete", dict(batch))
+
+    async def _emit(self, batch_id, event_type, data):
+        events = self._batch_events.get(batch_id)
+        if events is None:
+            return
+        events.append({"event": event_type, "data": data})
+        condition = self._batch_conditions[batch_id]
+        async with condition:
+            condition.notify_all()
+
+    async def batch_events(self, batch_id):
+        """
+        Async iterator of progress events for a batch, starting from the first one,
+        ending with 'complete'. A batch dropped from tracking (_trim_batches) while
+        a client is subscribed ends the stream with a 'complete' event carrying its
+        last known state.
+        """
+        batch = self.batches.get(batch_id)
+        events = self._batch_events.get(batch_id)
+        condition = self._batch_conditions.get(batch_id)
+        if batch is None or events is None or condition is None:
+            return
+        index = 0
+        while True:
+            while index < len(events):
+                event = events[index]
+                index += 1
+                yield event
+                if event["event"] == "complete":
+                    return
+            if batch["status"] == "completed" or self.batches.get(batch_id) is not batch:
+                yield {"event": "complete", "data": dict(batch)}
+                return
+            async with condition:
+                if index >= len(events):
+                    await condition.wait()
+
+    async def _run(self, job, worker, source_path, dest_path, on_done):
+        loop = asyncio.get_running_loop()
+        executor = self._executors[worker]
+        job["status"] = "processing"
+        try:
+            file_size = await loop.run_in_executor(
+                executor, _run_publish,
+                self.config, self.generation, source_path, dest_path, job["edits"]
+            )
+            job["size_kb"] = round(file_size / 1024, 1)
+            # The JPEG and its renditions are durably on disk and will sync: the publish is done even if
+            # the bookkeeping below fails, so a client retry doesn't create a duplicate _002
+            job["status"] = "done"
+            logger.info(f"   ✅ Job {job['id']}: {job['published_as']} ({job['size_kb']}KB)")
+            if on_done:
+                try:
+                    await asyncio.to_thread(on_done, job)
+                except Exception as e:
+                    job["error"] = f"Published, but recording it failed: {e}"
+                    logger.error(f"   ⚠️ Job {job['id']}: {job['published_as']} published, finalize failed: {e}")
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); start a fresh one for later jobs
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"   ❌ Job {job['id']} failed, restarting worker {worker + 1}: {e}")
+            if self._executors and self._executors[worker] is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executors[worker] = self._new_executor()
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"   ❌ Job {job['id']} failed ({job['source']}): {e}")
+        finally:
+            job["finished_at"] = time.time()
+            self.reserved.discard(job["published_as"])
+            if worker < len(self._load):
+                self._load[worker] = max(0, self._load[worker] - 1)
+
+    def _trim_jobs(self):
+        while len(self.jobs) > MAX_TRACKED_JOBS:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest["status"] in ("queued", "processing"):
+                break
+            self.jobs.popitem(last=False)
+
+    def _trim_batches(self):
+        while len(self.batches) > MAX_TRACKED_BATCHES:
+            oldest_id, oldest = next(iter(self.batches.items()))
+            if oldest["status"] != "completed":
+                break
+            self.batches.popitem(last=False)
+            self._batch_events.pop(oldest_id, None)
+            self._batch_conditions.pop(oldest_id, None)
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def get_batch(self, batch_id: str):
+        return self.batches.get(batch_id)
+
+    def stats(self):
+        active = sum(1 for j in self.jobs.values() if j["status"] in ("queued", "processing"))
+        return {"workers": self.workers, "active_jobs": active, "tracked_jobs": len(self.jobs)}
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+R2 上傳帳本 - Live Event Photography
+
+在本機記錄已上傳到 R2 的物件 (名稱、大小、ETag、上傳時間)，
+讓 manifest 可以直接在本機產生，不必每次都 rclone lsl 列出遠端。
+只有定期的 reconcile() 才會拿遠端列表來校正帳本。
+
+sync_to_r2.py、server.py、r2_manage.py 共用同一個 SQLite (WAL) 檔案。
+分頁/增量 manifest (manifest_versions.py) 的版本狀態也存在這裡，
+所以不論由哪個程式更新，版本號都會持續遞增。
+照片的響應式縮圖 (renditions/ 底下的 WebP/AVIF/小尺寸 JPEG) 也記在帳本裡，
+主檔的 meta 欄位存放 renditions 側檔 (尺寸、格式、位元組數)，manifest 直接由此產生。
+
+帳本同時是上傳日誌：
+  - 每個物件記下上傳時的內容 SHA-256 與本機 mtime，同名但內容不同的檔案會重傳，
+    內容相同 (只是被 touch / 重新匯出) 的則略過；mtime 沒變就不必重新計算雜湊
+  - 大檔分段上傳的 UploadId 記在 multipart 表，程式中斷重啟後從 R2 已收到的分段續傳
+因為帳本在本機持久保存，同步腳本啟動時不需要先列出整個遠端。
+"""
+
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+
+import manifest_versions
+import renditions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEDGER_PATH = Path(__file__).parent / "r2_ledger.db"
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """檔案內容的 SHA-256 (hex)"""
+    return _file_digest(path, hashlib.sha256(), chunk_size)
+
+
+def file_md5(path, chunk_size=1024 * 1024):
+    """檔案內容的 MD5 (hex)；非分段上傳的 S3/R2 物件 ETag 就是內容的 MD5"""
+    return _file_digest(path, hashlib.md5(), chunk_size)
+
+
+def _file_digest(path, digest, chunk_size):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_photo_object(name):
+    """只算這一層的照片；renditions/ 等子資料夾裡的是衍生檔"""
+    return not name.startswith('.') and "/" not in name and Path(name).suffix.lower() in PHOTO_EXTENSIONS
+
+
+class UploadLedger:
+    def __init__(self, prefix, db_path=DEFAULT_LEDGER_PATH):
+        self.prefix = prefix
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " prefix TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " size INTEGER,"
+            " etag TEXT,"
+            " uploaded_at REAL NOT NULL,"
+            " meta TEXT,"
+            " PRIMARY KEY (prefix, name))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(objects)")}
+        for column, kind in (("meta", "TEXT"), ("sha256", "TEXT"), ("mtime_ns", "INTEGER")):
+            if column not in columns:  # 舊版帳本
+                self._conn.execute(f"ALTER TABLE objects ADD COLUMN {column} {kind}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest_state (prefix TEXT PRIMARY KEY, state TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS multipart ("
+            " prefix TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " upload_id TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " part_size INTEGER NOT NULL,"
+            " started_at REAL NOT NULL,"
+            " PRIMARY KEY (prefix, name))"
+        )
+
+    def _write(self, sql, rows):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def record_uploads(self, results, uploaded_at=None):
+        """
+        results: 上傳後端回傳的 [{"name", "size", "etag"}, ...]；照片主檔可附 "meta" (renditions 側檔)，
+        同步腳本另附上傳前的 "sha256" 與 "mtime_ns"。沒附內容雜湊的 (例如以遠端列表校正) 在大小不變時保留舊值
+        uploaded_at 決定 manifest 順序：同步腳本傳入照片的發布時間 (主檔 mtime)，不是實際傳完的時間
+        """
+        uploaded_at = uploaded_at or time.time()
+        self._write(
+            "INSERT INTO objects (prefix, name, size, etag, uploaded_at, meta, sha256, mtime_ns) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(prefix, name) DO UPDATE SET "
+            " sha256 = CASE WHEN excluded.size IS objects.size"
+            "   THEN COALESCE(excluded.sha256, objects.sha256) ELSE excluded.sha256 END,"
+            " mtime_ns = CASE WHEN excluded.size IS objects.size"
+            "   THEN COALESCE(excluded.mtime_ns, objects.mtime_ns) ELSE excluded.mtime_ns END,"
+            " size = excluded.size, etag = excluded.etag, uploaded_at = excluded.uploaded_at,"
+            " meta = COALESCE(excluded.meta, objects.meta)",
+            [(self.prefix, r["name"], r.get("size"), r.get("etag"), uploaded_at,
+              json.dumps(r["meta"], ensure_ascii=False) if r.get("meta") else None,
+              r.get("sha256"), r.get("mtime_ns")) for r in results]
+        )
+
+    def fingerprint(self, name):
+        """上傳時記下的 {"size", "etag", "sha256", "mtime_ns"}，不在帳本則為 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, etag, sha256, mtime_ns FROM objects WHERE prefix = ? AND name = ?", (self.prefix, name)
+            ).fetchone()
+        return dict(zip(("size", "etag", "sha256", "mtime_ns"), row)) if row else None
+
+    def record_local_fingerprint(self, name, mtime_ns, sha256=None):
+        """本機檔案內容與 R2 相同 (只是被 touch / 重新匯出)：記下新的 mtime (與雜湊)，下次不必再計算"""
+        self._write("UPDATE objects SET mtime_ns = ?, sha256 = COALESCE(?, sha256) WHERE prefix = ? AND name = ?",
+                    [(mtime_ns, sha256, self.prefix, name)])
+
+    def multipart_get(self, name):
+        """進行中的分段上傳 {"upload_id", "sha256", "size", "part_size", "started_at"} 或 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT upload_id, sha256, size, part_size, started_at FROM multipart WHERE prefix = ? AND name = ?",
+                (self.prefix, name)
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("upload_id", "sha256", "size", "part_size", "started_at"), row))
+
+    def multipart_begin(self, name, upload_id, sha256, size, part_size):
+        self._write(
+            "INSERT OR REPLACE INTO multipart (prefix, name, upload_id, sha256, size, part_size, started_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(self.prefix, name, upload_id, sha256, size, part_size, time.time())]
+        )
+
+    def multipart_end(self, name):
+        self._write("DELETE FROM multipart WHERE prefix = ? AND name = ?", [(self.prefix, name)])
+
+    def record_deletes(self, names):
+        self._write("DELETE FROM objects WHERE prefix = ? AND name = ?", [(self.prefix, n) for n in names])
+
+    def objects(self):
+        """{name: {"size", "etag", "uploaded_at"}}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, size, etag, uploaded_at FROM objects WHERE prefix = ?", (self.prefix,)
+            ).fetchall()
+        return {name: {"size": size, "etag": etag, "uploaded_at": ts} for name, size, etag, ts in rows}
+
+    def photo_names(self):
+        return {name for name in self.objects() if is_photo_object(name)}
+
+    def _meta(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meta FROM objects WHERE prefix = ? AND name = ?", (self.prefix, name)
+            ).fetchone()
+        try:
+            return json.loads(row[0]) if row and row[0] else None
+        except ValueError:
+            return None
+
+    def renditions_of(self, names):
+        """這些照片在 R2 上的 renditions 物件名稱 (刪除照片時一起刪)"""
+        return [r for name in names for r in renditions.rendition_files(self._meta(name))]
+
+    def manifest_photos(self):
+        """manifest 內容：照片 (含 renditions 尺寸/大小) 依 uploaded_at (發布時間) 排序 (最新在前)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, meta FROM objects WHERE prefix = ? ORDER BY uploaded_at DESC, name DESC",
+                (self.prefix,)
+            ).fetchall()
+        entries = []
+        for name, meta in rows:
+            if not is_photo_object(name):
+                continue
+            try:
+                meta = json.loads(meta) if meta else None
+            except ValueError:
+                meta = None
+            entries.append(renditions.manifest_entry(name, meta))
+        return entries
+
+    def manifest_state(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM manifest_state WHERE prefix = ?", (self.prefix,)
+            ).fetchone()
+        return manifest_versions.load_state(row[0] if row else None)
+
+    def save_manifest_state(self, state):
+        self._write(
+            "INSERT INTO manifest_state (prefix, state) VALUES (?, ?) "
+            "ON CONFLICT(prefix) DO UPDATE SET state = excluded.state",
+            [(self.prefix, manifest_versions.dump_state(state))]
+        )
+
+    def reconcile(self, remote_objects):
+        """
+        用遠端列表 (上傳後端 list_objects() 的結果) 校正帳本：
+        遠端沒有的移除；遠端新出現的以遠端時間補上；已知物件更新大小/ETag 但保留本機的上傳時間。
+        回傳 (新增數, 移除數)
+        """
+        local = self.objects()
+        added, updated = [], []
+        for name, info in remote_objects.items():
+            known = local.get(name)
+            if known is None or known["size"] != info["size"] or (not known["etag"] and info.get("etag")):
+                if known is not None:
+                    ts = known["uploaded_at"]
+                else:
+                    try:
+                        ts = datetime.strptime(info["modified"], "%Y-%m-%d %H:%M:%S").timestamp()
+                    except (KeyError, ValueError):
+                        ts = time.time()
+                (added if known is None else updated).append(
+                    ({"name": name, "size": info["size"], "etag": info.get("etag")}, ts))
+        # 遠端列表只含這一層，renditions/ 底下的物件不在裡面，不能當成已刪除
+        removed = [name for name in local if "/" not in name and name not in remote_objects]
+
+        for result, ts in added + updated:
+            self.record_uploads([result], uploaded_at=ts)
+        if removed:
+            self.record_deletes(removed)
+        if added or removed:
+            logger.info(f"Ledger reconciled: +{len(added)} -{len(removed)}")
+        return len(added), len(removed)
+
+    def publish_manifest(self, uploader):
+        """
+        由帳本產生 manifest (head / delta / 分頁 chunk / 舊版 manifest.json) 並上傳。
+        內容沒變就不上傳；chunk 以內容命名，只上傳新的，兩個版本前淘汰的 chunk 會刪除。
+        回傳目前的 manifest 版本。
+        """
+        previous = self.manifest_state()
+        state = manifest_versions.next_state(previous, self.manifest_photos())
+        if state is previous:
+            return state["version"]
+        for name, data in manifest_versions.render_files(state):
+            if name in previous["chunks"]:
+                continue
+            uploader.upload_bytes(data, name, "application/json")
+        self.save_manifest_state(state)
+        stale = [name for name in previous["retired"] if name not in state["chunks"]]
+        if stale:
+            try:
+                uploader.delete(stale)
+            except Exception as e:
+                logger.warning(f"Failed to delete stale manifest chunks: {e}")
+        return state["version"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
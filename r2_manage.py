@@ -8,13 +8,28 @@ R2 照片管理工具 - Live Event Photography
     python3 r2_manage.py delete 照片名.jpg  # 刪除指定照片
     python3 r2_manage.py delete-multi      # 互動式多選刪除
     python3 r2_manage.py refresh           # 重新整理 manifest（按時間排序）
+
+批次指令 (活動後大量清理；整批一起刪除，manifest 只在最後更新一次)：
+    python3 r2_manage.py delete-glob "IMG_12*.jpg" ...       # 依檔名樣式刪除
+    python3 r2_manage.py delete-list rejects.txt             # 依清單檔刪除 (一行一個檔名，# 開頭為註解)
+    python3 r2_manage.py delete-range "2026-01-20 18:00" "2026-01-20 19:30"
+                                                             # 刪除上傳時間在 [起, 迄) 之間的照片
+    python3 r2_manage.py prune-orphans                       # 刪除 manifest 沒有用到的 renditions/ 與 manifest-chunks/ 物件
+    python3 r2_manage.py prune-orphans --photos              # 同上，並刪除 R2 上不在 manifest、本機也沒有的照片
+
+    批次指令選項: --yes 不詢問直接執行, --parallel N 同時進行的刪除請求數 (預設為上傳後端的連線數)
 """
 
 import os
 import sys
-import json
-import subprocess
+import fnmatch
 from pathlib import Path
+from datetime import datetime
+
+from r2_uploader import create_uploader
+from r2_ledger import UploadLedger
+import manifest_versions
+from renditions import RENDITION_DIR, rendition_stems
 
 # ============ 配置（與 sync_to_r2.py 相同）============
 RCLONE_REMOTE = "r2livegallery"
@@ -24,82 +39,61 @@ PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 LOCAL_PHOTOS_DIR = Path(__file__).parent / "photos_web"
 # =====================================================
 
+UPLOADER = create_uploader(RCLONE_REMOTE, BUCKET_NAME, R2_PATH_PREFIX)
+LEDGER = UploadLedger(R2_PATH_PREFIX)
+
 
 def get_r2_photos_with_time():
-    """取得 R2 照片列表及時間"""
+    """取得 R2 照片列表及時間 (經由上傳後端的共用連線)"""
     try:
-        result = subprocess.run(
-            ["rclone", "lsl", f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        if result.returncode == 0:
-            photos = []
-            for line in result.stdout.strip().split('\n'):
-                if not line:
-                    continue
-                parts = line.split()
-                if len(parts) >= 4:
-                    size = int(parts[0])
-                    date_str = parts[1]
-                    time_str = parts[2].split('.')[0]  # 移除毫秒
-                    filename = parts[-1]
-                    if any(filename.lower().endswith(ext) for ext in PHOTO_EXTENSIONS):
-                        photos.append({
-                            'name': filename,
-                            'size': size,
-                            'date': date_str,
-                            'time': time_str,
-                            'datetime': f"{date_str} {time_str}"
-                        })
-            # 按時間排序（最新在前）
-            photos.sort(key=lambda x: x['datetime'], reverse=True)
-            return photos
-        return []
+        objects = UPLOADER.list_objects()
     except Exception as e:
         print(f"❌ 無法取得 R2 照片列表: {e}")
         return []
-
-
-def delete_photo(photo_name):
-    """刪除指定照片"""
-    remote_path = f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/{photo_name}"
+    photos = []
+    for name, info in objects.items():
+        if Path(name).suffix.lower() in PHOTO_EXTENSIONS:
+            date_str, _, time_str = info["modified"].partition(" ")
+            photos.append({
+                'name': name,
+                'size': info["size"],
+                'date': date_str,
+                'time': time_str,
+                'datetime': info["modified"]
+            })
+    # 按時間排序（最新在前）
+    photos.sort(key=lambda x: x['datetime'], reverse=True)
+    return photos
+
+
+def delete_photos(photo_names, parallelism=None):
+    """
+    批次刪除照片 (連同 renditions/ 底下的響應式縮圖)：全部物件交給上傳後端一次刪除
+    (S3 為 DeleteObjects 批次請求)，回傳 (已刪除照片列表, 失敗照片列表)
+    """
+    photo_names = list(photo_names)
+    objects = LEDGER.renditions_of(photo_names) + photo_names
     try:
-        result = subprocess.run(
-            ["rclone", "delete", remote_path],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        return result.returncode == 0
+        deleted, failed = UPLOADER.delete(objects, parallelism)
     except Exception as e:
         print(f"❌ 刪除失敗: {e}")
-        return False
+        return [], photo_names
+    LEDGER.record_deletes(deleted)
+    failed = set(failed)
+    return [n for n in photo_names if n not in failed], [n for n in photo_names if n in failed]
 
 
-def update_manifest():
-    """更新 R2 上的 manifest"""
-    photos = get_r2_photos_with_time()
-    photo_names = [p['name'] for p in photos]
-
-    manifest_content = json.dumps(photo_names, ensure_ascii=False, indent=2)
+def delete_photo(photo_name):
+    """刪除指定照片 (連同 renditions/ 底下的響應式縮圖)"""
+    deleted, _ = delete_photos([photo_name])
+    return bool(deleted)
 
-    # 寫入本地暫存檔
-    local_manifest = LOCAL_PHOTOS_DIR / "manifest.json"
-    with open(local_manifest, 'w', encoding='utf-8') as f:
-        f.write(manifest_content)
 
-    # 上傳到 R2
+def update_manifest():
+    """更新 R2 上的 manifest（由本機上傳帳本產生，不需重新列出遠端）"""
     try:
-        result = subprocess.run(
-            ["rclone", "copy", str(local_manifest),
-             f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        return result.returncode == 0
+        LEDGER.publish_manifest(UPLOADER)
+        return True
     except Exception as e:
         print(f"❌ 更新 manifest 失敗: {e}")
         return False
@@ -204,17 +198,13 @@ def cmd_delete_multi():
         print("已取消")
         return
 
-    # 執行刪除
-    success = 0
-    for name in selected_photos:
-        print(f"🗑️  刪除 {name}...", end=" ")
-        if delete_photo(name):
-            print("✅")
-            success += 1
-        else:
-            print("❌")
+    # 執行刪除 (整批一次)
+    print(f"🗑️  刪除 {len(selected_photos)} 張照片...")
+    deleted, failed = delete_photos(selected_photos)
+    for name in failed:
+        print(f"   ❌ {name}")
 
-    print(f"\n刪除完成: {success}/{len(selected_photos)}")
+    print(f"\n刪除完成: {len(deleted)}/{len(selected_photos)}")
 
     # 更新 manifest
     print("📋 正在更新 manifest...")
@@ -224,6 +214,172 @@ def cmd_delete_multi():
         print("⚠️  Manifest 更新失敗")
 
 
+def parse_time(value):
+    """'YYYY-MM-DD HH:MM:SS'、'YYYY-MM-DD HH:MM' 或 'YYYY-MM-DD' (本地時間，與 R2 列表一致)"""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"無法解析時間: {value}")
+
+
+def read_list_file(path):
+    """清單檔：一行一個檔名 (可含路徑，只取檔名)，空行與 # 開頭略過"""
+    names = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                names.append(Path(line).name)
+    return names
+
+
+def bulk_delete(names, assume_yes=False, parallelism=None):
+    """批次刪除 + 最後更新一次 manifest"""
+    if not names:
+        print("（沒有符合的照片）")
+        return
+
+    print(f"將刪除 {len(names)} 張照片 (連同 renditions):")
+    for name in names[:10]:
+        print(f"  - {name}")
+    if len(names) > 10:
+        print(f"  ... 以及另外 {len(names) - 10} 張")
+
+    if not assume_yes:
+        confirm = input("\n確定刪除？(y/N): ")
+        if confirm.lower() != 'y':
+            print("已取消")
+            return
+
+    print("🗑️  刪除中...")
+    deleted, failed = delete_photos(names, parallelism)
+    for name in failed:
+        print(f"   ❌ {name}")
+    print(f"刪除完成: {len(deleted)}/{len(names)}")
+
+    print("📋 正在更新 manifest...")
+    if update_manifest():
+        print("✅ Manifest 已更新")
+    else:
+        print("⚠️  Manifest 更新失敗，請手動執行 refresh")
+
+
+def cmd_delete_glob(patterns, **options):
+    """依檔名樣式 (fnmatch，例如 IMG_12*.jpg) 刪除"""
+    photos = get_r2_photos_with_time()
+    names = [p['name'] for p in photos if any(fnmatch.fnmatch(p['name'], pat) for pat in patterns)]
+    bulk_delete(names, **options)
+
+
+def cmd_delete_list(list_file, **options):
+    """依清單檔刪除；清單裡 R2 上沒有的檔名只提示不處理"""
+    wanted = read_list_file(list_file)
+    remote = {p['name'] for p in get_r2_photos_with_time()}
+    missing = [n for n in wanted if n not in remote]
+    if missing:
+        print(f"⚠️  R2 上找不到 {len(missing)} 個檔名 (略過): {', '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}")
+    bulk_delete([n for n in dict.fromkeys(wanted) if n in remote], **options)
+
+
+def cmd_delete_range(start, end, **options):
+    """刪除上傳時間在 [start, end) 之間的照片"""
+    start, end = parse_time(start), parse_time(end)
+    names = [p['name'] for p in get_r2_photos_with_time()
+             if start <= parse_time(p['datetime']) < end]
+    bulk_delete(names, **options)
+
+
+def local_photo_names():
+    """本機網頁資料夾裡的照片 (同步腳本會上傳、記入帳本的)"""
+    try:
+        return {p.name for p in LOCAL_PHOTOS_DIR.iterdir()
+                if p.is_file() and p.suffix.lower() in PHOTO_EXTENSIONS and not p.name.startswith("._")}
+    except OSError:
+        return set()
+
+
+def cmd_prune_orphans(assume_yes=False, parallelism=None, include_photos=False):
+    """
+    刪除 manifest 沒有用到的物件：renditions/ 底下主檔已不在的縮圖、已淘汰超過兩個版本的 manifest-chunks/；
+    include_photos 時也刪除這一層不在 manifest 的照片。
+    本機網頁資料夾還有主檔、或帳本裡有主檔的縮圖與照片都保留：同步腳本可能已先傳了 renditions、
+    主檔還在排隊 (積壓上傳時尤其常見)，刪掉就會讓之後上牆的照片缺圖；這次不刪的 R2 照片，縮圖也保留
+    """
+    print("🔍 正在列出 R2 上所有物件 (含子資料夾)...")
+    objects = UPLOADER.list_objects(recursive=True)
+
+    state = LEDGER.manifest_state()
+    referenced = {manifest_versions.LEGACY_NAME, manifest_versions.HEAD_NAME, manifest_versions.DELTA_NAME}
+    referenced.update(state["chunks"], state["retired"])  # 淘汰的 chunk 舊版客戶端可能還在讀
+    for entry in LEDGER.manifest_photos():
+        referenced.add(entry["name"])
+        referenced.update(r["src"] for r in entry.get("renditions", []))
+
+    local = local_photo_names()
+    unknown_photos = sorted(n for n in objects if "/" not in n and n not in referenced
+                            and Path(n).suffix.lower() in PHOTO_EXTENSIONS)
+    pending = [n for n in unknown_photos if n in local]  # 同步中：還沒記入帳本
+    stale_photos = [n for n in unknown_photos if n not in local]
+    if pending:
+        print(f"ℹ️  {len(pending)} 張照片本機還在、尚未記入帳本 (同步中，不刪除)")
+    if stale_photos and not include_photos:
+        print(f"ℹ️  {len(stale_photos)} 張照片在 R2 上但不在 manifest、本機也沒有 (加上 --photos 一併刪除；"
+              f"或執行 refresh 收進 manifest)")
+        stale_photos = []
+    # 保留的照片 (帳本、本機、這次不刪的 R2 照片) 的縮圖都不刪
+    live_stems = {Path(n).stem for n in (LEDGER.photo_names() | local | set(unknown_photos)) - set(stale_photos)}
+
+    orphans = stale_photos + sorted(
+        n for n in objects if "/" in n and n not in referenced
+        and not (n.startswith(f"{RENDITION_DIR}/") and any(s in live_stems for s in rendition_stems(n))))
+
+    if not orphans:
+        print("✅ 沒有孤立物件")
+        return
+    size_mb = sum(objects[n]["size"] for n in orphans) / 1024 / 1024
+    photos = f"，其中 {len(stale_photos)} 張照片" if stale_photos else ""
+    print(f"找到 {len(orphans)} 個孤立物件{photos} ({size_mb:.1f} MB):")
+    for name in orphans[:10]:
+        print(f"  - {name}")
+    if len(orphans) > 10:
+        print(f"  ... 以及另外 {len(orphans) - 10} 個")
+
+    if not assume_yes:
+        confirm = input("\n確定刪除？(y/N): ")
+        if confirm.lower() != 'y':
+            print("已取消")
+            return
+
+    deleted, failed = UPLOADER.delete(orphans, parallelism)
+    LEDGER.record_deletes(deleted)
+    print(f"刪除完成: {len(deleted)}/{len(orphans)}" + (f"，失敗 {len(failed)}" if failed else ""))
+
+    print("📋 正在更新 manifest...")
+    if update_manifest():
+        print("✅ Manifest 已更新")
+    else:
+        print("⚠️  Manifest 更新失敗，請手動執行 refresh")
+
+
+def pop_options(args):
+    """取出批次指令選項 --yes / -y、--parallel N"""
+    options = {"assume_yes": False, "parallelism": None}
+    rest = []
+    i = 0
+    while i < len(args):
+        if args[i] in ("--yes", "-y"):
+            options["assume_yes"] = True
+        elif args[i] == "--parallel" and i + 1 < len(args):
+            options["parallelism"] = int(args[i + 1])
+            i += 1
+        else:
+            rest.append(args[i])
+        i += 1
+    return rest, options
+
+
 def cmd_refresh():
     """重新整理 manifest"""
     print("🔄 正在重新整理 manifest（按上傳時間排序）...")
@@ -231,6 +387,11 @@ def cmd_refresh():
     photos = get_r2_photos_with_time()
     print(f"   找到 {len(photos)} 張照片")
 
+    # 用遠端列表校正本機帳本，再由帳本產生 manifest
+    added, removed = LEDGER.reconcile(UPLOADER.list_objects())
+    if added or removed:
+        print(f"   帳本已校正: +{added} -{removed}")
+
     if update_manifest():
         print("✅ Manifest 已更新")
         print("\n前 5 張照片（最新）:")
@@ -246,6 +407,7 @@ def main():
         return
 
     cmd = sys.argv[1].lower()
+    args, options = pop_options(sys.argv[2:])
 
     if cmd == 'list':
         cmd_list()
@@ -258,6 +420,26 @@ def main():
         cmd_delete_multi()
     elif cmd == 'refresh':
         cmd_refresh()
+    elif cmd == 'delete-glob':
+        if not args:
+            print("用法: python3 r2_manage.py delete-glob \"IMG_12*.jpg\" ...")
+            return
+        cmd_delete_glob(args, **options)
+    elif cmd == 'delete-list':
+        if not args:
+            print("用法: python3 r2_manage.py delete-list 清單.txt")
+            return
+        cmd_delete_list(args[0], **options)
+    elif cmd == 'delete-range':
+        if len(args) < 2:
+            print("用法: python3 r2_manage.py delete-range \"YYYY-MM-DD HH:MM\" \"YYYY-MM-DD HH:MM\"")
+            return
+        try:
+            cmd_delete_range(args[0], args[1], **options)
+        except ValueError as e:
+            print(f"❌ {e}")
+    elif cmd == 'prune-orphans':
+        cmd_prune_orphans(include_photos="--photos" in args, **options)
     else:
         print(f"未知命令: {cmd}")
         print(__doc__)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+R2 上傳後端 - Live Event Photography
+
+提供統一的上傳介面 (upload / delete / list)，供 sync_to_r2.py 等腳本使用：
+  - S3Uploader：使用 boto3 直接連線 R2 (S3 相容 API)，連線池 + keep-alive，
+    大檔自動分段並行上傳，失敗時指數退避重試；有上傳日誌 (journal，見 r2_ledger.py)
+    時分段上傳的 UploadId 會記下來，程式中斷重啟後從已完成的分段續傳
+  - RcloneUploader：原本的 rclone 子程序方式，作為備援
+
+S3 憑證從 config.json 的 "r2" 區塊或環境變數讀取：
+    R2_ENDPOINT_URL, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY
+未安裝 boto3 或沒有憑證時自動改用 rclone。
+endpoint_url 可指向本機 S3 替身 (moto / minio) 進行測試。
+"""
+
+import os
+import json
+import math
+import time
+import random
+import logging
+import mimetypes
+import subprocess
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from boto3.s3.transfer import TransferConfig
+    from s3transfer.utils import ReadFileChunk, signal_not_transferring, signal_transferring
+except ImportError:  # boto3 是選用套件，沒有就用 rclone
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_R2_SETTINGS = {
+    "backend": "auto",           # "auto" | "s3" | "rclone"
+    "endpoint_url": "",          # https://<account_id>.r2.cloudflarestorage.com
+    "access_key_id": "",
+    "secret_access_key": "",
+    "region": "auto",
+    "max_connections": 8,        # 連線池大小 / 並行上傳數
+    "multipart_threshold_mb": 8,
+    "retries": 4,
+    "upload_slots": 4,           # sync_to_r2 的上傳排程器同時上傳的檔案數 (upload_scheduler.py)
+    "max_upload_mbps": 0,        # 上傳頻寬上限 (Mbps)，0 = 不限速
+}
+
+
+class UploadError(Exception):
+    pass
+
+
+def _upload_items(local_paths):
+    """[(Path, 物件名稱)]"""
+    items = []
+    for item in local_paths:
+        path, name = item if isinstance(item, tuple) else (item, None)
+        path = Path(path)
+        items.append((path, name or path.name))
+    return items
+
+
+def load_r2_settings(config_file=None):
+    """從 config.json 的 "r2" 區塊與環境變數組合出上傳設定"""
+    settings = dict(DEFAULT_R2_SETTINGS)
+    config_file = Path(config_file) if config_file else Path(__file__).parent / "config.json"
+    if config_file.exists():
+        try:
+            with open(config_file, "r", encoding="utf-8") as f:
+                settings.update(json.load(f).get("r2", {}))
+        except Exception as e:
+            logger.warning(f"無法讀取 r2 設定: {e}")
+    for key, env in (("endpoint_url", "R2_ENDPOINT_URL"),
+                     ("access_key_id", "R2_ACCESS_KEY_ID"),
+                     ("secret_access_key", "R2_SECRET_ACCESS_KEY")):
+        if os.environ.get(env):
+            settings[key] = os.environ[env]
+    return settings
+
+
+def with_retry(fn, attempts=4, base_delay=0.5, what="R2 操作"):
+    """執行 fn()，失敗時以指數退避 (含抖動) 重試"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = base_delay * (2 ** (attempt - 1)) * (0.5 + random.random())
+            logger.warning(f"{what} 失敗 ({e})，{delay:.1f} 秒後重試 ({attempt}/{attempts - 1})")
+            time.sleep(delay)
+
+
+class UploaderBackend:
+    """上傳後端介面；name 為 bucket/prefix 底下的物件名稱 (例如 IMG_0001.jpg)"""
+
+    description = "base"
+    concurrency = 1
+    throttle = None         # 共用的限速令牌桶 (有 consume(位元組數) 與 rate)，見 limit_bandwidth()
+    throttle_streams = 1
+
+    def limit_bandwidth(self, bucket, streams):
+        """
+        限制總上傳頻寬：bucket 為上傳排程器共用的令牌桶，streams 為同時上傳的檔案數上限。
+        後端在資料實際送出時取用令牌 (不是每個檔案開始前一次預付)，所以多個上傳槽的總和不會超過上限
+        """
+        self.throttle = bucket
+        self.throttle_streams = max(1, int(streams))
+
+    def upload(self, local_path, name=None):
+        """上傳單一檔案，回傳 {"name", "size", "etag"}；失敗時拋出 UploadError"""
+        raise NotImplementedError
+
+    def upload_bytes(self, data, name, content_type=None):
+        """直接上傳記憶體中的內容 (例如 manifest.json)，不寫本機檔案"""
+        raise NotImplementedError
+
+    def upload_many(self, local_paths):
+        """
+        並行上傳多個檔案，回傳 (成功結果列表, 失敗名稱列表)
+        local_paths 的元素可以是路徑 (物件名稱 = 檔名) 或 (路徑, 物件名稱)，例如 renditions/ 底下的檔案
+        """
+        results, failed = [], []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self.upload, p, n): n for p, n in _upload_items(local_paths)}
+            for future, name in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.warning(f"上傳失敗 {name}: {e}")
+                    failed.append(name)
+        return results, failed
+
+    def delete(self, names, parallelism=None):
+        """刪除多個物件 (批次，parallelism 個請求同時進行，預設 = concurrency)，回傳 (已刪除列表, 失敗列表)"""
+        raise NotImplementedError
+
+    def list_objects(self, recursive=False):
+        """
+        列出 prefix 底下的物件：{name: {"size", "modified", "etag"}}，modified 為 'YYYY-MM-DD HH:MM:SS'
+        預設只列這一層；recursive=True 連 renditions/、manifest-chunks/ 一起列 (name 含子資料夾)
+        """
+        raise NotImplementedError
+
+
+class S3Uploader(UploaderBackend):
+    def __init__(self, bucket, prefix, settings, journal=None):
+        self.bucket = bucket
+        self.journal = journal  # UploadLedger：記錄進行中的分段上傳，可續傳
+        self.prefix = prefix.strip("/")
+        self.retries = int(settings.get("retries", 4))
+        self.concurrency = int(settings.get("max_connections", 8))
+        self.description = f"S3 API {settings['endpoint_url']} ({self.concurrency} connections)"
+        # 單一 client 在執行緒間共用：連線池 + TCP keep-alive，避免每張照片重新 TLS 握手
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings["endpoint_url"],
+            aws_access_key_id=settings["access_key_id"],
+            aws_secret_access_key=settings["secret_access_key"],
+            region_name=settings.get("region", "auto"),
+            config=BotoConfig(
+                max_pool_connections=self.concurrency * 2,
+                tcp_keepalive=True,
+                retries={"max_attempts": 2, "mode": "standard"},
+            ),
+        )
+        self.multipart_threshold = int(settings.get("multipart_threshold_mb", 8)) * 1024 * 1024
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_threshold,
+            max_concurrency=self.concurrency,
+            use_threads=True,
+        )
+        # 與 s3transfer 相同的做法：計算簽章/校驗碼讀取內容時不算進度，真正送出時才呼叫 callback (限速)
+        self.client.meta.events.register_first("request-created.s3", signal_not_transferring,
+                                               unique_id="r2-uploader-not-transferring")
+        self.client.meta.events.register_last("request-created.s3", signal_transferring,
+                                              unique_id="r2-uploader-transferring")
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def _body(self, local_path, start, length):
+        """檔案的一段 (整個檔案或一個分段)：邊送出邊向令牌桶取用，限速時連線上的傳輸速度本身被放慢"""
+        callbacks = []
+        if self.throttle is not None:
+            callbacks.append(lambda bytes_transferred: self.throttle.consume(bytes_transferred))
+        return ReadFileChunk.from_filename(str(local_path), start, length, callbacks=callbacks, enable_callbacks=False)
+
+    def upload(self, local_path, name=None):
+        local_path = Path(local_path)
+        name = name or local_path.name
+        key = self._key(name)
+        size = local_path.stat().st_size
+        extra = {"ContentType": mimetypes.guess_type(name)[0] or "application/octet-stream"}
+
+        def do_upload():
+            if size < self.multipart_threshold:
+                with self._body(local_path, 0, size) as body:
+                    response = self.client.put_object(Bucket=self.bucket, Key=key, Body=body, **extra)
+                return response["ETag"].strip('"')
+            # 大檔：分段並行上傳 (有日誌時可續傳)
+            if self.journal is not None:
+                return self._upload_resumable(local_path, key, name, size, extra)
+            self.client.upload_file(str(local_path), self.bucket, key, ExtraArgs=extra, Config=self.transfer_config,
+                                    Callback=self.throttle.consume if self.throttle is not None else None)
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ETag"].strip('"')
+
+        try:
+            etag = with_retry(do_upload, self.retries, what=f"上傳 {name}")
+        except Exception as e:
+            raise UploadError(f"{name}: {e}")
+        return {"name": name, "size": size, "etag": etag}
+
+    def _upload_resumable(self, local_path, key, name, size, extra):
+        """
+        自己管理的分段上傳：UploadId 連同內容雜湊記在日誌裡，
+        重試或程式重啟後以 list_parts 找出 R2 已收到的分段，只補傳其餘的
+        """
+        from r2_ledger import file_sha256
+
+        digest = file_sha256(local_path)
+        part_size = self.multipart_threshold
+        pending = self.journal.multipart_get(name)
+        upload_id, parts = None, {}
+        if pending and (pending["sha256"], pending["size"], pending["part_size"]) == (digest, size, part_size):
+            try:
+                paginator = self.client.get_paginator("list_parts")
+                for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=pending["upload_id"]):
+                    parts.update((p["PartNumber"], p["ETag"]) for p in page.get("Parts", []))
+                upload_id = pending["upload_id"]
+                logger.info(f"續傳 {name}: R2 已有 {len(parts)} 段")
+            except Exception as e:  # 逾時被 R2 清掉的上傳 (NoSuchUpload)
+                logger.info(f"無法續傳 {name} ({e})，重新上傳")
+                parts = {}
+        elif pending:
+            # 檔案內容已經變了：舊的分段作廢
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=pending["upload_id"])
+            except Exception:
+                pass
+        if upload_id is None:
+            upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, **extra)["UploadId"]
+            self.journal.multipart_begin(name, upload_id, digest, size, part_size)
+
+        def send_part(number):
+            with self._body(local_path, (number - 1) * part_size, part_size) as body:
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                   PartNumber=number, Body=body)
+            return number, response["ETag"]
+
+        missing = [n for n in range(1, math.ceil(size / part_size) + 1) if n not in parts]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(missing))) as pool:
+                parts.update(pool.map(send_part, missing))
+        response = self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": n, "ETag": parts[n]} for n in sorted(parts)]},
+        )
+        self.journal.multipart_end(name)
+        return response["ETag"].strip('"')
+
+    def upload_bytes(self, data, name, content_type=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        content_type = content_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        def do_put():
+            response = self.client.put_object(Bucket=self.bucket, Key=self._key(name),
+                                              Body=data, ContentType=content_type)
+            return response["ETag"].strip('"')
+
+        try:
+            etag = with_retry(do_put, self.retries, what=f"上傳 {name}")
+        except Exception as e:
+            raise UploadError(f"{name}: {e}")
+        return {"name": name, "size": len(data), "etag": etag}
+
+    def _delete_chunk(self, chunk):
+        try:
+            response = with_retry(lambda: self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self._key(n)} for n in chunk], "Quiet": False},
+            ), self.retries, what="批次刪除")
+        except Exception as e:
+            logger.warning(f"批次刪除失敗: {e}")
+            return [], list(chunk)
+        errors = {err["Key"] for err in response.get("Errors", [])}
+        return ([n for n in chunk if self._key(n) not in errors],
+                [n for n in chunk if self._key(n) in errors])
+
+    def delete(self, names, parallelism=None):
+        names = list(names)
+        parallelism = max(1, parallelism or self.concurrency)
+        # DeleteObjects 一次最多 1000 個；大量刪除時切成 parallelism 份 (每批至少 100 個)，經由共用連線池同時送出
+        size = min(1000, max(100, -(-len(names) // parallelism)))
+        chunks = [names[i:i + size] for i in range(0, len(names), size)]
+        deleted, failed = [], []
+        if len(chunks) <= 1:
+            results = [self._delete_chunk(c) for c in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(chunks), parallelism)) as pool:
+                results = list(pool.map(self._delete_chunk, chunks))
+        for ok, bad in results:
+            deleted.extend(ok)
+            failed.extend(bad)
+        return deleted, failed
+
+    def list_objects(self, recursive=False):
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        extra = {} if recursive else {"Delimiter": "/"}
+
+        def do_list():
+            found = {}
+            paginator = self.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, **extra):
+                for obj in page.get("Contents", []):
+                    name = obj["Key"][len(prefix):]
+                    modified = obj["LastModified"].astimezone()  # 與 rclone lsl 一樣用本地時間
+                    found[name] = {
+                        "size": obj["Size"],
+                        "modified": modified.strftime("%Y-%m-%d %H:%M:%S"),
+                        "etag": obj["ETag"].strip('"'),
+                    }
+            return found
+
+        return with_retry(do_list, self.retries, what="列出 R2 物件")
+
+
+class RcloneUploader(UploaderBackend):
+    """rclone 子程序備援 (每次呼叫都會啟動一個 rclone 行程)"""
+
+    def __init__(self, remote, bucket, prefix, settings=None):
+        self.remote_dir = f"{remote}:{bucket}/{prefix.strip('/')}/"
+        self.retries = int((settings or {}).get("retries", 4))
+        self.concurrency = int((settings or {}).get("max_connections", 8))
+        self.description = f"rclone {self.remote_dir}"
+
+    def _run(self, args, timeout=60, input=None):
+        result = subprocess.run(["rclone"] + args, capture_output=True, text=True,
+                                timeout=timeout, input=input)
+        if result.returncode != 0:
+            raise UploadError(result.stderr.strip()[:200])
+        return result.stdout
+
+    def _bwlimit(self, streams):
+        """
+        rclone 行程各自限速 (--bwlimit，單位 KiB/s)：總上限平分給同時執行的 streams 個行程。
+        只有少數上傳槽在忙時總速度會低於上限，但不會超過
+        """
+        if self.throttle is None or self.throttle.rate <= 0:
+            return []
+        return ["--bwlimit", f"{max(1, int(self.throttle.rate / streams / 1024))}k"]
+
+    def upload(self, local_path, name=None):
+        local_path = Path(local_path)
+        name = name or local_path.name
+        if name == local_path.name:
+            args = ["copy", str(local_path), self.remote_dir]
+        else:
+            args = ["copyto", str(local_path), self.remote_dir + name]
+        args += self._bwlimit(self.throttle_streams)
+        with_retry(lambda: self._run(args), self.retries, what=f"上傳 {name}")
+        return {"name": name, "size": local_path.stat().st_size, "etag": None}
+
+    def upload_bytes(self, data, name, content_type=None):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        # rclone rcat 從 stdin 讀取內容
+        with_retry(lambda: self._run(["rcat", self.remote_dir + name], input=data),
+                   self.retries, what=f"上傳 {name}")
+        return {"name": name, "size": len(data.encode("utf-8")), "etag": None}
+
+    def upload_many(self, local_paths):
+        """
+        物件名稱與本機相對路徑一致 (同一個根資料夾，例如 IMG.jpg + renditions/IMG-400-3fa85f64c2.webp) 時，
+        用單一 rclone 行程 (--files-from) 一起上傳
+        """
+        items = _upload_items(local_paths)
+        roots = {Path(str(p)[:-len(n)]) if str(p).endswith("/" + n) else None for p, n in items}
+        if len(items) <= 1 or len(roots) != 1 or None in roots:
+            return super().upload_many(items)
+        root = roots.pop()
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("\n".join(n for _, n in items))
+            list_file = f.name
+        try:
+            with_retry(lambda: self._run(
+                ["copy", str(root), self.remote_dir,
+                 "--files-from-raw", list_file, "--transfers", str(self.concurrency)] + self._bwlimit(1),
+                timeout=300), self.retries, what="批次上傳")
+            return [{"name": n, "size": p.stat().st_size, "etag": None} for p, n in items], []
+        except Exception as e:
+            logger.warning(f"批次上傳失敗: {e}")
+            return [], [n for _, n in items]
+        finally:
+            os.remove(list_file)
+
+    def _delete_each(self, names):
+        deleted, failed = [], []
+        for n in names:
+            try:
+                self._run(["delete", self.remote_dir + n], timeout=30)
+                deleted.append(n)
+            except Exception as e:
+                logger.warning(f"刪除失敗 {n}: {e}")
+                failed.append(n)
+        return deleted, failed
+
+    def delete(self, names, parallelism=None):
+        names = list(names)
+        if len(names) <= 1:
+            return self._delete_each(names)
+        # 單一 rclone 行程 (--files-from-raw) 刪除整批，--checkers 控制同時進行的請求數
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("\n".join(names))
+            list_file = f.name
+        try:
+            self._run(["delete", self.remote_dir, "--files-from-raw", list_file,
+                       "--checkers", str(parallelism or self.concurrency)], timeout=600)
+            return names, []
+        except Exception as e:
+            # 不知道哪些失敗：逐一重試找出來 (已刪除的再刪一次也會成功)
+            logger.warning(f"批次刪除失敗，改為逐一刪除: {e}")
+            return self._delete_each(names)
+        finally:
+            os.remove(list_file)
+
+    def list_objects(self, recursive=False):
+        # rclone lsl 格式: "   size YYYY-MM-DD HH:MM:SS.NNNNNN filename"
+        # 預設只列出這一層 (與 S3 後端一致，不含 manifest-chunks/ 等子資料夾)
+        args = ["lsl", self.remote_dir] if recursive else ["lsl", "--max-depth", "1", self.remote_dir]
+        output = with_retry(lambda: self._run(args, timeout=60),
+                            self.retries, what="列出 R2 物件")
+        objects = {}
+        for line in output.strip().split('\n'):
+            parts = line.split()
+            if len(parts) >= 4:
+                objects[parts[-1]] = {
+                    "size": int(parts[0]),
+                    "modified": f"{parts[1]} {parts[2].split('.')[0]}",
+                    "etag": None,
+                }
+        return objects
+
+
+def create_uploader(rclone_remote, bucket, prefix, settings=None, journal=None):
+    """
+    依設定選擇上傳後端：有 boto3 與憑證就用 S3 API，否則用 rclone
+    journal (UploadLedger) 讓 S3 後端的分段上傳可以續傳；rclone 自行處理分段，不使用
+    """
+    settings = settings or load_r2_settings()
+    backend = settings.get("backend", "auto")
+    has_credentials = all(settings.get(k) for k in ("endpoint_url", "access_key_id", "secret_access_key"))
+
+    if backend in ("auto", "s3"):
+        if boto3 is not None and has_credentials:
+            return S3Uploader(bucket, prefix, settings, journal)
+        if backend == "s3":
+            reason = "未安裝 boto3" if boto3 is None else "缺少 R2 憑證"
+            logger.warning(f"無法使用 S3 後端 ({reason})，改用 rclone")
+    return RcloneUploader(rclone_remote, bucket, prefix, settings)
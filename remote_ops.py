@@ -0,0 +1,121 @@
+"""
+Single worker for the server's R2 side effects (unpublish deletes).
+
+Unpublishing used to start one thread per photo, each deleting its objects
+and rebuilding the R2 manifest, so clearing 30 photos raced 30 manifest
+rewrites against each other and against the sync daemon. Here one daemon
+thread drains a coalescing queue: everything queued while it was busy (plus a
+short settle window, so a burst of clicks lands together) goes out as one
+delete call - one DeleteObjects request per 1000 keys on the S3 backend -
+followed by one manifest rebuild.
+
+stats() reports queue depth, the age of the oldest pending delete and
+queue-to-done latencies for /api/status.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+SETTLE_SECONDS = 0.5    # Wait after the first queued delete for the rest of a burst
+LATENCY_SAMPLES = 200   # Recent queue-to-done latencies kept for stats()
+
+
+class RemoteOpsWorker:
+    def __init__(self, get_backend, settle_seconds: float = SETTLE_SECONDS):
+        self._get_backend = get_backend  # () -> (uploader, ledger); created lazily on first batch
+        self.settle_seconds = settle_seconds
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()  # filename -> time queued (a photo queued twice is deleted once)
+        self._in_flight = 0
+        self._thread = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {"batches": 0, "photos_deleted": 0, "objects_deleted": 0,
+                          "failed": 0, "manifest_updates": 0}
+        self._last_batch = None
+
+    def queue_delete(self, filename: str):
+        """Delete a published photo (and its renditions) from R2, then refresh the R2 manifest"""
+        with self._cond:
+            self._pending.setdefault(filename, time.time())
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="remote-ops", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.settle_seconds)
+            with self._cond:
+                batch, self._pending = self._pending, OrderedDict()
+                self._in_flight = len(batch)
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"   ⚠️ R2 delete batch failed ({len(batch)} photos): {e}")
+                with self._cond:
+                    self._counters["failed"] += len(batch)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+
+    def _run_batch(self, batch):
+        uploader, ledger = self._get_backend()
+        names = list(batch)
+        started = time.time()
+
+        # 1. One delete call for every photo and rendition in the batch
+        objects = ledger.renditions_of(names) + names
+        try:
+            deleted, failed = uploader.delete(objects)
+        except Exception as e:
+            logger.warning(f"   ⚠️ R2 delete error: {e}")
+            deleted, failed = [], objects
+        ledger.record_deletes(deleted)
+        failed = set(failed)
+        if failed:
+            logger.warning(f"   ⚠️ R2 delete failed: {', '.join(sorted(failed))}")
+        removed = [n for n in names if n not in failed]
+        if removed:
+            logger.info(f"   ☁️ R2 deleted {len(removed)} photo(s) ({len(deleted)} objects): {', '.join(removed)}")
+
+        # 2. One manifest rebuild from the ledger, if any photo actually went away
+        version = None
+        if removed:
+            try:
+                version = ledger.publish_manifest(uploader)
+                logger.info(f"   ☁️ R2 manifest updated to v{version} ({len(ledger.photo_names())} photos)")
+            except Exception as e:
+                logger.warning(f"   ⚠️ R2 manifest sync error: {e}")
+
+        finished = time.time()
+        with self._cond:
+            self._latencies.extend(finished - batch[n] for n in removed)
+            self._counters["batches"] += 1
+            self._counters["photos_deleted"] += len(removed)
+            self._counters["objects_deleted"] += len(deleted)
+            self._counters["failed"] += len(names) - len(removed)
+            self._counters["manifest_updates"] += version is not None
+            self._last_batch = {"photos": len(names), "objects": len(objects), "failed": len(failed),
+                                "seconds": round(finished - started, 2), "finished_at": finished}
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.time()
+            latencies = sorted(self._latencies)
+            oldest = next(iter(self._pending.values()), None)
+            return {
+                "queued": len(self._pending),
+                "in_flight": self._in_flight,
+                "oldest_queued_s": round(now - oldest, 1) if oldest else 0,
+                "latency_p50_s": round(latencies[len(latencies) // 2], 2) if latencies else None,
+                "latency_max_s": round(latencies[-1], 2) if latencies else None,
+                **self._counters,
+                "last_batch": self._last_batch,
+            }
@@ -0,0 +1,274 @@
+"""
+Geometry planner for the publish pipeline.
+
+The editor's edits (EXIF orientation, 90° rotation, straighten, scale crop and
+the final fit to max_size) are composed into a single affine map from output
+pixels back to source pixels, so the full-resolution image is resampled once,
+straight to the output size, instead of being copied and rotated at 24-45 MP
+several times.
+
+plan_geometry() reproduces the crop rectangles of the original step-by-step
+pipeline (render_reference()) exactly; tests/test_render_parity.py checks the
+two stay within tolerance (check_render_parity.py benchmarks them on full-size photos).
+"""
+
+import math
+import logging
+from PIL import Image, ImageOps, ImageEnhance
+
+logger = logging.getLogger(__name__)
+
+T = Image.Transpose
+
+# Transposes ImageOps.exif_transpose() applies for each EXIF orientation
+ORIENTATION_TRANSPOSES = {
+    2: [T.FLIP_LEFT_RIGHT],
+    3: [T.ROTATE_180],
+    4: [T.FLIP_TOP_BOTTOM],
+    5: [T.TRANSPOSE],
+    6: [T.ROTATE_270],
+    7: [T.TRANSVERSE],
+    8: [T.ROTATE_90],
+}
+
+# Editor rotation (clockwise degrees) -> PIL transpose (PIL rotates counter-clockwise)
+ROTATION_TRANSPOSES = {
+    90: T.ROTATE_270,
+    180: T.ROTATE_180,
+    270: T.ROTATE_90,
+}
+
+SWAPS_AXES = {T.ROTATE_90, T.ROTATE_270, T.TRANSPOSE, T.TRANSVERSE}
+
+
+# --- 3x3 affine helpers (continuous pixel coordinates, pixel i covers [i, i+1)) ---
+def _mul(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+
+
+def _translate(tx, ty):
+    return [[1, 0, tx], [0, 1, ty], [0, 0, 1]]
+
+
+def _scale(sx, sy):
+    return [[sx, 0, 0], [0, sy, 0], [0, 0, 1]]
+
+
+def _apply(m, x, y):
+    return m[0][0] * x + m[0][1] * y + m[0][2], m[1][0] * x + m[1][1] * y + m[1][2]
+
+
+def _transpose_matrix(method, w, h):
+    """Map output coords of img.transpose(method) (img is w x h) back to input coords"""
+    return {
+        T.FLIP_LEFT_RIGHT: [[-1, 0, w], [0, 1, 0], [0, 0, 1]],
+        T.FLIP_TOP_BOTTOM: [[1, 0, 0], [0, -1, h], [0, 0, 1]],
+        T.ROTATE_180: [[-1, 0, w], [0, -1, h], [0, 0, 1]],
+        T.ROTATE_90: [[0, -1, w], [1, 0, 0], [0, 0, 1]],
+        T.ROTATE_270: [[0, 1, 0], [-1, 0, h], [0, 0, 1]],
+        T.TRANSPOSE: [[0, 1, 0], [1, 0, 0], [0, 0, 1]],
+        T.TRANSVERSE: [[0, -1, w], [-1, 0, h], [0, 0, 1]],
+    }[method]
+
+
+def _rotate_expand(w, h, angle):
+    """
+    Same matrix and canvas size as Image.rotate(angle, expand=True):
+    returns (matrix mapping rotated coords -> input coords, new_w, new_h)
+    """
+    rad = -math.radians(angle)
+    a, b = round(math.cos(rad), 15), round(math.sin(rad), 15)
+    d, e = round(-math.sin(rad), 15), round(math.cos(rad), 15)
+    cx, cy = w / 2.0, h / 2.0
+    c = a * -cx + b * -cy + cx
+    f = d * -cx + e * -cy + cy
+    xx, yy = [], []
+    for x, y in ((0, 0), (w, 0), (w, h), (0, h)):
+        xx.append(a * x + b * y + c)
+        yy.append(d * x + e * y + f)
+    nw = math.ceil(max(xx)) - math.floor(min(xx))
+    nh = math.ceil(max(yy)) - math.floor(min(yy))
+    tx, ty = -(nw - w) / 2.0, -(nh - h) / 2.0
+    c, f = a * tx + b * ty + c, d * tx + e * ty + f
+    return [[a, b, c], [d, e, f], [0, 0, 1]], nw, nh
+
+
+def fit_size(w, h, max_size):
+    """Output size of Image.thumbnail((max_size, max_size)) for a w x h image"""
+    x = y = int(max_size)
+    if x >= w and y >= h:
+        return w, h
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = w / h
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+class GeometryPlan:
+    """Where each output pixel comes from in the source image"""
+
+    def __init__(self, source_size, transposes, matrix, output_size, axis_aligned):
+        self.source_size = source_size   # (w, h) of the decoded source, before any transpose
+        self.transposes = transposes     # Orientation + rotation transposes, in order
+        self.matrix = matrix             # output coords -> source coords
+        self.output_size = output_size
+        self.axis_aligned = axis_aligned  # No straighten: a crop box + resize is enough
+
+    def source_box(self):
+        """Bounding box (in source coords) of the pixels the output is made from"""
+        ow, oh = self.output_size
+        pts = [_apply(self.matrix, x, y) for x, y in ((0, 0), (ow, 0), (ow, oh), (0, oh))]
+        xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def resized(self, output_size):
+        """Same framing rendered at a different output size (e.g. a small editor preview)"""
+        ow, oh = self.output_size
+        matrix = _mul(self.matrix, _scale(ow / output_size[0], oh / output_size[1]))
+        return GeometryPlan(self.source_size, self.transposes, matrix, tuple(output_size), self.axis_aligned)
+
+
+def plan_geometry(source_size, orientation: int = 1, rotation: int = 0,
+                  straighten: float = 0.0, scale: float = 1.0, max_size: int = 1600) -> GeometryPlan:
+    w, h = source_size
+    transposes = list(ORIENTATION_TRANSPOSES.get(orientation, []))
+    if rotation in ROTATION_TRANSPOSES:
+        transposes.append(ROTATION_TRANSPOSES[rotation])
+
+    # Upright (oriented + rotated) image -> source
+    matrix = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    for method in transposes:
+        matrix = _mul(matrix, _transpose_matrix(method, w, h))
+        if method in SWAPS_AXES:
+            w, h = h, w
+    orig_w, orig_h = w, h
+
+    # Straighten: rotate with expand, then center crop by the clamped crop factor
+    if straighten != 0:
+        rot, nw, nh = _rotate_expand(w, h, -straighten)
+        angle_rad = abs(math.radians(straighten))
+        crop_factor = math.cos(angle_rad) - math.sin(angle_rad) * min(orig_w / orig_h, orig_h / orig_w)
+        crop_factor = max(0.8, min(1.0, crop_factor))
+        new_w, new_h = int(orig_w * crop_factor), int(orig_h * crop_factor)
+        matrix = _mul(matrix, _mul(rot, _translate((nw - new_w) // 2, (nh - new_h) // 2)))
+        w, h = new_w, new_h
+
+    # Scale (zoom in): center crop
+    if scale != 1.0 and scale > 1.0:
+        crop_w, crop_h = int(w / scale), int(h / scale)
+        matrix = _mul(matrix, _translate((w - crop_w) // 2, (h - crop_h) // 2))
+        w, h = crop_w, crop_h
+
+    # Fit to max size
+    out_w, out_h = fit_size(w, h, max_size)
+    matrix = _mul(matrix, _scale(w / out_w, h / out_h))
+    return GeometryPlan(source_size, transposes, matrix, (out_w, out_h), axis_aligned=(straighten == 0))
+
+
+DRAFT_MIN_OVERSAMPLE = 1.5  # Decoded pixels per output pixel that draft decoding must keep
+
+
+def draft_reduction(plan: GeometryPlan, min_oversample: float = DRAFT_MIN_OVERSAMPLE) -> int:
+    """
+    Largest libjpeg DCT reduction (1, 2, 4 or 8) that still leaves at least
+    min_oversample source pixels per output pixel along both axes.
+    """
+    m = plan.matrix
+    ratio = min(math.hypot(m[0][0], m[1][0]), math.hypot(m[0][1], m[1][1]))
+    for reduction in (8, 4, 2):
+        if ratio / reduction >= min_oversample:
+            return reduction
+    return 1
+
+
+def render(img, plan: GeometryPlan):
+    """
+    Resample img once into plan.output_size. img may be smaller than
+    plan.source_size (e.g. a JPEG decoded at reduced scale); coordinates are
+    scaled to match.
+    """
+    matrix = plan.matrix
+    if img.size != plan.source_size:
+        matrix = _mul(_scale(img.width / plan.source_size[0], img.height / plan.source_size[1]), matrix)
+    plan = GeometryPlan(img.size, plan.transposes, matrix, plan.output_size, plan.axis_aligned)
+
+    if plan.axis_aligned:
+        # Crop box + one antialiased resize in source orientation, then transpose the small result
+        out_w, out_h = plan.output_size
+        swapped = sum(1 for m in plan.transposes if m in SWAPS_AXES) % 2 == 1
+        size = (out_h, out_w) if swapped else (out_w, out_h)
+        box = tuple(round(v, 6) for v in plan.source_box())
+        out = img.resize(size, Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+        for method in plan.transposes:
+            out = out.transpose(method)
+        return out
+
+    # Rotated: box-reduce the needed region by an integer factor, then one bicubic affine pass
+    col_x = math.hypot(matrix[0][0], matrix[1][0])
+    col_y = math.hypot(matrix[0][1], matrix[1][1])
+    factor = int(min(col_x, col_y))
+    if factor >= 2:
+        left, top, right, bottom = plan.source_box()
+        margin = 2 * factor
+        box = (max(0, math.floor(left) - margin), max(0, math.floor(top) - margin),
+               min(img.width, math.ceil(right) + margin), min(img.height, math.ceil(bottom) + margin))
+        img = img.reduce(factor, box=box)
+        matrix = _mul(_scale(1 / factor, 1 / factor), _mul(_translate(-box[0], -box[1]), matrix))
+    data = (matrix[0][0], matrix[0][1], matrix[0][2], matrix[1][0], matrix[1][1], matrix[1][2])
+    return img.transform(plan.output_size, Image.Transform.AFFINE, data,
+                         resample=Image.Resampling.BICUBIC, fillcolor=(0, 0, 0))
+
+
+def render_reference(img, exposure: float = 0.0, rotation: int = 0, straighten: float = 0.0,
+                     scale: float = 1.0, max_size: int = 1600):
+    """
+    The original step-by-step pipeline (full-resolution transposes, rotate,
+    crops and exposure, then thumbnail). Kept for parity checks and as a
+    fallback (processing.fused_pipeline = false).
+    """
+    # 1. Orientation Fix (EXIF)
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # 2. Rotation (90° increments)
+    if rotation in ROTATION_TRANSPOSES:
+        img = img.transpose(ROTATION_TRANSPOSES[rotation])
+
+    # Store original dimensions after 90° rotation
+    orig_w, orig_h = img.width, img.height
+
+    # 3. Straighten (fine angle adjustment with proper crop)
+    if straighten != 0:
+        # PIL rotate() is counter-clockwise, but CSS rotate() is clockwise
+        img = img.rotate(-straighten, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=(0, 0, 0))
+        angle_rad = abs(math.radians(straighten))
+        crop_factor = math.cos(angle_rad) - math.sin(angle_rad) * min(orig_w / orig_h, orig_h / orig_w)
+        crop_factor = max(0.8, min(1.0, crop_factor))  # Clamp to reasonable range
+        new_w = int(orig_w * crop_factor)
+        new_h = int(orig_h * crop_factor)
+        left = (img.width - new_w) // 2
+        top = (img.height - new_h) // 2
+        img = img.crop((left, top, left + new_w, top + new_h))
+
+    # 4. Scale (zoom) - crop from center when zooming in
+    if scale != 1.0 and scale > 1.0:
+        crop_w = int(img.width / scale)
+        crop_h = int(img.height / scale)
+        left = (img.width - crop_w) // 2
+        top = (img.height - crop_h) // 2
+        img = img.crop((left, top, left + crop_w, top + crop_h))
+
+    # 5. Exposure Compensation
+    if exposure != 0.0:
+        img = ImageEnhance.Brightness(img).enhance(2 ** exposure)
+
+    # 6. Resize to max size
+    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    return img
@@ -0,0 +1,201 @@
+"""
+Responsive renditions of a published photo.
+
+process_image() renders and watermarks a photo once at max_size; every smaller
+size and extra format (WebP, optionally AVIF) is downscaled from that
+in-memory image, so the camera file is still decoded only once per publish.
+
+Files live next to the primary JPEG in the web folder:
+
+  <stem>.jpg                        primary (lightbox, download, legacy clients)
+  renditions/<stem>-<size>-<hash>.<ext>
+                                    e.g. renditions/IMG_0001-400-3fa85f64c2.webp
+  renditions/<stem>.json            sidecar: every rendition with its
+                                    dimensions, type and byte size, and "v",
+                                    a hash of the primary JPEG
+
+The manifest index and the R2 upload ledger read the sidecar to list the
+renditions in the versioned manifest; the gallery builds srcset from it.
+Rendition names carry a hash of their bytes because the CDN caches them as
+immutable: a later publish that reuses a freed primary name (IMG_0001_002.jpg
+after an unpublish) gets new rendition URLs instead of the old cached files.
+The primary keeps its name (downloads, legacy clients); galleries request it
+as <stem>.jpg?v=<v>, and only such versioned requests are cached as immutable.
+"""
+
+import io
+import os
+import json
+import hashlib
+import logging
+import warnings
+from PIL import Image, features
+
+from render_plan import fit_size
+from jpeg_encoder import save_jpeg
+from durable_write import write_bytes
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = "renditions"
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "sizes": [400, 800, 1600],    # Long edge in px; sizes above the primary collapse onto it
+    "formats": ["jpeg", "webp"],  # Any of "jpeg", "webp", "avif" (skipped if Pillow can't encode it)
+    "webp_quality": 80,
+    "avif_quality": 60,
+    "avif_speed": 8,              # 0 (smallest, very slow) - 10 (fastest); libavif's default 6 takes seconds at 1600px
+}
+
+# format -> (extension, MIME type, Pillow format)
+FORMATS = {
+    "jpeg": ("jpg", "image/jpeg", "JPEG"),
+    "webp": ("webp", "image/webp", "WEBP"),
+    "avif": ("avif", "image/avif", "AVIF"),
+}
+
+_supported = {}
+
+
+def format_supported(fmt: str) -> bool:
+    """Whether this Pillow build can encode fmt (AVIF needs Pillow >= 11.3 or pillow-avif-plugin)"""
+    if fmt not in _supported:
+        if fmt == "jpeg":
+            ok = True
+        elif fmt == "avif":
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # Older Pillow warns about the unknown feature
+                ok = bool(features.check("avif"))
+            if not ok:
+                try:
+                    import pillow_avif  # noqa: F401  Registers the AVIF encoder
+                    ok = True
+                except ImportError:
+                    pass
+        else:
+            ok = fmt in FORMATS and bool(features.check(fmt))
+        if not ok:
+            logger.warning(f"Rendition format '{fmt}' is not supported by this Pillow build, skipping it")
+        _supported[fmt] = ok
+    return _supported[fmt]
+
+
+def settings_from(config) -> dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get("renditions") or {})
+    return settings
+
+
+def sidecar_name(filename: str) -> str:
+    return f"{RENDITION_DIR}/{os.path.splitext(filename)[0]}.json"
+
+
+def content_version(data: bytes) -> str:
+    """Short content hash used in rendition names and the primary's ?v= query"""
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def rendition_name(filename: str, size: int, fmt: str, data: bytes) -> str:
+    """Content-addressed: the same bytes always get the same name, new bytes a new one"""
+    return f"{RENDITION_DIR}/{os.path.splitext(filename)[0]}-{size}-{content_version(data)}.{FORMATS[fmt][0]}"
+
+
+def _encode(img, fmt: str, settings: dict, jpeg_options: dict) -> bytes:
+    if fmt == "jpeg":
+        return save_jpeg(img, **jpeg_options)
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=settings["webp_quality"], method=4)
+    else:
+        img.save(buf, "AVIF", quality=settings["avif_quality"], speed=settings["avif_speed"])
+    return buf.getvalue()
+
+
+def write_renditions(img, dest_path: str, primary_data: bytes, settings: dict, jpeg_options: dict) -> dict:
+    """
+    Encode every configured size/format of the final (watermarked) image and
+    write the sidecar. The primary JPEG itself (dest_path, primary_data) is
+    listed as the largest JPEG rendition and versioned, but written by the caller.
+    Returns the sidecar dict.
+    """
+    folder, filename = os.path.split(dest_path)
+    os.makedirs(os.path.join(folder, RENDITION_DIR), exist_ok=True)
+
+    renditions = [{"src": filename, "width": img.width, "height": img.height,
+                   "type": "image/jpeg", "bytes": len(primary_data)}]
+    formats = [f for f in settings["formats"] if f in FORMATS and format_supported(f)]
+    long_edge = max(img.size)
+    for size in sorted({min(int(s), long_edge) for s in settings["sizes"]}, reverse=True):
+        scaled = img
+        if size < long_edge:
+            scaled = img.resize(fit_size(img.width, img.height, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            if fmt == "jpeg" and scaled is img:
+                continue  # That's the primary
+            data = _encode(scaled, fmt, settings, jpeg_options)
+            name = rendition_name(filename, size, fmt, data)
+            write_bytes(os.path.join(folder, name), data)
+            renditions.append({"src": name, "width": scaled.width, "height": scaled.height,
+                               "type": FORMATS[fmt][1], "bytes": len(data)})
+
+    meta = {"name": filename, "v": content_version(primary_data), "width": img.width, "height": img.height,
+            "renditions": renditions}
+    write_bytes(os.path.join(folder, sidecar_name(filename)),
+                json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+    return meta
+
+
+def load_sidecar(folder, filename: str):
+    """Sidecar dict for a published file, or None (published before renditions / by another tool)"""
+    try:
+        with open(os.path.join(folder, sidecar_name(filename)), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if isinstance(meta, dict) and meta.get("name") == filename else None
+
+
+def rendition_files(meta) -> list:
+    """Relative paths of the extra files behind a sidecar (not the primary, not the sidecar)"""
+    if not meta:
+        return []
+    return [r["src"] for r in meta.get("renditions", []) if r["src"] != meta["name"]]
+
+
+def rendition_stems(name: str) -> list:
+    """
+    Primary stems a renditions/ file may belong to, from its name alone:
+    <stem>.json, <stem>-<size>.<ext> or <stem>-<size>-<hash>.<ext>. Stems with
+    their own dashes give extra candidates; callers only use this to keep files.
+    """
+    base = os.path.splitext(os.path.basename(name))[0]
+    stems = [base]
+    for _ in range(2):
+        base, dash, _ = base.rpartition("-")
+        if not dash:
+            break
+        stems.append(base)
+    return stems
+
+
+def remove_renditions(folder, filename: str):
+    """Delete a published file's renditions and sidecar"""
+    meta = load_sidecar(folder, filename)
+    for name in rendition_files(meta) + [sidecar_name(filename)]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+    return meta
+
+
+def manifest_entry(filename: str, meta=None) -> dict:
+    """One photo in the versioned manifest: {"name"} plus primary version, dimensions and renditions when known"""
+    if not meta:
+        return {"name": filename}
+    entry = {"name": filename}
+    if meta.get("v"):
+        entry["v"] = meta["v"]  # Sidecars written before primaries were versioned have none
+    entry.update(width=meta["width"], height=meta["height"], renditions=meta["renditions"])
+    return entry
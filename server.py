@@ -1,8 +1,10 @@
+import io
 import os
 import json
 import shutil
 import logging
 import time
+import asyncio
 from typing import List, Optional
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, Body, Request, UploadFile, File, Form
@@ -11,7 +13,19 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from PIL import Image, ImageOps, ImageFilter, ImageEnhance, ImageDraw, ImageFont
+from image_processor import ImageProcessor
+from thumbnail_cache import ThumbnailCache
+from publish_engine import PublishEngine
+from manifest_index import ManifestIndex
+from history_store import HistoryStore
+from event_bus import EventBus
+from buffer_catalog import BufferCatalog
+from r2_uploader import create_uploader
+from r2_ledger import UploadLedger
+from remote_ops import RemoteOpsWorker
+from renditions import remove_renditions
+from source_proxy import ProxyCache
+import durable_write
 
 # Logger Setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,12 +38,37 @@ DEFAULT_CONFIG = {
     "trash_folder": "./photos_trash",     # Rejected
     "archive_folder": "./photos_archive", # Parked/Saved for later
     "assets_folder": "./assets",
-    "history_file": "history.json",
+    "history_file": "history.json",       # Legacy JSON history (migrated into history_db)
+    "history_db": "history.db",
+    "thumb_cache_folder": "./.thumb_cache",  # Derived previews for the admin UI
+    "thumb_cache_max_mb": 512,
     "max_size": 1600,
     "jpeg_quality": 85,
+    "jpeg_encoder": {  # Per-image quality search for published JPEGs (see jpeg_encoder.py)
+        "mode": "fixed",  # "fixed" (jpeg_quality), "size" (fit target_kb) or "ssim" (keep min_ssim)
+        "target_kb": 400,
+        "min_ssim": 0.985,
+        "max_kb": None,
+        "min_quality": 60,
+        "max_quality": 92,
+        "subsampling": "4:2:0",  # "4:4:4" keeps full chroma (red stage light, logos) at a size cost
+        "optimize": True
+    },
+    "publish_workers": 0,  # Publish worker processes (0 = CPU count - 1)
+    "source_cache_mb": 512,  # All workers together: decoded sources kept for republishing a frame (0 = off)
+    "renditions": {  # Responsive sizes/formats written next to each published photo (see renditions.py)
+        "enabled": True,
+        "sizes": [400, 800, 1600],  # Long edge in px
+        "formats": ["jpeg", "webp"],  # Add "avif" if this Pillow build can encode it
+        "webp_quality": 80,
+        "avif_quality": 60,
+        "avif_speed": 8
+    },
     "processing": {
         "sharpen": True,
         "progressive": True,
+        "fused_pipeline": True,  # Single-pass geometry resample (False = original step-by-step path)
+        "draft_decode": True,  # Decode JPEGs at reduced DCT scale when the output is much smaller
         "watermark": {
             "enabled": True,
             "type": "image",  # "image" or "text"
@@ -61,6 +100,10 @@ def load_config_file():
                         merged_config["processing"].update(file_config["processing"])
                     else:
                         merged_config["processing"] = file_config["processing"]
+                if "jpeg_encoder" in file_config:
+                    merged_config["jpeg_encoder"] = {**DEFAULT_CONFIG["jpeg_encoder"], **file_config["jpeg_encoder"]}
+                if "renditions" in file_config:
+                    merged_config["renditions"] = {**DEFAULT_CONFIG["renditions"], **file_config["renditions"]}
                 if "watermark" in file_config.get("processing", {}):
                     if merged_config["processing"].get("watermark"):
                         merged_config["processing"]["watermark"].update(file_config["processing"]["watermark"])
@@ -74,326 +117,65 @@ def load_config_file():
 # Load config from file (will use DEFAULT_CONFIG if file doesn't exist)
 CONFIG = load_config_file()
 
-# Ensure directories exist
+# Ensure directories exist (the static mounts below need them at import)
 for folder in [CONFIG["buffer_folder"], CONFIG["web_folder"], CONFIG["trash_folder"], CONFIG["archive_folder"]]:
     os.makedirs(folder, exist_ok=True)
 
-# --- History Management ---
-def load_history():
-    if os.path.exists(CONFIG["history_file"]):
-        try:
-            with open(CONFIG["history_file"], "r") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load history file: {e}")
-            return {}
-    return {}
+# --- Services ---
+# Created by init_services() in the first startup hook, not at import time:
+# publish workers are spawned processes, and when the server is launched as
+# `python server.py` each worker re-imports this file as __mp_main__. Import
+# must stay cheap there (no history DB, thumbnail cache scan or watermark load).
+history_store = None    # HistoryStore: SQLite; history.json is imported once on first start
+processor = None        # ImageProcessor for /api/preview (publishes run in the worker pool)
+thumb_cache = None      # ThumbnailCache: admin UI previews (never ship camera originals to the browser)
+preview_proxies = None  # ProxyCache: decoded low-res sources of the photos open in the editor
+buffer_catalog = None   # BufferCatalog: watched camera folder, EXIF read once, sorted by capture time
+
+# Long edge of the preview proxies: a 1.5x zoom crop still covers a 1024px preview
+PREVIEW_PROXY_SIZE = 1600
+
+def init_services():
+    """Create the server-side services (once, in the server process)"""
+    global history_store, processor, thumb_cache, preview_proxies, buffer_catalog
+    if history_store is not None:
+        return
+    history_store = HistoryStore(CONFIG["history_db"], legacy_json_path=CONFIG["history_file"])
+    processor = ImageProcessor(CONFIG)
+    thumb_cache = ThumbnailCache(CONFIG["thumb_cache_folder"], CONFIG["thumb_cache_max_mb"] * 1024 * 1024)
+    preview_proxies = ProxyCache(PREVIEW_PROXY_SIZE, 32 * 1024 * 1024)
+    buffer_catalog = BufferCatalog(CONFIG["buffer_folder"])
+    buffer_catalog.add_listener(on_buffer_change)
 
-def save_history(history):
-    try:
-        with open(CONFIG["history_file"], "w") as f:
-            json.dump(history, f, indent=2)
-    except Exception as e:
-        logger.error(f"Failed to save history file: {e}")
+# --- History Management ---
 
 def update_history(filename, action):
     """
     action: 'publish' or 'unpublish'
     """
-    history = load_history()
-    # Ensure filename is consistent (e.g., always .jpg for web)
-    name, ext = os.path.splitext(filename)
-    processed_filename = name + ".jpg"
+    update_history_many([filename], action)
 
-    if processed_filename not in history:
-        history[processed_filename] = {"published": 0, "unpublished": 0}
-    
-    if action == "publish":
-        history[processed_filename]["published"] += 1
-    elif action == "unpublish":
-        history[processed_filename]["unpublished"] += 1
-        
-    save_history(history)
+def update_history_many(filenames, action):
+    """Apply the same action to several files in a single transaction"""
+    try:
+        history_store.record(filenames, action)
+    except Exception as e:
+        logger.error(f"Failed to update history: {e}")
 
 def get_file_history(filename):
-    history = load_history()
-    name, ext = os.path.splitext(filename)
-    processed_filename = name + ".jpg"
-    return history.get(processed_filename, {"published": 0, "unpublished": 0})
-
-# --- Image Processor Logic (Integrated) ---
-class ImageProcessor:
-    def __init__(self, config):
-        self.config = config
-        self.watermark_img = None
-        self.load_assets()
-
-    def load_assets(self):
-        wm_conf = self.config['processing']['watermark']
-        if wm_conf['enabled']:
-            if wm_conf.get('type', 'image') == 'image' and os.path.exists(wm_conf.get('image_path', '')):
-                try:
-                    self.watermark_img = Image.open(wm_conf['image_path']).convert("RGBA")
-                    logger.info("Watermark image loaded successfully.")
-                except Exception as e:
-                    logger.error(f"Failed to load watermark image: {e}")
-            # Text watermark doesn't need pre-loading
-
-    def process_image(self, source_path: str, dest_path: str, exposure: float = 0.0,
-                       rotation: int = 0, straighten: float = 0.0, scale: float = 1.0):
-        """
-        Applies edits (exposure, rotation, straighten, scale) and watermark to an image and saves it.
-
-        Args:
-            rotation: 90° increments (0, 90, 180, 270)
-            straighten: Fine angle adjustment (-5 to +5 degrees), will crop to remove black edges
-            scale: Zoom level (1.0 = 100%, >1.0 = zoom in with center crop)
-        """
-        import math
+    return history_store.get(filename)
 
-        if not os.path.exists(source_path):
-            raise FileNotFoundError(f"Source file not found: {source_path}")
+# Publish jobs run in a pool of warm worker processes, off the event loop
+publish_engine = PublishEngine(CONFIG, CONFIG.get("publish_workers", 0))
 
-        try:
-            with Image.open(source_path) as img:
-                # 1. Orientation Fix (EXIF)
-                img = ImageOps.exif_transpose(img)
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-
-                # 2. Rotation (90° increments)
-                if rotation == 90:
-                    img = img.transpose(Image.Transpose.ROTATE_270)  # PIL rotates counter-clockwise
-                elif rotation == 180:
-                    img = img.transpose(Image.Transpose.ROTATE_180)
-                elif rotation == 270:
-                    img = img.transpose(Image.Transpose.ROTATE_90)
-
-                # Store original dimensions after 90° rotation
-                orig_w, orig_h = img.width, img.height
-
-                # 3. Straighten (fine angle adjustment with proper crop)
-                if straighten != 0:
-                    # PIL rotate() is counter-clockwise, but CSS rotate() is clockwise
-                    # Negate the angle to match preview direction
-                    pil_angle = -straighten
-                    logger.info(f"   🔄 Applying straighten: {straighten}° (PIL angle: {pil_angle}°)")
-                    logger.info(f"      Before rotate: {img.width}x{img.height}")
-                    img = img.rotate(pil_angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=(0,0,0))
-                    logger.info(f"      After rotate: {img.width}x{img.height}")
-
-                    # Calculate the largest inscribed rectangle after rotation
-                    # to crop out the black edges
-                    angle_rad = abs(math.radians(straighten))
-                    cos_a = math.cos(angle_rad)
-                    sin_a = math.sin(angle_rad)
-
-                    # For small angles, calculate crop dimensions
-                    # The inscribed rectangle formula for rotated image
-                    if orig_w > orig_h:
-                        # Landscape
-                        new_w = int(orig_w * cos_a - orig_h * sin_a)
-                        new_h = int(orig_h * cos_a - orig_w * sin_a)
-                    else:
-                        # Portrait
-                        new_w = int(orig_w * cos_a - orig_h * sin_a)
-                        new_h = int(orig_h * cos_a - orig_w * sin_a)
-
-                    # Ensure positive dimensions (use simpler formula for small angles)
-                    # For angles < 10°, approximate: crop factor ≈ 1 - tan(angle) * aspect_adjustment
-                    crop_factor = cos_a - sin_a * min(orig_w/orig_h, orig_h/orig_w)
-                    crop_factor = max(0.8, min(1.0, crop_factor))  # Clamp to reasonable range
-
-                    new_w = int(orig_w * crop_factor)
-                    new_h = int(orig_h * crop_factor)
-
-                    # Center crop
-                    left = (img.width - new_w) // 2
-                    top = (img.height - new_h) // 2
-                    right = left + new_w
-                    bottom = top + new_h
-
-                    logger.info(f"      Crop: ({left},{top}) to ({right},{bottom}) -> {new_w}x{new_h}")
-                    img = img.crop((left, top, right, bottom))
-                    logger.info(f"      After crop: {img.width}x{img.height}")
-
-                # 4. Scale (zoom) - crop from center when zooming in
-                if scale != 1.0 and scale > 0.5:
-                    if scale > 1.0:
-                        # Zoom in: crop a smaller region from center
-                        crop_w = int(img.width / scale)
-                        crop_h = int(img.height / scale)
-                        left = (img.width - crop_w) // 2
-                        top = (img.height - crop_h) // 2
-                        right = left + crop_w
-                        bottom = top + crop_h
-                        img = img.crop((left, top, right, bottom))
-                    else:
-                        # Zoom out (scale < 1.0): just resize smaller, will be handled by thumbnail later
-                        pass
-
-                # 5. Exposure Compensation
-                brightness_factor = 2 ** exposure
-                if exposure != 0.0:
-                    enhancer = ImageEnhance.Brightness(img)
-                    img = enhancer.enhance(brightness_factor)
-
-                # 6. Resize to max size
-                max_size = self.config["max_size"]
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-
-                # 7. Sharpen
-                if self.config["processing"]["sharpen"]:
-                    img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
-
-                # 8. Watermark
-                img = self._apply_watermark(img)
-
-                # 9. Save
-                img.save(
-                    dest_path,
-                    "JPEG",
-                    quality=self.config["jpeg_quality"],
-                    optimize=True,
-                    progressive=self.config["processing"]["progressive"]
-                )
+# Published photos, kept in memory and updated incrementally (loaded on startup)
+manifest_index = ManifestIndex(CONFIG["web_folder"])
+LIVE_RECONCILE_INTERVAL = 30  # seconds between cheap folder checks for files written by other tools
+_last_live_reconcile = 0.0
 
-                logger.info(f"Processed: {os.path.basename(source_path)} -> {dest_path} "
-                           f"(Exp:{exposure}, Rot:{rotation}, Str:{straighten}, Scale:{scale})")
-                return True
-
-        except Exception as e:
-            logger.error(f"Processing failed for {source_path}: {e}")
-            raise e
-
-    def _apply_watermark(self, img):
-        wm_conf = self.config['processing']['watermark']
-        if not wm_conf.get('enabled', False):
-            return img
-        
-        watermark_type = wm_conf.get('type', 'image')
-        margin = wm_conf.get('margin', 50)
-        position = wm_conf.get('position', 'bottom-right')
-        
-        img_rgba = img.convert("RGBA")
-        
-        if watermark_type == 'text':
-            # Text watermark
-            text = wm_conf.get('text', '')
-            if not text:
-                return img_rgba.convert("RGB")
-            
-            # Create text image
-            font_size = wm_conf.get('text_font_size', 24)
-            text_color = tuple(wm_conf.get('text_color', (255, 255, 255, 200)))
-            
-            try:
-                # Try to load a font that supports Chinese characters
-                # macOS system fonts that support Chinese
-                font_paths = [
-                    "/System/Library/Fonts/PingFang.ttc",  # PingFang (supports Chinese)
-                    "/System/Library/Fonts/STHeiti Light.ttc",  # STHeiti (supports Chinese)
-                    "/System/Library/Fonts/STHeiti Medium.ttc",
-                    "/System/Library/Fonts/Helvetica.ttc",
-                    "/System/Library/Fonts/Arial.ttf",
-                ]
-                font = None
-                for font_path in font_paths:
-                    try:
-                        if font_path.endswith('.ttc'):
-                            # TTC files may contain multiple fonts, try index 0
-                            font = ImageFont.truetype(font_path, font_size, index=0)
-                            break
-                        else:
-                            font = ImageFont.truetype(font_path, font_size)
-                            break
-                    except:
-                        continue
-                if font is None:
-                    font = ImageFont.load_default()
-            except:
-                font = ImageFont.load_default()
-            
-            # Create a temporary image to measure text size
-            temp_img = Image.new('RGBA', (1, 1))
-            temp_draw = ImageDraw.Draw(temp_img)
-            bbox = temp_draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            # Create text image with background
-            text_img = Image.new('RGBA', (text_width + 20, text_height + 10), (0, 0, 0, 0))
-            text_draw = ImageDraw.Draw(text_img)
-            text_draw.text((10, 5), text, font=font, fill=text_color)
-            
-            # Calculate position
-            x, y = self._calculate_watermark_position(img.width, img.height, text_width + 20, text_height + 10, position, margin)
-            
-            # Composite text watermark
-            img_rgba.alpha_composite(text_img, (x, y))
-            
-        elif watermark_type == 'image' and self.watermark_img:
-            # Image watermark
-            wm = self.watermark_img.copy()
-            
-            # Scale
-            scale = wm_conf.get('scale_percentage', 20) / 100
-            target_wm_width = int(min(img.size) * scale)
-            wm_ratio = target_wm_width / wm.width
-            new_wm_size = (int(wm.width * wm_ratio), int(wm.height * wm_ratio))
-            wm = wm.resize(new_wm_size, Image.Resampling.LANCZOS)
-            
-            # Opacity
-            opacity = wm_conf.get('opacity', 0.8)
-            if opacity < 1.0:
-                alpha = wm.split()[3]
-                alpha = ImageEnhance.Brightness(alpha).enhance(opacity)
-                wm.putalpha(alpha)
-            
-            # Calculate position
-            x, y = self._calculate_watermark_position(img.width, img.height, wm.width, wm.height, position, margin)
-            
-            # Composite image watermark
-            img_rgba.alpha_composite(wm, (x, y))
-        
-        return img_rgba.convert("RGB")
-    
-    def _calculate_watermark_position(self, img_width, img_height, wm_width, wm_height, position, margin):
-        """Calculate watermark position based on position string"""
-        if position == "bottom-right":
-            x = img_width - wm_width - margin
-            y = img_height - wm_height - margin
-        elif position == "bottom-left":
-            x = margin
-            y = img_height - wm_height - margin
-        elif position == "top-right":
-            x = img_width - wm_width - margin
-            y = margin
-        elif position == "top-left":
-            x = margin
-            y = margin
-        elif position == "center":
-            x = (img_width - wm_width) // 2
-            y = (img_height - wm_height) // 2
-        elif position == "top-center":
-            x = (img_width - wm_width) // 2
-            y = margin
-        elif position == "bottom-center":
-            x = (img_width - wm_width) // 2
-            y = img_height - wm_height - margin
-        else:
-            # Default to bottom-right
-            x = img_width - wm_width - margin
-            y = img_height - wm_height - margin
-        
-        # Safety bounds
-        x = max(0, min(x, img_width - wm_width))
-        y = max(0, min(y, img_height - wm_height))
-        
-        return x, y
-
-# Initialize Processor
-processor = ImageProcessor(CONFIG)
+# Push updates to the admin dashboards (/api/events) instead of having them poll
+event_bus = EventBus()
+STATUS_CHECK_INTERVAL = 10  # seconds between sync-script checks
 
 # --- FastAPI App ---
 app = FastAPI(title="Live Photo Command Center")
@@ -407,34 +189,113 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Custom endpoint for live images with no-cache headers
+@app.on_event("startup")
+async def start_services():
+    await asyncio.to_thread(init_services)
+
+@app.on_event("startup")
+async def start_publish_engine():
+    publish_engine.start()
+
+@app.on_event("startup")
+async def load_manifest_index():
+    manifest_index.load()
+
+@app.on_event("shutdown")
+async def stop_publish_engine():
+    publish_engine.shutdown()
+
+@app.on_event("startup")
+async def start_event_bus():
+    event_bus.bind(asyncio.get_running_loop())
+    asyncio.get_running_loop().create_task(monitor_sync_status())
+
+@app.on_event("startup")
+async def start_buffer_catalog():
+    buffer_catalog.start()
+
+@app.on_event("shutdown")
+async def stop_buffer_catalog():
+    buffer_catalog.stop()
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """If-None-Match check: "*", a comma-separated list, weak (W/) validators compare equal"""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+# Published images for the admin live grid: revalidated on every poll, re-sent only when changed
 @app.get("/live/{filename:path}")
-async def serve_live_image(filename: str):
-    """Serve live images with no-cache headers to ensure updates are visible"""
+async def serve_live_image(filename: str, request: Request):
+    """
+    Serve a published image (or rendition). The ETag comes from the file's
+    mtime and size (publishes replace files by rename, so any change moves
+    both), unchanged files answer If-None-Match with a 304, and bodies are
+    streamed from disk by FileResponse (Range / If-Range supported).
+    """
+    from fastapi.responses import FileResponse, Response
+
+    web_root = os.path.abspath(CONFIG["web_folder"])
+    file_path = os.path.abspath(os.path.join(web_root, filename))
+    if not file_path.startswith(web_root + os.sep) or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    stat = os.stat(file_path)
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, headers=headers, stat_result=stat)
+
+@app.get("/thumb/{filename:path}")
+def serve_thumbnail(filename: str, request: Request, w: int = 400):
+    """Serve a cached, downscaled preview of a buffer image (sync def: runs in threadpool)"""
+    from fastapi.responses import FileResponse, Response
+
+    buffer_root = os.path.abspath(CONFIG["buffer_folder"])
+    source_path = os.path.abspath(os.path.join(buffer_root, filename))
+    if not source_path.startswith(buffer_root + os.sep) or not os.path.isfile(source_path):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    try:
+        thumb_path, key = thumb_cache.get(source_path, w)
+    except Exception as e:
+        logger.error(f"Thumbnail failed for {filename}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # The key already encodes source mtime/size, so it doubles as a strong ETag
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(thumb_path, media_type="image/jpeg", headers=headers)
+
+@app.get("/api/preview")
+def preview_image(filename: str, exposure: float = 0.0, rotation: int = 0, straighten: float = 0.0,
+                  scale: float = 1.0, w: int = 1024):
+    """Render the publish pipeline on a cached proxy of a buffer image (sync def: runs in threadpool)"""
     from fastapi.responses import Response
-    import time
 
-    file_path = os.path.join(CONFIG["web_folder"], filename)
-    if not os.path.exists(file_path):
+    buffer_root = os.path.abspath(CONFIG["buffer_folder"])
+    source_path = os.path.abspath(os.path.join(buffer_root, filename))
+    if not source_path.startswith(buffer_root + os.sep) or not os.path.isfile(source_path):
         raise HTTPException(status_code=404, detail="Image not found")
 
-    # Read file content directly to bypass FileResponse caching
-    with open(file_path, "rb") as f:
-        content = f.read()
-
-    # Use current timestamp as ETag to force browser to fetch fresh content
-    etag = f'"{int(time.time() * 1000)}"'
-
-    return Response(
-        content=content,
-        media_type="image/jpeg",
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0",
-            "ETag": etag
-        }
-    )
+    start = time.perf_counter()
+    try:
+        proxy = preview_proxies.get(source_path)
+        img = processor.render_preview(proxy, exposure, rotation % 360, straighten, scale,
+                                       max(200, min(w, PREVIEW_PROXY_SIZE)))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=85)
+    except Exception as e:
+        logger.error(f"Preview failed for {filename}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return Response(content=buf.getvalue(), media_type="image/jpeg",
+                    headers={"Cache-Control": "no-store", "X-Render-Time": f"{elapsed_ms:.0f}ms"})
 
 # Static Mounts
 app.mount("/raw", StaticFiles(directory=CONFIG["buffer_folder"]), name="raw")
@@ -458,6 +319,9 @@ class RejectRequest(BaseModel):
 class BatchPublishRequest(BaseModel):
     filenames: List[str]
     exposure: float = 0.0
+    rotation: int = 0
+    straighten: float = 0.0
+    scale: float = 1.0
 
 class ArchiveRequest(BaseModel):
     filename: str
@@ -493,48 +357,9 @@ class FolderSettingsRequest(BaseModel):
 
 # Helpers
 def update_manifest():
-    """Generates manifest.json for the frontend"""
+    """Writes manifest.json for the frontend from the in-memory manifest index"""
     try:
-        folder = CONFIG["web_folder"]
-        if not os.path.exists(folder):
-            logger.warning(f"Web folder does not exist: {folder}")
-            return
-        
-        # Only include files that actually exist, are valid image files, and are readable
-        files = []
-        for f in os.listdir(folder):
-            # Skip macOS hidden files (._ prefix), .DS_Store, and manifest.json
-            if f.startswith('._') or f == '.DS_Store' or f == 'manifest.json':
-                continue
-            
-            if f.lower().endswith(('.jpg', '.jpeg', '.png')) and f != 'manifest.json':
-                file_path = os.path.join(folder, f)
-                # Ensure it's a file, not a directory, and is readable
-                if os.path.isfile(file_path) and os.access(file_path, os.R_OK):
-                    # Verify file size > 0 (not empty/corrupted)
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        if file_size > 0:
-                            # Try to verify it's a valid image by checking if PIL can open it
-                            try:
-                                with Image.open(file_path) as img:
-                                    img.verify()  # Verify it's a valid image
-                                files.append(f)
-                            except Exception as img_error:
-                                logger.warning(f"Skipping invalid image file: {f} ({img_error})")
-                                continue
-                        else:
-                            logger.warning(f"Skipping empty file: {f}")
-                    except Exception as e:
-                        logger.warning(f"Error checking file {f}: {e}")
-                        continue
-        
-        # Sort by modification time (newest first)
-        files.sort(key=lambda x: os.path.getmtime(os.path.join(folder, x)), reverse=True)
-        
-        manifest_path = os.path.join(folder, 'manifest.json')
-        with open(manifest_path, 'w', encoding='utf-8') as f:
-            json.dump(files, f, ensure_ascii=False, indent=2)
+        files = manifest_index.write_manifest()
         logger.info(f"Manifest updated: {len(files)} photos")
     except Exception as e:
         logger.error(f"Manifest update failed: {e}")
@@ -553,105 +378,125 @@ async def gallery():
     except Exception as e:
         return f"Error loading gallery: {e}"
 
+def buffer_items(entries):
+    """Metadata rows for buffer catalog entries (as listed by /api/buffer)"""
+    histories = history_store.get_many([entry["filename"] for entry in entries])  # One batched lookup
+    files = []
+    for entry in entries:
+        f = entry["filename"]
+        # Capture time from EXIF (falls back to mtime when the file has none)
+        ts = entry["capture_time"]
+
+        hist = histories[f]  # History for buffer files
+
+        files.append({
+            "filename": f,
+            "timestamp": ts,
+            "time_str": datetime.fromtimestamp(ts).strftime('%H:%M:%S'),
+            "size_kb": round(entry["size"] / 1024, 1),
+            "camera": entry["camera"],
+            "width": entry["width"],
+            "height": entry["height"],
+            "published_count": hist["published"],
+            "unpublished_count": hist["unpublished"]
+        })
+    return files
+
+def live_items(entries):
+    """Metadata rows for published files (as listed by /api/live)"""
+    histories = history_store.get_many([entry["filename"] for entry in entries])
+    files = []
+    for entry in entries:
+        f = entry["filename"]
+        ts = entry["mtime"]
+
+        # Get History
+        hist = histories[f]
+
+        files.append({
+            "filename": f,
+            "timestamp": ts,
+            "time_str": datetime.fromtimestamp(ts).strftime('%H:%M:%S'),
+            "size_kb": round(entry["size"] / 1024, 1),
+            "published_count": hist["published"],
+            "unpublished_count": hist["unpublished"]
+        })
+    return files
+
 @app.get("/api/buffer")
-async def get_buffer_images():
-    """List images in Camera Buffer with metadata"""
+async def get_buffer_images(cursor: Optional[str] = None, limit: int = 0):
+    """
+    List images in Camera Buffer with metadata, newest capture first, served
+    from the ingest catalog. Pass limit (and the returned next_cursor) to page.
+    """
     try:
-        folder = CONFIG["buffer_folder"]
-        files = []
-        for f in os.listdir(folder):
-            # Skip macOS hidden files (._ prefix) and .DS_Store
-            if f.startswith('._') or f == '.DS_Store' or f.startswith('.'):
-                continue
-            if f.lower().endswith(('.jpg', '.jpeg', '.png')):
-                path = os.path.join(folder, f)
-                stat = os.stat(path)
-                # Use modification time as a proxy for capture time if simple
-                ts = stat.st_mtime
-                
-                hist = get_file_history(f) # Get history for buffer files
-                
-                files.append({
-                    "filename": f,
-                    "timestamp": ts,
-                    "time_str": datetime.fromtimestamp(ts).strftime('%H:%M:%S'),
-                    "size_kb": round(stat.st_size / 1024, 1),
-                    "published_count": hist["published"],
-                    "unpublished_count": hist["unpublished"]
-                })
-        
-        # Sort by timestamp (newest first)
-        files.sort(key=lambda x: x["timestamp"], reverse=True)
-        return {"images": files}
+        entries, next_cursor = buffer_catalog.page(cursor, max(0, limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return {
+            "images": buffer_items(entries),
+            "next_cursor": next_cursor,
+            "total": len(buffer_catalog),
+            "ready": buffer_catalog.ready
+        }
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-@app.get("/api/status")
-async def get_system_status():
-    """Get system status including sync script status"""
+def is_sync_running() -> bool:
+    """Check if sync_to_r2.py is running"""
     import subprocess
-
-    # Check if sync_to_r2.py is running
-    sync_running = False
     try:
         result = subprocess.run(
             ["pgrep", "-f", "sync_to_r2.py"],
             capture_output=True, text=True, timeout=2
         )
-        sync_running = result.returncode == 0
+        return result.returncode == 0
     except:
-        pass
+        return False
 
+@app.get("/api/status")
+async def get_system_status():
+    """Get system status including sync script status"""
     return {
         "server": True,  # If this endpoint responds, server is running
-        "sync": sync_running,
+        "sync": is_sync_running(),
         "web_folder": CONFIG["web_folder"],
-        "buffer_folder": CONFIG["buffer_folder"]
+        "buffer_folder": CONFIG["buffer_folder"],
+        "publish": publish_engine.stats(),
+        "events": event_bus.stats(),
+        "remote_ops": remote_ops.stats()
     }
 
 
 @app.get("/api/live")
 async def get_live_images():
-    """List images in Web Public folder with metadata"""
+    """List images in Web Public folder with metadata (served from the manifest index)"""
+    global _last_live_reconcile
     try:
-        folder = CONFIG["web_folder"]
-        files = []
-        for f in os.listdir(folder):
-            if f.lower().endswith(('.jpg', '.jpeg', '.png')) and not f.startswith('.'):
-                path = os.path.join(folder, f)
-                stat = os.stat(path)
-                ts = stat.st_mtime
-                
-                # Get History
-                hist = get_file_history(f)
-                
-                files.append({
-                    "filename": f,
-                    "timestamp": ts,
-                    "time_str": datetime.fromtimestamp(ts).strftime('%H:%M:%S'),
-                    "size_kb": round(stat.st_size / 1024, 1),
-                    "published_count": hist["published"],
-                    "unpublished_count": hist["unpublished"]
-                })
-        
-        # Sort by timestamp (newest first)
-        files.sort(key=lambda x: x["timestamp"], reverse=True)
-        return {"images": files}
+        if time.time() - _last_live_reconcile > LIVE_RECONCILE_INTERVAL:
+            manifest_index.reconcile()
+            _last_live_reconcile = time.time()
+
+        # Index entries are already sorted newest first
+        return {"images": live_items(manifest_index.entries())}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-def get_next_publish_filename(base_name: str, web_folder: str) -> str:
+def get_next_publish_filename(base_name: str, web_folder: str, reserved=()) -> str:
     """
     Generate sequential filename for multiple publishes of the same source.
     First publish: 15D_7109.jpg
     Second publish: 15D_7109_002.jpg
     Third publish: 15D_7109_003.jpg
+
+    reserved: names already claimed by in-flight publish jobs (not on disk yet)
     """
     import re
 
     # Check existing files with same base name
     existing_files = []
-    for f in os.listdir(web_folder):
+    for f in list(os.listdir(web_folder)) + list(reserved):
         # Skip macOS hidden files (._ prefix) and .DS_Store
         if f.startswith('._') or f == '.DS_Store':
             continue
@@ -680,15 +525,26 @@ def get_next_publish_filename(base_name: str, web_folder: str) -> str:
     return f"{base_name}_{next_seq:03d}.jpg"
 
 
+def publish_event(jobs):
+    """Tell dashboards about finished publishes (new live rows + updated source history)"""
+    entries = [manifest_index.get(job["published_as"]) for job in jobs]
+    sources = [job["source"] for job in jobs]
+    event_bus.publish("published", {
+        "images": live_items([e for e in entries if e]),
+        "history": history_store.get_many(sources),
+    })
+
 @app.post("/api/publish")
 async def publish_image(req: PublishRequest):
-    """Action: Buffer -> Process -> Web"""
+    """Action: Buffer -> Process -> Web (queued; poll /api/jobs/{job_id} for completion)"""
     try:
         source_path = os.path.join(CONFIG["buffer_folder"], req.filename)
+        if not os.path.exists(source_path):
+            raise HTTPException(status_code=404, detail="File not found")
         name, ext = os.path.splitext(req.filename)
 
         # Generate sequential filename if same source published multiple times
-        dest_filename = get_next_publish_filename(name, CONFIG["web_folder"])
+        dest_filename = get_next_publish_filename(name, CONFIG["web_folder"], publish_engine.reserved)
         dest_path = os.path.join(CONFIG["web_folder"], dest_filename)
 
         # Debug log to verify parameters
@@ -696,65 +552,138 @@ async def publish_image(req: PublishRequest):
         logger.info(f"   └─ Exposure={req.exposure}, Rotation={req.rotation}, Straighten={req.straighten}, Scale={req.scale}")
         logger.info(f"   └─ Output: {dest_filename}")
 
-        processor.process_image(
+        def on_published(job):
+            # Update History (track source filename)
+            update_history(req.filename, "publish")
+            # The worker already verified the output, no need to re-open it
+            manifest_index.add(job["published_as"], verify=False)
+            update_manifest()
+            publish_event([job])
+
+        job = publish_engine.submit(
             source_path, dest_path,
-            exposure=req.exposure,
-            rotation=req.rotation,
-            straighten=req.straighten,
-            scale=req.scale
+            {
+                "exposure": req.exposure,
+                "rotation": req.rotation,
+                "straighten": req.straighten,
+                "scale": req.scale
+            },
+            on_done=on_published
         )
-
-        # Verify file was written and is valid
-        if not os.path.exists(dest_path):
-            logger.error(f"   ❌ File NOT found after save: {dest_path}")
-            raise HTTPException(status_code=500, detail=f"Failed to save processed image: {dest_path}")
-        
-        file_size = os.path.getsize(dest_path)
-        if file_size == 0:
-            logger.error(f"   ❌ File is empty: {dest_path}")
-            os.remove(dest_path)  # Remove empty file
-            raise HTTPException(status_code=500, detail="Processed image file is empty")
-        
-        # Verify it's a valid image
-        try:
-            with Image.open(dest_path) as img:
-                img.verify()
-        except Exception as img_error:
-            logger.error(f"   ❌ Invalid image file: {img_error}")
-            os.remove(dest_path)  # Remove invalid file
-            raise HTTPException(status_code=500, detail=f"Invalid image file: {img_error}")
-        
-        logger.info(f"   ✅ File saved: {dest_filename} ({file_size/1024:.1f}KB)")
-
-        # Update History (track source filename)
-        update_history(req.filename, "publish")
-
-        update_manifest()
         # Return both source and published filename
-        return {"status": "success", "filename": req.filename, "published_as": dest_filename}
+        return {"status": "queued", "job_id": job["id"], "filename": req.filename, "published_as": dest_filename}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status of a queued publish job"""
+    job = publish_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.post("/api/batch_publish")
 async def batch_publish_images(req: BatchPublishRequest):
-    """Publish multiple images at once"""
-    success_count = 0
+    """
+    Publish multiple images at once. Jobs fan out across the worker pool;
+    follow progress on /api/batches/{batch_id}/events (Server-Sent Events).
+    """
+    edits = {
+        "exposure": req.exposure,
+        "rotation": req.rotation,
+        "straighten": req.straighten,
+        "scale": req.scale
+    }
+    items = []
     errors = []
-    
+    claimed = set(publish_engine.reserved)
     for fname in req.filenames:
-        try:
-            source_path = os.path.join(CONFIG["buffer_folder"], fname)
-            name, ext = os.path.splitext(fname)
-            dest_path = os.path.join(CONFIG["web_folder"], name + ".jpg") # Ensure .jpg for web
+        source_path = os.path.join(CONFIG["buffer_folder"], fname)
+        if not os.path.exists(source_path):
+            errors.append(f"{fname}: File not found")
+            continue
+        name, ext = os.path.splitext(fname)
+        # Same sequential naming as single publish (never overwrite earlier publishes)
+        dest_filename = get_next_publish_filename(name, CONFIG["web_folder"], claimed)
+        claimed.add(dest_filename)
+        items.append((source_path, os.path.join(CONFIG["web_folder"], dest_filename), edits))
+
+    def on_batch_done(batch, jobs):
+        # One coalesced history + manifest write for the whole batch
+        published = [job for job in jobs if job["status"] == "done"]
+        if published:
+            update_history_many([job["source"] for job in published], "publish")
+            for job in published:
+                manifest_index.add(job["published_as"], verify=False)
+            update_manifest()
+            publish_event(published)
 
-            processor.process_image(source_path, dest_path, req.exposure)
-            update_history(fname, "publish")
-            success_count += 1
+    batch = publish_engine.submit_batch(items, on_batch_done=on_batch_done)
+    logger.info(f"📦 Batch publish: {len(items)} queued, {len(errors)} skipped")
+    return {"status": "queued", "batch_id": batch["id"], "total": batch["total"], "errors": errors}
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Status of a batch publish"""
+    batch = publish_engine.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@app.get("/api/batches/{batch_id}/events")
+async def stream_batch_events(batch_id: str):
+    """Server-Sent Events: one 'item' event per finished photo, then 'complete'"""
+    from fastapi.responses import StreamingResponse
+
+    if publish_engine.get_batch(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    async def event_stream():
+        async for event in publish_engine.batch_events(batch_id):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """
+    Server-Sent Events for the admin dashboard: buffer-added, buffer-removed,
+    published, unpublished, archived, rejected, status (and resync if the
+    client missed too much and should reload its lists)
+    """
+    from fastapi.responses import StreamingResponse
+
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return StreamingResponse(event_bus.stream(last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def on_buffer_change(event_type, payload):
+    """Buffer catalog listener (runs on the catalog thread)"""
+    if event_type == "buffer-added":
+        event_bus.publish("buffer-added", {"images": buffer_items(payload)})
+    else:
+        event_bus.publish("buffer-removed", {"filenames": payload})
+
+async def monitor_sync_status():
+    """One sync-script check for all dashboards; pushes a status event only when it changes"""
+    sync_running = None
+    while True:
+        try:
+            running = await asyncio.to_thread(is_sync_running)
+            if running != sync_running:
+                sync_running = running
+                event_bus.publish("status", {"server": True, "sync": running})
         except Exception as e:
-            errors.append(f"{fname}: {str(e)}")
-            
-    update_manifest()
-    return {"status": "completed", "success": success_count, "errors": errors}
+            logger.warning(f"Sync status check error: {e}")
+        await asyncio.sleep(STATUS_CHECK_INTERVAL)
 
 @app.post("/api/archive")
 async def archive_image(req: ArchiveRequest):
@@ -764,6 +693,8 @@ async def archive_image(req: ArchiveRequest):
         dst = os.path.join(CONFIG["archive_folder"], req.filename)
         if os.path.exists(src):
             shutil.move(src, dst)
+            buffer_catalog.discard(req.filename)
+            event_bus.publish("archived", {"filename": req.filename})
             return {"status": "archived", "filename": req.filename}
         else:
             raise HTTPException(status_code=404, detail="File not found")
@@ -778,110 +709,32 @@ async def reject_image(req: RejectRequest):
         dst = os.path.join(CONFIG["trash_folder"], req.filename)
         if os.path.exists(src):
             shutil.move(src, dst)
+            buffer_catalog.discard(req.filename)
+            event_bus.publish("rejected", {"filename": req.filename})
             return {"status": "rejected", "filename": req.filename}
         else:
             raise HTTPException(status_code=404, detail="File not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def sync_delete_to_r2(filename: str):
-    """Delete a file from R2 and update R2 manifest"""
-    import subprocess
-    import json
+# R2 config (matching sync_to_r2.py)
+RCLONE_REMOTE = "r2livegallery"
+BUCKET_NAME = "nomilivegallery"
+R2_PATH_PREFIX = "2026-01-20"
 
-    # R2 config (matching sync_to_r2.py)
-    RCLONE_REMOTE = "r2livegallery"
-    BUCKET_NAME = "nomilivegallery"
-    R2_PATH_PREFIX = "2026-01-20"
+_r2_uploader = None
+_r2_ledger = None
 
-    remote_path = f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/{filename}"
+def get_r2_backend():
+    """Uploader + shared upload ledger, created on first use"""
+    global _r2_uploader, _r2_ledger
+    if _r2_uploader is None:
+        _r2_uploader = create_uploader(RCLONE_REMOTE, BUCKET_NAME, R2_PATH_PREFIX)
+        _r2_ledger = UploadLedger(R2_PATH_PREFIX)
+    return _r2_uploader, _r2_ledger
 
-    # 1. Delete file from R2
-    try:
-        result = subprocess.run(
-            ["rclone", "delete", remote_path],
-            capture_output=True, text=True, timeout=30
-        )
-        if result.returncode == 0:
-            logger.info(f"   ☁️ R2 deleted: {filename}")
-        else:
-            logger.warning(f"   ⚠️ R2 delete failed: {result.stderr[:100]}")
-            return  # Don't update manifest if delete failed
-    except Exception as e:
-        logger.warning(f"   ⚠️ R2 delete error: {e}")
-        return
-
-    # 2. Get current R2 photo list (to rebuild manifest accurately)
-    try:
-        # List all photos in R2 (excluding manifest.json)
-        result = subprocess.run(
-            ["rclone", "lsf", f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True, text=True, timeout=30
-        )
-        if result.returncode == 0:
-            r2_files = result.stdout.strip().split('\n')
-            r2_photos = [
-                f for f in r2_files
-                if f and f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif'))
-            ]
-            
-            # Get photo times for sorting (similar to sync_to_r2.py)
-            photo_times = {}
-            if r2_photos:
-                result = subprocess.run(
-                    ["rclone", "lsl", f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-                    capture_output=True, text=True, timeout=30
-                )
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n'):
-                        if not line:
-                            continue
-                        parts = line.split()
-                        if len(parts) >= 4:
-                            date_str = parts[1]
-                            time_str = parts[2].split('.')[0]
-                            photo_name = parts[-1]
-                            if photo_name in r2_photos:
-                                photo_times[photo_name] = f"{date_str} {time_str}"
-            
-            # Sort by time (newest first)
-            sorted_photos = sorted(
-                r2_photos,
-                key=lambda p: photo_times.get(p, "0000-00-00 00:00:00"),
-                reverse=True
-            )
-            
-            # Create manifest content
-            manifest_content = json.dumps(sorted_photos, ensure_ascii=False, indent=2)
-            
-            # Write to local manifest first
-            manifest_path = os.path.join(CONFIG["web_folder"], "manifest.json")
-            with open(manifest_path, 'w', encoding='utf-8') as f:
-                f.write(manifest_content)
-            
-            # Upload to R2
-            result = subprocess.run(
-                ["rclone", "copy", manifest_path,
-                 f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-                capture_output=True, text=True, timeout=30
-            )
-            if result.returncode == 0:
-                logger.info(f"   ☁️ R2 manifest updated ({len(sorted_photos)} photos)")
-            else:
-                logger.warning(f"   ⚠️ R2 manifest update failed: {result.stderr[:100]}")
-        else:
-            # Fallback: just copy local manifest
-            manifest_path = os.path.join(CONFIG["web_folder"], "manifest.json")
-            if os.path.exists(manifest_path):
-                result = subprocess.run(
-                    ["rclone", "copy", manifest_path,
-                     f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-                    capture_output=True, text=True, timeout=30
-                )
-                if result.returncode == 0:
-                    logger.info(f"   ☁️ R2 manifest updated (fallback)")
-    except Exception as e:
-        logger.warning(f"   ⚠️ R2 manifest sync error: {e}")
+# Unpublish deletes are coalesced and sent by one background worker (one delete call + one manifest rebuild per batch)
+remote_ops = RemoteOpsWorker(get_r2_backend)
 
 
 @app.post("/api/unpublish")
@@ -894,6 +747,8 @@ async def unpublish_image(req: UnpublishRequest):
         if os.path.exists(target):
             # 1. Delete local file
             os.remove(target)
+            remove_renditions(CONFIG["web_folder"], target_filename)
+            manifest_index.remove(target_filename)
             logger.info(f"🗑 Unpublish: {target_filename}")
 
             # 2. Update history
@@ -901,14 +756,13 @@ async def unpublish_image(req: UnpublishRequest):
 
             # 3. Update local manifest
             update_manifest()
+            event_bus.publish("unpublished", {
+                "filename": target_filename,
+                "history": history_store.get_many([req.filename]),
+            })
 
-            # 4. Sync deletion to R2 (async-safe via thread)
-            import threading
-            threading.Thread(
-                target=sync_delete_to_r2,
-                args=(target_filename,),
-                daemon=True
-            ).start()
+            # 4. Queue the R2 deletion (batched with other unpublishes by the remote-ops worker)
+            remote_ops.queue_delete(target_filename)
 
             return {"status": "unpublished", "filename": req.filename}
         else:
@@ -941,8 +795,7 @@ def load_event_settings():
 def save_event_settings(settings):
     """Save event settings to JSON file"""
     try:
-        with open(EVENT_SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        durable_write.write_json(EVENT_SETTINGS_FILE, settings)
         return True
     except Exception as e:
         logger.error(f"Failed to save event settings: {e}")
@@ -992,10 +845,9 @@ async def upload_hero_image(file: UploadFile = File(...)):
         filename = f"hero_bg_{int(time.time())}.{ext}"
         file_path = os.path.join(assets_folder, filename)
         
-        # Read and save file
+        # Read and save file (temp + fsync + rename: the gallery never loads a partial image)
         content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        await asyncio.to_thread(durable_write.write_bytes, file_path, content)
         
         # Update event settings
         settings = load_event_settings()
@@ -1025,13 +877,14 @@ async def upload_watermark(file: UploadFile = File(...)):
         
         file_path = os.path.join(assets_folder, "watermark.png")
         
-        # Read and save file
+        # Read and save file: temp + fsync + rename, so a publish worker rebuilding its
+        # processor after reload() below never loads a half-written watermark.png
         content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        await asyncio.to_thread(durable_write.write_bytes, file_path, content)
         
         # Reload processor to load new watermark
         processor.load_assets()
+        publish_engine.reload()
         
         return {"status": "success", "message": "Watermark uploaded successfully"}
     except Exception as e:
@@ -1060,6 +913,7 @@ async def update_watermark_settings(req: WatermarkSettingsRequest):
     
     # Reload processor with new settings
     processor.load_assets()
+    publish_engine.reload()
     
     # Save to config file
     try:
@@ -1074,8 +928,7 @@ async def update_watermark_settings(req: WatermarkSettingsRequest):
     file_config["processing"]["watermark"] = CONFIG["processing"]["watermark"]
     
     try:
-        with open(config_file, "w", encoding="utf-8") as f:
-            json.dump(file_config, f, ensure_ascii=False, indent=2)
+        durable_write.write_json(config_file, file_config)
     except Exception as e:
         logger.error(f"Failed to save config file: {e}")
     
@@ -1112,6 +965,9 @@ async def update_folder_settings(req: FolderSettingsRequest):
     
     # Update CONFIG
     CONFIG.update(folders)
+    manifest_index.set_folder(CONFIG["web_folder"])
+    if buffer_catalog.folder != CONFIG["buffer_folder"]:
+        await asyncio.to_thread(buffer_catalog.set_folder, CONFIG["buffer_folder"])
     
     # Save to config file
     try:
@@ -1124,8 +980,7 @@ async def update_folder_settings(req: FolderSettingsRequest):
     file_config.update(folders)
     
     try:
-        with open(config_file, "w", encoding="utf-8") as f:
-            json.dump(file_config, f, ensure_ascii=False, indent=2)
+        durable_write.write_json(config_file, file_config)
     except Exception as e:
         logger.error(f"Failed to save config file: {e}")
     
@@ -0,0 +1,150 @@
+"""
+In-memory low-resolution proxies of buffer (camera) images.
+
+Decoding a 24-45 MP camera original dominates a publish, and the same frame is
+rendered again and again: every slider change in the editor (/api/preview)
+and every republish with a different crop or exposure (_002, _003, ...).
+A proxy is the source decoded once (libjpeg draft scale + downscale) and kept
+in memory:
+
+  - server: the photos open in the editor, ~max_size, for previews
+  - publish workers: the libjpeg DCT-scaled decode itself (1.5-3x max_size,
+    no extra resample), enough for a full-quality publish unless the zoom
+    crop needs more pixels than the proxy has. That is checked from the file
+    header before decoding (ProxyCache.oversample); such publishes decode the
+    original as before and don't replace the cached proxy
+
+Proxies stay in source orientation: render_plan.render() maps the plan built
+for the full-size source onto the smaller proxy, so orientation, crops and
+straighten land on the same pixels as a render from the original (the
+orientation transposes run on the small output, not on the proxy).
+"""
+
+import os
+import math
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_TAG = 0x0112
+
+
+def _reduction(long_edge: int, min_size: int) -> int:
+    """Largest DCT scale reduction (8, 4, 2 or 1) that keeps at least min_size on the long edge"""
+    for reduction in (8, 4, 2):
+        if long_edge / reduction >= min_size:
+            return reduction
+    return 1
+
+
+def proxy_long_edge(img, max_size: int, min_size: int = None) -> int:
+    """Long edge of the proxy SourceProxy would build from img (an opened, not yet decoded image)"""
+    long_edge = max(img.size)
+    if img.format == "JPEG":
+        long_edge = math.ceil(long_edge / _reduction(long_edge, min_size or max_size))
+    return min(long_edge, max_size)
+
+
+class SourceProxy:
+    """
+    A source image at most max_size on its long edge. JPEGs are decoded at
+    the smallest DCT scale that keeps at least min_size (default max_size).
+    source: a path, or an image opened by the caller (not yet loaded).
+    """
+
+    def __init__(self, source, max_size: int, min_size: int = None):
+        if isinstance(source, Image.Image):
+            self._load(source, max_size, min_size or max_size)
+        else:
+            with Image.open(source) as img:
+                self._load(img, max_size, min_size or max_size)
+        self.nbytes = self.image.width * self.image.height * 3
+
+    def _load(self, img, max_size, min_size):
+        self.source_size = img.size
+        self.orientation = img.getexif().get(ORIENTATION_TAG, 1)
+        reduction = _reduction(max(img.size), min_size)
+        if reduction > 1:
+            img.draft("RGB", (math.ceil(img.width / reduction), math.ceil(img.height / reduction)))
+        img = img.convert("RGB")
+        if max(img.size) > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        self.image = img
+
+    def oversample(self, plan) -> float:
+        """Proxy pixels per output pixel (along the tighter axis) when rendering plan from this proxy"""
+        return _source_oversample(plan) * max(self.image.size) / max(self.source_size)
+
+
+def _source_oversample(plan) -> float:
+    m = plan.matrix
+    return min(math.hypot(m[0][0], m[1][0]), math.hypot(m[0][1], m[1][1]))
+
+
+class ProxyCache:
+    """
+    Proxies keyed by path + mtime + size (a replaced file is decoded again).
+    Least recently used proxies are dropped once they add up to more than
+    max_bytes of pixels; the newest one is always kept.
+    """
+
+    def __init__(self, max_size: int, max_bytes: int, min_size: int = None):
+        self.max_size = max_size
+        self.min_size = min_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> SourceProxy, oldest first
+        self._total_bytes = 0
+
+    @staticmethod
+    def make_key(path: str):
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def peek(self, path: str):
+        """The cached proxy of path, or None (counted as a miss) without decoding anything"""
+        key = self.make_key(path)
+        with self._lock:
+            proxy = self._entries.get(key)
+            if proxy is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        return proxy
+
+    def oversample(self, img, plan) -> float:
+        """SourceProxy.oversample() of the proxy this cache would build from img, read from its header only"""
+        return _source_oversample(plan) * proxy_long_edge(img, self.max_size, self.min_size) / max(img.size)
+
+    def get(self, path: str) -> SourceProxy:
+        proxy = self.peek(path)
+        if proxy is None:
+            # Decode outside the lock; two requests racing on a new photo both decode, one wins
+            proxy = self.put(path, SourceProxy(path, self.max_size, self.min_size))
+        return proxy
+
+    def put(self, path: str, source) -> SourceProxy:
+        """
+        Cache a proxy for path built from source: a SourceProxy, or the image
+        the caller already opened from path (decoded here, once)
+        """
+        key = self.make_key(path)
+        proxy = source if isinstance(source, SourceProxy) else SourceProxy(source, self.max_size, self.min_size)
+        with self._lock:
+            # Older versions of the same file can never be hit again
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._total_bytes -= self._entries.pop(stale).nbytes
+            self._entries[key] = proxy
+            self._total_bytes += proxy.nbytes
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+        logger.debug(f"Source proxy {os.path.basename(path)}: {proxy.image.width}x{proxy.image.height} "
+                     f"({len(self._entries)} cached, {self._total_bytes / 1024 / 1024:.0f}MB)")
+        return proxy
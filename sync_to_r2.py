@@ -3,6 +3,19 @@
 R2 自動同步腳本 - Live Event Photography
 監控 photos_web 資料夾，自動同步到 Cloudflare R2
 
+以檔案系統事件 (watchdog) 觸發上傳，並定期做低頻完整比對作為安全網；
+未安裝 watchdog 時退回每 CHECK_INTERVAL 秒輪詢。
+照片的響應式縮圖 (renditions/，由發布流程在主檔之前寫好) 會跟主檔一起上傳。
+
+上傳日誌 (r2_ledger.py 的帳本) 記錄每個物件的大小、內容 SHA-256、本機 mtime 與 R2 ETag：
+  - 內容相同的檔案不重傳 (被 touch、重新匯出同一張)，同名但內容不同的會重傳
+  - 啟動時直接與日誌比對，不需要先列出整個 R2 (只有全新的帳本才列一次)
+  - 大檔分段上傳中斷後，重新啟動時從 R2 已收到的分段續傳 (S3 後端)
+
+上傳交給排程器 (upload_scheduler.py) 在背景進行：斷線恢復後的積壓依
+「最新發布的照片先、小縮圖先於大圖」上傳，manifest 不排隊；同時上傳數與頻寬上限
+由 config.json 的 "r2" 區塊設定 (upload_slots、max_upload_mbps)。
+
 使用方式：
     python3 sync_to_r2.py
 
@@ -12,9 +25,23 @@ R2 自動同步腳本 - Live Event Photography
 import os
 import json
 import time
+import threading
 import subprocess
 from pathlib import Path
 from datetime import datetime
+from functools import partial
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # 沒有 watchdog 就退回輪詢模式
+    Observer = None
+    FileSystemEventHandler = object
+
+from r2_uploader import create_uploader, load_r2_settings
+from upload_scheduler import UploadScheduler
+from r2_ledger import UploadLedger, file_sha256, file_md5
+from renditions import load_sidecar, rendition_files
 
 # ============ 配置區 ============
 # 載入 config.json 以取得動態資料夾路徑
@@ -55,14 +82,113 @@ R2_PATH_PREFIX = "2026-01-20"
 # 支援的照片格式
 PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 
-# 檢查間隔 (秒)
+# 檢查間隔 (秒) - 僅在沒有 watchdog 時使用的輪詢間隔
 CHECK_INTERVAL = 3
 
+# 檔案最後一次變動後需靜置多久才視為寫入完成 (秒)
+DEBOUNCE_SECONDS = 1.0
+
+# 安全網：低頻完整比對本地資料夾的間隔 (秒)
+RECONCILE_INTERVAL = 60
+
+# 以遠端列表校正上傳帳本的間隔 (秒)；平常 manifest 完全由本機帳本產生
+LEDGER_RECONCILE_INTERVAL = 600
+
+# 上傳積壓時 manifest 最多每幾秒更新一次：現場照片牆陸續看到新照片，又不必每張都重寫 manifest
+MANIFEST_MIN_INTERVAL = 2.0
+
 # 安全模式：只新增照片，不自動刪除 R2 上的照片
 # 設為 False 可啟用刪除功能（謹慎使用）
 SAFE_MODE = True
 # ================================
 
+# 本機上傳帳本 / 上傳日誌：記錄 R2 上有哪些物件與其內容雜湊 (與 server.py、r2_manage.py 共用)
+LEDGER = UploadLedger(R2_PATH_PREFIX)
+
+# 上傳後端：有 boto3 + R2 憑證時用 S3 API (連線池，分段上傳記在日誌可續傳)，否則用 rclone；
+# 外層的排程器決定上傳順序、同時上傳數與頻寬上限
+R2_SETTINGS = load_r2_settings()
+UPLOADER = UploadScheduler(
+    create_uploader(RCLONE_REMOTE, BUCKET_NAME, R2_PATH_PREFIX, R2_SETTINGS, journal=LEDGER),
+    slots=R2_SETTINGS.get("upload_slots", 4),
+    max_upload_mbps=R2_SETTINGS.get("max_upload_mbps", 0),
+)
+
+
+def is_photo_name(name):
+    """照片檔名判斷 (排除 ._ 等隱藏檔與暫存檔，包含 durable_write 寫入中的 .<檔名>.xxx.tmp)"""
+    return not name.startswith('.') and Path(name).suffix.lower() in PHOTO_EXTENSIONS
+
+
+def is_file_complete(path):
+    """
+    JPEG 需以 EOI (FF D9) 結尾，避免上傳寫到一半的檔案。
+    server / auto_compress_v2 以 durable_write 寫入 (暫存檔 + rename)，檔名出現時即已完整；
+    這個檢查是給其他工具直接寫入的檔案用的
+    """
+    try:
+        if path.suffix.lower() not in (".jpg", ".jpeg"):
+            return path.stat().st_size > 0
+        with open(path, "rb") as f:
+            f.seek(-2, os.SEEK_END)
+            return f.read(2) == b"\xff\xd9"
+    except OSError:
+        return False
+
+
+class PhotoFolderHandler(FileSystemEventHandler):
+    """收集資料夾事件，等檔案靜置 DEBOUNCE_SECONDS 後才交給主迴圈處理"""
+
+    def __init__(self, wake_event):
+        self.pending = {}  # 檔名 -> 最後一次事件時間
+        self.lock = threading.Lock()
+        self.wake_event = wake_event
+
+    def _touch(self, path):
+        name = Path(path).name
+        if is_photo_name(name):
+            with self.lock:
+                self.pending[name] = time.monotonic()
+            self.wake_event.set()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+            self._touch(event.dest_path)
+
+    def take_ready(self):
+        """取出已靜置的檔名；回傳 (檔名列表, 下一個檔案還需等待的秒數或 None)"""
+        now = time.monotonic()
+        ready, next_wait = [], None
+        with self.lock:
+            for name, last_event in list(self.pending.items()):
+                age = now - last_event
+                if age >= DEBOUNCE_SECONDS:
+                    ready.append(name)
+                    del self.pending[name]
+                else:
+                    wait = DEBOUNCE_SECONDS - age
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+        return ready, next_wait
+
+    def defer(self, name):
+        """檔案尚未寫完，稍後再檢查"""
+        with self.lock:
+            self.pending.setdefault(name, time.monotonic())
+        self.wake_event.set()
+
 
 def get_local_photos():
     """取得本地照片列表"""
@@ -71,125 +197,165 @@ def get_local_photos():
 
     photos = {
         f.name for f in LOCAL_PHOTOS_DIR.iterdir()
-        if f.is_file() and f.suffix.lower() in PHOTO_EXTENSIONS
+        if f.is_file() and is_photo_name(f.name)
     }
     return photos
 
 
 def get_r2_photos():
-    """取得 R2 上的照片列表"""
+    """取得 R2 上的照片列表 (來自本機帳本，不需網路)"""
+    return LEDGER.photo_names()
+
+
+def reconcile_ledger():
+    """以遠端列表校正本機帳本 (啟動時與低頻定期執行)；回傳是否有變動"""
     try:
-        result = subprocess.run(
-            ["rclone", "lsf", f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        if result.returncode == 0:
-            # 過濾出照片檔案 (排除 manifest.json)
-            files = result.stdout.strip().split('\n')
-            photos = {
-                f for f in files
-                if f and any(f.lower().endswith(ext) for ext in PHOTO_EXTENSIONS)
-            }
-            return photos
-        return set()
+        added, removed = LEDGER.reconcile(UPLOADER.list_objects())
+        return bool(added or removed)
     except Exception as e:
         print(f"⚠️  無法取得 R2 照片列表: {e}")
-        return set()
-
+        return False
 
-def sync_photo_to_r2(photo_name):
-    """同步單張照片到 R2"""
-    local_path = LOCAL_PHOTOS_DIR / photo_name
-    remote_path = f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/{photo_name}"
 
+def needs_upload(name):
+    """
+    依上傳日誌判斷 name 是否需要上傳：帳本沒有、大小不同或內容不同才上傳。
+    大小與 mtime 都和上次上傳時相同就不讀檔；mtime 變了才計算 SHA-256 比對
+    (舊帳本沒有雜湊時，以非分段上傳的 ETag = MD5 比對)。內容相同的記下新 mtime 後略過
+    """
+    path = LOCAL_PHOTOS_DIR / name
     try:
-        result = subprocess.run(
-            ["rclone", "copy", str(local_path), f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        return result.returncode == 0
-    except Exception as e:
-        print(f"⚠️  上傳失敗 {photo_name}: {e}")
+        stat = path.stat()
+    except OSError:
         return False
+    known = LEDGER.fingerprint(name)
+    if not known or known["size"] != stat.st_size:
+        return True
+    if known["mtime_ns"] == stat.st_mtime_ns:
+        return False
+    try:
+        if known["sha256"]:
+            if file_sha256(path) != known["sha256"]:
+                return True
+        elif known["etag"] and len(known["etag"]) == 32 and "-" not in known["etag"]:
+            if file_md5(path) != known["etag"]:
+                return True
+        else:
+            return True
+    except OSError:
+        return False
+    LEDGER.record_local_fingerprint(name, stat.st_mtime_ns, known["sha256"] or file_sha256(path))
+    return False
+
+
+def local_fingerprint(path):
+    """上傳前記下的 {"mtime_ns", "sha256"}：先 stat 再讀檔，上傳途中被換掉時雜湊只會比上傳的內容舊 (下次重傳)"""
+    mtime_ns = path.stat().st_mtime_ns
+    return {"mtime_ns": mtime_ns, "sha256": file_sha256(path)}
+
+
+class PhotoUploadQueue:
+    """
+    把照片 (含 renditions) 排入上傳排程器就返回，主迴圈不必等整批傳完，
+    積壓期間新發布的照片也能插隊到前面。
+    一張照片的檔案全部傳完才記入帳本；任一 rendition 失敗的照片不記入 (manifest 不能指向不存在的檔案)。
+    完成的照片由主迴圈 take_finished() 取走 (印出結果、更新 manifest)
+    """
+
+    def __init__(self, wake_event):
+        self.lock = threading.Lock()
+        self.in_flight = {}  # 照片 -> {"pending", "results", "errors", "sidecar", "fingerprints", "mtime_ns"}
+        self.dirty = set()   # 上傳途中又變更的照片，完成後重新檢查
+        self.finished = []   # [(照片, 是否成功, 錯誤訊息列表)]
+        self.wake_event = wake_event
+
+    def submit(self, photo_names):
+        """
+        排入照片：越新發布 (主檔 mtime 越新) 越先；同一張照片裡小檔先，小縮圖最先上牆。
+        R2 上內容相同的 rendition (依上傳日誌) 不重傳；每個檔案連同上傳前的內容雜湊記入日誌
+        """
+        for photo in photo_names:
+            with self.lock:
+                if photo in self.in_flight:
+                    self.dirty.add(photo)
+                    continue
+            try:
+                photo_mtime = (LOCAL_PHOTOS_DIR / photo).stat().st_mtime_ns
+            except OSError:
+                photo_mtime = 0
+            sidecar = load_sidecar(LOCAL_PHOTOS_DIR, photo)
+            items, fingerprints = [], {}
+            for name in [n for n in rendition_files(sidecar) if needs_upload(n)] + [photo]:
+                path = LOCAL_PHOTOS_DIR / name
+                try:
+                    size = path.stat().st_size
+                    fingerprints[name] = local_fingerprint(path)
+                except OSError:
+                    size = 0  # 檔案不見了：交給上傳回報失敗
+                items.append((path, name, (1, -photo_mtime, size)))
+            with self.lock:
+                self.in_flight[photo] = {"pending": len(items), "results": [], "errors": [],
+                                         "sidecar": sidecar, "fingerprints": fingerprints, "mtime_ns": photo_mtime}
+            for path, name, priority in items:
+                UPLOADER.submit(path, name, priority).add_done_callback(partial(self._done, photo, name))
+
+    def _done(self, photo, name, future):
+        """上傳執行緒呼叫：照片的最後一個檔案完成時記入帳本並喚醒主迴圈"""
+        with self.lock:
+            state = self.in_flight[photo]
+            try:
+                result = future.result()
+                result.update(state["fingerprints"].get(name, {}))
+                if name == photo and state["sidecar"]:
+                    result["meta"] = state["sidecar"]
+                state["results"].append(result)
+            except Exception as e:
+                state["errors"].append(str(e))
+            state["pending"] -= 1
+            if state["pending"]:
+                return
+
+        # 照片失敗時主檔不記入帳本 (已傳成功的 renditions 照記，重傳時會略過)
+        # 記入時間用主檔的發布時間 (mtime)：積壓照片由新到舊上傳，manifest 仍要依發布順序排列
+        ok = not state["errors"]
+        results = [r for r in state["results"] if ok or r["name"] != photo]
+        if results:
+            LEDGER.record_uploads(results, uploaded_at=state["mtime_ns"] / 1e9 if state["mtime_ns"] else None)
+        with self.lock:
+            del self.in_flight[photo]
+            self.finished.append((photo, ok, state["errors"]))
+        self.wake_event.set()
+
+    def take_finished(self):
+        """取出 (已完成的照片列表, 上傳途中又變更、需要重新檢查的照片)"""
+        with self.lock:
+            finished, self.finished = self.finished, []
+            recheck = {photo for photo, _, _ in finished if photo in self.dirty}
+            self.dirty -= recheck
+        return finished, recheck
+
+    def backlog(self):
+        """排程器裡還沒傳完的檔案數"""
+        stats = UPLOADER.stats()
+        return stats["queued"] + stats["in_flight"]
 
 
 def delete_photo_from_r2(photo_name):
-    """從 R2 刪除照片"""
-    remote_path = f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/{photo_name}"
-
+    """從 R2 刪除照片 (連同 renditions)"""
     try:
-        result = subprocess.run(
-            ["rclone", "delete", remote_path],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        return result.returncode == 0
+        deleted, failed = UPLOADER.delete(LEDGER.renditions_of([photo_name]) + [photo_name])
+        LEDGER.record_deletes(deleted)
+        return not failed
     except Exception as e:
         print(f"⚠️  刪除失敗 {photo_name}: {e}")
         return False
 
 
-def get_r2_photo_times():
-    """取得 R2 上照片的修改時間"""
+def update_r2_manifest():
+    """更新 R2 上的 manifest - 由本機帳本產生，按上傳時間排序（最新在前），含分頁/增量檔"""
     try:
-        result = subprocess.run(
-            ["rclone", "lsl", f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        if result.returncode == 0:
-            photo_times = {}
-            for line in result.stdout.strip().split('\n'):
-                if not line:
-                    continue
-                # rclone lsl format: "   size YYYY-MM-DD HH:MM:SS.NNNNNN filename"
-                parts = line.split()
-                if len(parts) >= 4:
-                    filename = parts[-1]
-                    if any(filename.lower().endswith(ext) for ext in PHOTO_EXTENSIONS):
-                        # 使用日期時間字串作為排序依據
-                        date_str = parts[1] + " " + parts[2]
-                        photo_times[filename] = date_str
-            return photo_times
-        return {}
-    except Exception as e:
-        print(f"⚠️  無法取得 R2 照片時間: {e}")
-        return {}
-
-
-def update_r2_manifest(photos):
-    """更新 R2 上的 manifest.json - 按上傳時間排序（最新在前）"""
-    # 取得照片的修改時間
-    photo_times = get_r2_photo_times()
-
-    # 按時間排序（最新的在前面），沒有時間資訊的放最後
-    sorted_photos = sorted(
-        list(photos),
-        key=lambda p: photo_times.get(p, "0000-00-00 00:00:00"),
-        reverse=True
-    )
-    manifest_content = json.dumps(sorted_photos, ensure_ascii=False, indent=2)
-
-    # 寫入本地暫存檔
-    local_manifest = LOCAL_PHOTOS_DIR / "manifest.json"
-    with open(local_manifest, 'w', encoding='utf-8') as f:
-        f.write(manifest_content)
-
-    # 上傳到 R2
-    try:
-        result = subprocess.run(
-            ["rclone", "copy", str(local_manifest), f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/"],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        return result.returncode == 0
+        LEDGER.publish_manifest(UPLOADER)
+        return True
     except Exception as e:
         print(f"⚠️  更新 manifest 失敗: {e}")
         return False
@@ -203,7 +369,8 @@ def full_sync():
         result = subprocess.run(
             ["rclone", "sync", str(LOCAL_PHOTOS_DIR), f"{RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/",
              "--include", "*.jpg", "--include", "*.jpeg", "--include", "*.png",
-             "--include", "*.webp", "--include", "*.gif", "--include", "manifest.json",
+             "--include", "*.webp", "--include", "*.gif", "--include", "*.avif",
+             "--include", "manifest.json",
              "-v"],
             capture_output=True,
             text=True,
@@ -228,7 +395,7 @@ def main():
     print("=" * 50)
     print(f"📂 監控資料夾: {LOCAL_PHOTOS_DIR}")
     print(f"☁️  R2 路徑: {RCLONE_REMOTE}:{BUCKET_NAME}/{R2_PATH_PREFIX}/")
-    print(f"⏱️  檢查間隔: {CHECK_INTERVAL} 秒")
+    print(f"🔌 上傳後端: {UPLOADER.description}")
     print("-" * 50)
     print("按 Ctrl+C 停止\n")
 
@@ -236,87 +403,163 @@ def main():
     previous_local = get_local_photos()
     print(f"📸 本地照片: {len(previous_local)} 張")
 
+    # R2 現況直接取自上傳日誌；只有全新的帳本才列出整個遠端 (之後由低頻校正負責)
+    if not LEDGER.objects():
+        print("☁️  上傳日誌是空的，列出 R2 建立帳本...")
+        reconcile_ledger()
     r2_photos = get_r2_photos()
-    print(f"☁️  R2 照片: {len(r2_photos)} 張")
-
-    # 檢查是否需要初始同步
-    if previous_local != r2_photos:
-        missing_in_r2 = previous_local - r2_photos
-        extra_in_r2 = r2_photos - previous_local
-
-        if extra_in_r2 and SAFE_MODE:
-            print(f"\n📌 R2 有 {len(extra_in_r2)} 張照片不在本地")
-            print("   🔒 安全模式：這些照片會保留在 R2")
-
-        if missing_in_r2:
-            print(f"\n⚠️  發現 {len(missing_in_r2)} 張本地照片尚未同步到 R2")
-            print("   正在上傳...")
-            for photo in missing_in_r2:
-                if sync_photo_to_r2(photo):
-                    print(f"   ✅ {photo}")
-                else:
-                    print(f"   ❌ {photo}")
-
-            # 更新 manifest (安全模式從 R2 取得列表)
-            if SAFE_MODE:
-                actual_r2 = get_r2_photos()
-                update_r2_manifest(actual_r2)
-                print(f"   📋 Manifest 已更新 (R2: {len(actual_r2)} 張)")
-            else:
-                update_r2_manifest(previous_local)
-                print("   📋 Manifest 已更新")
+    print(f"☁️  R2 照片: {len(r2_photos)} 張 (上傳日誌)")
+
+    # 檢查是否需要初始同步：日誌沒有的，或內容與上次上傳時不同的
+    extra_in_r2 = r2_photos - previous_local
+    if extra_in_r2 and SAFE_MODE:
+        print(f"\n📌 R2 有 {len(extra_in_r2)} 張照片不在本地")
+        print("   🔒 安全模式：這些照片會保留在 R2")
+
+    wake_event = threading.Event()
+    uploads = PhotoUploadQueue(wake_event)
+    to_upload = {p for p in previous_local if is_file_complete(LOCAL_PHOTOS_DIR / p) and needs_upload(p)}
+    if to_upload:
+        missing_in_r2 = to_upload - r2_photos
+        changed_in_r2 = to_upload & r2_photos
+        print(f"\n⚠️  發現 {len(missing_in_r2)} 張本地照片尚未同步到 R2、{len(changed_in_r2)} 張內容已變更")
+        print("   背景上傳中 (最新的照片先，manifest 隨完成進度更新)...")
+        uploads.submit(to_upload)
 
     print("\n🔍 開始監控變化...\n")
 
+    handler = PhotoFolderHandler(wake_event)
+    observer = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(handler, str(LOCAL_PHOTOS_DIR), recursive=False)
+        observer.start()
+        reconcile_interval = RECONCILE_INTERVAL
+        print(f"👀 檔案事件監控已啟動 (完整比對每 {RECONCILE_INTERVAL} 秒)")
+    else:
+        reconcile_interval = CHECK_INTERVAL
+        print(f"⚠️  未安裝 watchdog，改用輪詢 (每 {CHECK_INTERVAL} 秒)")
+
+    known_local = previous_local
+    manifest_dirty = False
+    next_manifest = time.monotonic()
+    next_reconcile = time.monotonic() + reconcile_interval
+    next_ledger_reconcile = time.monotonic() + LEDGER_RECONCILE_INTERVAL
+
     try:
         while True:
-            current_local = get_local_photos()
-
-            if current_local != previous_local:
-                timestamp = datetime.now().strftime("%H:%M:%S")
-
-                # 找出新增和刪除的照片
-                added = current_local - previous_local
-                removed = previous_local - current_local
-
-                if added:
-                    print(f"[{timestamp}] 📥 新增 {len(added)} 張照片")
-                    for photo in added:
-                        if sync_photo_to_r2(photo):
-                            print(f"   ✅ 已上傳: {photo}")
-                        else:
-                            print(f"   ❌ 上傳失敗: {photo}")
-
-                if removed:
-                    if SAFE_MODE:
-                        print(f"[{timestamp}] ⚠️  偵測到 {len(removed)} 張照片從本地移除")
-                        print(f"   🔒 安全模式：R2 上的照片保持不變")
-                        print(f"   （如需刪除，請設定 SAFE_MODE = False）")
-                    else:
-                        print(f"[{timestamp}] 🗑️  刪除 {len(removed)} 張照片")
-                        for photo in removed:
-                            if delete_photo_from_r2(photo):
-                                print(f"   ✅ 已刪除: {photo}")
-                            else:
-                                print(f"   ❌ 刪除失敗: {photo}")
-
-                # 更新 manifest
-                if SAFE_MODE:
-                    # 安全模式：從 R2 取得實際照片列表來更新 manifest
-                    actual_r2_photos = get_r2_photos()
-                    if update_r2_manifest(actual_r2_photos):
-                        print(f"   📋 Manifest 已更新 (R2: {len(actual_r2_photos)} 張)")
-                else:
-                    if update_r2_manifest(current_local):
-                        print(f"   📋 Manifest 已更新 ({len(current_local)} 張照片)")
-
-                previous_local = current_local
-                print()
-
-            time.sleep(CHECK_INTERVAL)
+            ready, next_wait = handler.take_ready()
+
+            added, changed, removed = set(), set(), set()
+            for name in ready:
+                path = LOCAL_PHOTOS_DIR / name
+                if path.is_file():
+                    if not is_file_complete(path):
+                        handler.defer(name)
+                        continue
+                    (changed if name in known_local else added).add(name)
+                elif name in known_local:
+                    removed.add(name)
+
+            # 安全網：低頻完整比對，補上漏掉的事件
+            if time.monotonic() >= next_reconcile:
+                current_local = get_local_photos()
+                added |= {p for p in current_local - known_local
+                          if p not in handler.pending and is_file_complete(LOCAL_PHOTOS_DIR / p)}
+                removed |= (known_local - current_local) - set(handler.pending)
+                next_reconcile = time.monotonic() + reconcile_interval
+
+            if added or changed or removed:
+                known_local, deleted = sync_changes(added, changed, removed, known_local, uploads)
+                manifest_dirty |= deleted
+
+            # 背景上傳完成的照片；上傳途中又變更的重新檢查
+            finished, recheck = uploads.take_finished()
+            if finished:
+                known_local, uploaded = report_uploads(finished, known_local)
+                manifest_dirty |= uploaded
+            recheck = {p for p in recheck if (LOCAL_PHOTOS_DIR / p).is_file() and needs_upload(p)}
+            if recheck:
+                uploads.submit(recheck)
+
+            # 更新 manifest：帳本就是 R2 上實際的照片 (安全模式下也包含本地已移除的)
+            if manifest_dirty and time.monotonic() >= next_manifest:
+                if update_r2_manifest():
+                    backlog = uploads.backlog()
+                    print(f"   📋 Manifest 已更新 (R2: {len(get_r2_photos())} 張)"
+                          + (f"，佇列還有 {backlog} 個檔案" if backlog else ""))
+                    manifest_dirty = False
+                next_manifest = time.monotonic() + MANIFEST_MIN_INTERVAL
+
+            # 低頻以遠端列表校正帳本 (例如有人用其他工具改過 R2)
+            if time.monotonic() >= next_ledger_reconcile:
+                if reconcile_ledger() and update_r2_manifest():
+                    print(f"   📋 帳本已校正，Manifest 已更新 (R2: {len(get_r2_photos())} 張)")
+                next_ledger_reconcile = time.monotonic() + LEDGER_RECONCILE_INTERVAL
+
+            # 等待下一個事件、下一個待靜置檔案或下一次完整比對
+            timeout = max(0.0, next_reconcile - time.monotonic())
+            if next_wait is not None:
+                timeout = min(timeout, next_wait)
+            if manifest_dirty:
+                timeout = min(timeout, max(0.0, next_manifest - time.monotonic()))
+            wake_event.wait(timeout)
+            wake_event.clear()
 
     except KeyboardInterrupt:
         print("\n\n👋 同步腳本已停止")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+def sync_changes(added, changed, removed, known_local, uploads):
+    """新增/變更的照片排入背景上傳、處理刪除；回傳 (新的本地照片集合, 是否有照片從 R2 刪除)"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+
+    # 內容與 R2 上相同的 (被 touch、重新匯出同一張) 不重傳
+    to_upload = {p for p in added | changed if needs_upload(p)}
+    skipped = len(added | changed) - len(to_upload)
+    if skipped:
+        print(f"[{timestamp}] ⏭️  {skipped} 張照片內容與 R2 相同，略過")
+    if to_upload:
+        print(f"[{timestamp}] 📥 新增 {len(added & to_upload)} 張、更新 {len(changed & to_upload)} 張照片，排入上傳")
+        uploads.submit(to_upload)
+
+    deleted = False
+    if removed:
+        if SAFE_MODE:
+            print(f"[{timestamp}] ⚠️  偵測到 {len(removed)} 張照片從本地移除")
+            print(f"   🔒 安全模式：R2 上的照片保持不變")
+            print(f"   （如需刪除，請設定 SAFE_MODE = False）")
+        else:
+            print(f"[{timestamp}] 🗑️  刪除 {len(removed)} 張照片")
+            for photo in removed:
+                if delete_photo_from_r2(photo):
+                    print(f"   ✅ 已刪除: {photo}")
+                    deleted = True
+                else:
+                    print(f"   ❌ 刪除失敗: {photo}")
+
+    known_local = (known_local | added) - removed
+    return known_local, deleted
+
+
+def report_uploads(finished, known_local):
+    """
+    印出背景上傳完成的照片；回傳 (新的本地照片集合, 是否有照片上傳成功)
+    上傳失敗的照片移出已知集合，下次完整比對會再試
+    """
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    failed = set()
+    for photo, ok, errors in finished:
+        if ok:
+            print(f"[{timestamp}] ✅ 已上傳: {photo}")
+        else:
+            print(f"[{timestamp}] ❌ 上傳失敗: {photo} ({errors[0]})")
+            failed.add(photo)
+    return known_local - failed, len(failed) < len(finished)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+"""A backlog uploaded newest first must still give the publish-order manifest, as deltas"""
+
+import json
+
+import manifest_versions
+from r2_ledger import UploadLedger
+
+
+class RecordingUploader:
+    def __init__(self):
+        self.files = {}
+
+    def upload_bytes(self, data, name, content_type=None):
+        self.files[name] = json.loads(data)
+
+    def delete(self, names, parallelism=None):
+        for name in names:
+            self.files.pop(name, None)
+
+
+def apply_delta(photos, delta, version):
+    """Same steps as loadDelta() in index.html"""
+    for change in delta["changes"]:
+        if change["v"] <= version:
+            continue
+        removed = set(change["remove"])
+        photos = change["add"] + [p for p in photos if p["name"] not in removed]
+        for index, photo in change.get("insert", []):
+            photos.insert(index, photo)
+    return photos
+
+
+def test_backlog_drained_newest_first_keeps_publish_order(tmp_path):
+    ledger = UploadLedger("event", tmp_path / "ledger.db")
+    uploader = RecordingUploader()
+    # Already on the wall before the outage
+    for name, published in (("A.jpg", 100.0), ("B.jpg", 200.0)):
+        ledger.record_uploads([{"name": name, "size": 1, "etag": "e"}], uploaded_at=published)
+    ledger.publish_manifest(uploader)
+    client = [{"name": "B.jpg"}, {"name": "A.jpg"}]
+    client_version = uploader.files[manifest_versions.HEAD_NAME]["version"]
+
+    # Backlog published at 300..600, drained in priority order (newest first),
+    # with a live publish at 700 jumping the queue halfway through
+    for name, published in (("F.jpg", 600.0), ("E.jpg", 500.0), ("G.jpg", 700.0),
+                            ("D.jpg", 400.0), ("C.jpg", 300.0)):
+        ledger.record_uploads([{"name": name, "size": 1, "etag": "e"}], uploaded_at=published)
+        ledger.publish_manifest(uploader)
+        head = uploader.files[manifest_versions.HEAD_NAME]
+        assert head["delta_from"] <= client_version  # No full reload for clients following along
+        client = apply_delta(client, uploader.files[manifest_versions.DELTA_NAME], client_version)
+        client_version = head["version"]
+
+    expected = ["G.jpg", "F.jpg", "E.jpg", "D.jpg", "C.jpg", "B.jpg", "A.jpg"]
+    assert [p["name"] for p in ledger.manifest_photos()] == expected
+    assert uploader.files[manifest_versions.LEGACY_NAME] == expected
+    assert [p["name"] for p in client] == expected
+    ledger.close()
+
+
+def test_reorder_still_resets_the_change_log():
+    state = manifest_versions.next_state(None, ["B.jpg", "A.jpg"])
+    state = manifest_versions.next_state(state, ["A.jpg", "B.jpg"])
+    assert state["changes"] == [] and state["delta_from"] == state["version"]
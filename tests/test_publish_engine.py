@@ -0,0 +1,40 @@
+"""PublishEngine job bookkeeping, with the render stubbed out (no worker processes)"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import publish_engine
+from publish_engine import PublishEngine
+
+
+def run_job(monkeypatch, on_done):
+    monkeypatch.setattr(publish_engine, "_run_publish", lambda *args: 2048)
+    engine = PublishEngine({}, workers=1)
+    engine._executors = [ThreadPoolExecutor(max_workers=1)]
+    engine._load = [0]
+
+    async def main():
+        job = engine.submit("/buffer/IMG_0001.jpg", "/web/IMG_0001.jpg", {}, on_done=on_done)
+        await engine._tasks[job["id"]]
+        return job
+
+    try:
+        return engine, asyncio.run(main())
+    finally:
+        engine._executors[0].shutdown()
+
+
+def test_job_is_done_once_rendered_even_if_on_done_fails(monkeypatch):
+    def on_done(job):
+        raise OSError("disk full")
+
+    engine, job = run_job(monkeypatch, on_done)
+    assert job["status"] == "done" and job["size_kb"] == 2.0
+    assert "disk full" in job["error"]
+    assert "IMG_0001.jpg" not in engine.reserved
+
+
+def test_on_done_sees_a_done_job(monkeypatch):
+    seen = []
+    _, job = run_job(monkeypatch, lambda job: seen.append(job["status"]))
+    assert seen == ["done"] and job["error"] is None
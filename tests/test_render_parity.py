@@ -0,0 +1,121 @@
+"""
+Fused single-pass geometry (render_plan.render, draft decoding, the full
+ImageProcessor.process_image path) must match the original step-by-step
+pipeline (render_plan.render_reference) within a tolerance.
+
+check_render_parity.py runs the exhaustive grid on full-size photos as a
+benchmark; these cases use a small image so the suite runs in seconds.
+"""
+
+import io
+import math
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageEnhance, ImageFilter, ImageStat
+
+from image_processor import ImageProcessor
+from render_plan import draft_reduction, plan_geometry, render, render_reference
+
+MAX_SIZE = 300
+MAX_MEAN_DIFF = 2.0   # Mean absolute difference per channel (0-255)
+MIN_PSNR = 30.0       # dB
+# process_image(): both sides are JPEG-encoded, which roughly doubles the difference
+MAX_MEAN_DIFF_ENCODED = 2.5
+
+
+def synthetic_image(width=960, height=640):
+    """Smooth gradients, hard edges and fine texture"""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width // 4, height // 4), 40).resize((width, height), Image.Resampling.BICUBIC)
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(img)
+    for i in range(8):
+        x, y = (i * 97) % width, (i * 61) % height
+        draw.ellipse((x, y, x + width // 6, y + height // 6), outline=(255, 255, 255), width=3)
+        draw.rectangle((y, x % height, y + 50, x % height + 35), fill=(30 * i, 200, 90))
+    return img.filter(ImageFilter.GaussianBlur(2))
+
+
+def jpeg_bytes(img, orientation=1):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=92, exif=exif)
+    return buf.getvalue()
+
+
+def assert_close(actual, expected, max_mean=MAX_MEAN_DIFF, min_psnr=MIN_PSNR):
+    assert actual.size == expected.size
+    diff = ImageChops.difference(actual.convert("RGB"), expected.convert("RGB"))
+    stat = ImageStat.Stat(diff)
+    mean = sum(stat.mean) / 3
+    mse = sum(stat.sum2) / (3 * actual.width * actual.height)
+    psnr = float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+    assert mean <= max_mean and psnr >= min_psnr, f"mean diff {mean:.2f}, PSNR {psnr:.1f} dB"
+
+
+@pytest.fixture(scope="module")
+def source():
+    return synthetic_image()
+
+
+@pytest.mark.parametrize("orientation, rotation, straighten, scale, exposure", [
+    (1, 0, 0.0, 1.0, 0.0),
+    (6, 0, 0.0, 1.0, 0.0),
+    (1, 90, 0.0, 1.6, 0.0),
+    (3, 270, 0.0, 1.0, 0.7),
+    (1, 0, -3.5, 1.0, 0.0),
+    (8, 180, 2.0, 1.6, 0.0),
+])
+def test_fused_matches_reference(source, orientation, rotation, straighten, scale, exposure):
+    data = jpeg_bytes(source, orientation)
+    with Image.open(io.BytesIO(data)) as img:
+        expected = render_reference(img, exposure, rotation, straighten, scale, MAX_SIZE)
+    with Image.open(io.BytesIO(data)) as img:
+        plan = plan_geometry(img.size, orientation, rotation, straighten, scale, MAX_SIZE)
+        actual = render(img.convert("RGB"), plan)
+    if exposure:
+        actual = ImageEnhance.Brightness(actual).enhance(2 ** exposure)
+    assert_close(actual, expected)
+
+
+def test_draft_decode_matches_reference(source):
+    data = jpeg_bytes(source, 6)
+    with Image.open(io.BytesIO(data)) as img:
+        expected = render_reference(img, 0.0, 90, 1.5, 1.0, MAX_SIZE)
+    with Image.open(io.BytesIO(data)) as img:
+        plan = plan_geometry(img.size, 6, 90, 1.5, 1.0, MAX_SIZE)
+        reduction = draft_reduction(plan)
+        assert reduction > 1
+        img.draft(None, (math.ceil(img.width / reduction), math.ceil(img.height / reduction)))
+        assert img.size[0] < source.width
+        actual = render(img.convert("RGB"), plan)
+    assert_close(actual, expected)
+
+
+def processor_config(fused):
+    return {
+        "max_size": MAX_SIZE,
+        "jpeg_quality": 90,
+        "renditions": {"enabled": False},
+        "processing": {
+            "sharpen": False,  # Unsharp masking amplifies resampler differences, not geometry errors
+            "progressive": True,
+            "fused_pipeline": fused,
+            "draft_decode": True,
+            "watermark": {"enabled": False},
+        },
+    }
+
+
+@pytest.mark.parametrize("rotation, straighten, scale", [(0, 0.0, 1.0), (90, -2.0, 1.4)])
+def test_process_image_matches_reference(tmp_path, source, rotation, straighten, scale):
+    src = tmp_path / "src.jpg"
+    src.write_bytes(jpeg_bytes(source, 6))
+    outputs = {}
+    for fused in (True, False):
+        dest = tmp_path / f"out-{fused}.jpg"
+        ImageProcessor(processor_config(fused)).process_image(str(src), str(dest), 0.3, rotation, straighten, scale)
+        with Image.open(dest) as img:
+            outputs[fused] = img.convert("RGB")
+    assert_close(outputs[True], outputs[False], MAX_MEAN_DIFF_ENCODED)
@@ -0,0 +1,48 @@
+"""Rendition file names are content-addressed, so immutable CDN caching never serves stale bytes"""
+
+import os
+
+from PIL import Image
+
+import renditions
+
+SETTINGS = dict(renditions.DEFAULT_SETTINGS, sizes=[200], formats=["jpeg", "webp"])
+JPEG_OPTIONS = {"quality": 85}
+
+
+def _publish(folder, color):
+    img = Image.new("RGB", (600, 400), color)
+    primary = renditions._encode(img, "jpeg", SETTINGS, JPEG_OPTIONS)
+    return renditions.write_renditions(img, os.path.join(folder, "IMG_0001.jpg"), primary, SETTINGS, JPEG_OPTIONS)
+
+
+def test_same_content_same_names(tmp_path):
+    first = renditions.rendition_files(_publish(str(tmp_path), (200, 30, 30)))
+    again = renditions.rendition_files(_publish(str(tmp_path), (200, 30, 30)))
+    assert first and first == again
+
+
+def test_republish_under_same_name_gets_new_urls(tmp_path):
+    folder = str(tmp_path)
+    old = renditions.rendition_files(_publish(folder, (200, 30, 30)))
+    renditions.remove_renditions(folder, "IMG_0001.jpg")  # Unpublish frees the name
+    new = _publish(folder, (30, 30, 200))
+    assert not set(old) & set(renditions.rendition_files(new))
+    for name in renditions.rendition_files(new):
+        assert os.path.exists(os.path.join(folder, name))
+    assert renditions.load_sidecar(folder, "IMG_0001.jpg") == new
+
+
+def test_republished_primary_gets_a_new_version(tmp_path):
+    folder = str(tmp_path)
+    old = renditions.manifest_entry("IMG_0001.jpg", _publish(folder, (200, 30, 30)))
+    new = renditions.manifest_entry("IMG_0001.jpg", _publish(folder, (30, 30, 200)))
+    assert old["v"] and new["v"] and old["v"] != new["v"]
+    assert renditions.manifest_entry("IMG_0001.jpg", {k: v for k, v in new.items() if k != "v"}).get("v") is None
+
+
+def test_rendition_stems_cover_every_naming_scheme():
+    assert "IMG_0001" in renditions.rendition_stems("renditions/IMG_0001.json")
+    assert "IMG_0001" in renditions.rendition_stems("renditions/IMG_0001-400.webp")  # Before content hashes
+    assert "IMG_0001" in renditions.rendition_stems(renditions.rendition_name("IMG_0001.jpg", 400, "webp", b"x"))
+    assert "IMG-7" in renditions.rendition_stems(renditions.rendition_name("IMG-7.jpg", 1600, "jpeg", b"x"))
@@ -0,0 +1,178 @@
+"""S3Uploader against a local S3 stand-in (moto server): upload, resumed multipart upload, delete, list, throttling"""
+
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto_server = pytest.importorskip("moto.server")
+
+from r2_ledger import UploadLedger  # noqa: E402
+from r2_uploader import DEFAULT_R2_SETTINGS, S3Uploader, UploadError  # noqa: E402
+
+BUCKET = "gallery"
+PART = 5 * 1024 * 1024  # S3's smallest multipart part
+
+
+@pytest.fixture(scope="module")
+def endpoint():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    url = f"http://127.0.0.1:{port}"
+    boto3.client("s3", endpoint_url=url, aws_access_key_id="x", aws_secret_access_key="y",
+                 region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    yield url
+    server.stop()
+
+
+def make_uploader(endpoint, prefix, journal=None, **overrides):
+    settings = dict(DEFAULT_R2_SETTINGS, endpoint_url=endpoint, access_key_id="x", secret_access_key="y",
+                    multipart_threshold_mb=5, retries=1, **overrides)
+    return S3Uploader(BUCKET, prefix, settings, journal)
+
+
+def read_object(uploader, name):
+    return uploader.client.get_object(Bucket=BUCKET, Key=uploader._key(name))["Body"].read()
+
+
+class RecordingThrottle:
+    """Stands in for upload_scheduler.TokenBucket: records the bytes taken"""
+
+    rate = 1e12
+
+    def __init__(self):
+        self.taken = 0
+        self._lock = threading.Lock()
+
+    def consume(self, amount, wait=True):
+        with self._lock:
+            self.taken += amount
+
+
+def test_upload_and_list(endpoint, tmp_path):
+    uploader = make_uploader(endpoint, "event-upload")
+    photo = tmp_path / "IMG_0001.jpg"
+    photo.write_bytes(os.urandom(300_000))
+    rendition = tmp_path / "IMG_0001-400.webp"
+    rendition.write_bytes(os.urandom(20_000))
+
+    result = uploader.upload(photo)
+    assert result["name"] == "IMG_0001.jpg" and result["size"] == 300_000 and result["etag"]
+    uploader.upload(rendition, "renditions/IMG_0001-400.webp")
+    uploader.upload_bytes(b"[]", "manifest.json")
+    assert read_object(uploader, "IMG_0001.jpg") == photo.read_bytes()
+
+    top = uploader.list_objects()
+    assert set(top) == {"IMG_0001.jpg", "manifest.json"}
+    assert top["IMG_0001.jpg"]["size"] == 300_000 and top["IMG_0001.jpg"]["etag"] == result["etag"]
+    assert "renditions/IMG_0001-400.webp" in uploader.list_objects(recursive=True)
+
+
+def test_throttle_counts_each_sent_byte_once(endpoint, tmp_path):
+    """Checksum and signing reads must not be charged; only the bytes sent (s3transfer signalling)"""
+    uploader = make_uploader(endpoint, "event-throttle", journal=UploadLedger("event-throttle", tmp_path / "l.db"))
+    throttle = RecordingThrottle()
+    uploader.limit_bandwidth(throttle, 4)
+    small = tmp_path / "small.jpg"
+    small.write_bytes(os.urandom(300_000))
+    large = tmp_path / "large.jpg"
+    large.write_bytes(os.urandom(PART + 100_000))
+
+    uploader.upload(small)
+    assert throttle.taken == 300_000
+    uploader.upload(large)
+    assert throttle.taken == 300_000 + PART + 100_000
+
+
+def test_interrupted_multipart_upload_resumes_from_ledger(endpoint, tmp_path, monkeypatch):
+    ledger = UploadLedger("event-resume", tmp_path / "ledger.db")
+    uploader = make_uploader(endpoint, "event-resume", journal=ledger)
+    large = tmp_path / "IMG_LARGE.jpg"
+    large.write_bytes(os.urandom(2 * PART + 123_456))  # 3 parts
+
+    sent, fail = [], {3}
+
+    def flaky_part(client):
+        upload_part = client.upload_part
+
+        def send(**kwargs):
+            if kwargs["PartNumber"] in fail:
+                fail.discard(kwargs["PartNumber"])
+                raise ConnectionError("network dropped")
+            sent.append(kwargs["PartNumber"])
+            return upload_part(**kwargs)
+        return send
+
+    monkeypatch.setattr(uploader.client, "upload_part", flaky_part(uploader.client))
+    with pytest.raises(UploadError):
+        uploader.upload(large)
+    pending = ledger.multipart_get("IMG_LARGE.jpg")
+    assert pending is not None and pending["size"] == large.stat().st_size
+    assert sorted(sent) == [1, 2]
+
+    # A new process: fresh uploader, same ledger; only the missing part is sent
+    resumed = make_uploader(endpoint, "event-resume", journal=ledger)
+    monkeypatch.setattr(resumed.client, "upload_part", flaky_part(resumed.client))
+    sent.clear()
+    result = resumed.upload(large)
+    assert sent == [3]
+    assert result["etag"].endswith("-3")
+    assert read_object(resumed, "IMG_LARGE.jpg") == large.read_bytes()
+    assert ledger.multipart_get("IMG_LARGE.jpg") is None
+
+
+def small_pages(client, monkeypatch, page_size=50):
+    """list_objects_v2 pages of page_size keys, so a few objects exercise the pagination"""
+    get_paginator = client.get_paginator
+
+    def paginator(name):
+        real = get_paginator(name)
+        paginate = real.paginate
+        real.paginate = lambda **kwargs: paginate(PaginationConfig={"PageSize": page_size}, **kwargs)
+        return real
+
+    monkeypatch.setattr(client, "get_paginator", paginator)
+
+
+def test_list_follows_pagination(endpoint, monkeypatch):
+    uploader = make_uploader(endpoint, "event-list")
+    names = [f"p{i:03d}.jpg" for i in range(120)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda n: uploader.upload_bytes(b"x", n), names))
+    small_pages(uploader.client, monkeypatch)
+    assert set(uploader.list_objects()) == set(names)
+
+
+def test_delete_splits_batches_and_reports_per_key_errors(endpoint, monkeypatch):
+    uploader = make_uploader(endpoint, "event-delete")
+    stored = [f"p{i:04d}.jpg" for i in range(20)]
+    for name in stored:
+        uploader.upload_bytes(b"x", name)
+    # DeleteObjects takes at most 1000 keys; keys that don't exist count as deleted
+    names = stored + [f"gone{i:04d}.jpg" for i in range(985)]
+
+    requests = []
+    delete_objects = uploader.client.delete_objects
+
+    def with_one_error(**kwargs):
+        keys = [o["Key"] for o in kwargs["Delete"]["Objects"]]
+        requests.append(len(keys))
+        locked = uploader._key("p0007.jpg")
+        kwargs["Delete"]["Objects"] = [o for o in kwargs["Delete"]["Objects"] if o["Key"] != locked]
+        response = delete_objects(**kwargs)
+        if locked in keys:
+            response.setdefault("Errors", []).append({"Key": locked, "Code": "AccessDenied"})
+        return response
+
+    monkeypatch.setattr(uploader.client, "delete_objects", with_one_error)
+    deleted, failed = uploader.delete(names, parallelism=1)
+    assert sorted(requests) == [5, 1000]
+    assert failed == ["p0007.jpg"]
+    assert len(deleted) == 1004
+    assert set(uploader.list_objects()) == {"p0007.jpg"}
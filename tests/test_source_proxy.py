@@ -0,0 +1,60 @@
+"""Publish workers decode a frame into their proxy cache at most once, and never for a zoom the proxy can't serve"""
+
+import io
+
+import pytest
+from PIL import Image
+
+import publish_engine
+import source_proxy
+from image_processor import ImageProcessor
+from publish_engine import _source_cache
+
+MAX_SIZE = 300
+
+
+@pytest.fixture(autouse=True)
+def fresh_worker_cache(monkeypatch):
+    monkeypatch.setattr(publish_engine, "_worker_sources", None)
+
+
+def make_processor():
+    config = {
+        "max_size": MAX_SIZE,
+        "source_cache_mb": 64,
+        "processing": {"sharpen": False, "fused_pipeline": True, "draft_decode": True,
+                       "watermark": {"enabled": False}},
+    }
+    return ImageProcessor(config, _source_cache(config))
+
+
+def write_source(path, size=(2400, 1600)):
+    buf = io.BytesIO()
+    Image.linear_gradient("L").resize(size).convert("RGB").save(buf, "JPEG", quality=90)
+    path.write_bytes(buf.getvalue())
+    return str(path)
+
+
+def test_predicted_proxy_size_matches_decode(tmp_path):
+    path = write_source(tmp_path / "src.jpg")
+    cache = _source_cache({"max_size": MAX_SIZE, "source_cache_mb": 64})
+    with Image.open(path) as img:
+        predicted = source_proxy.proxy_long_edge(img, cache.max_size, cache.min_size)
+    proxy = cache.get(path)
+    assert max(proxy.image.size) == predicted
+    assert proxy.image.size == (600, 400)  # The 1/4 DCT-scaled decode itself, no extra resample
+
+
+def test_republish_reuses_proxy_and_deep_zoom_skips_it(tmp_path, monkeypatch):
+    path = write_source(tmp_path / "src.jpg")
+    processor = make_processor()
+    built = []
+    load = source_proxy.SourceProxy._load
+    monkeypatch.setattr(source_proxy.SourceProxy, "_load", lambda self, img, *a: built.append(1) or load(self, img, *a))
+
+    processor._render_source(path, 0.0, 0, 0.0, 4.0)  # Needs more pixels than a proxy keeps
+    assert built == [] and not processor.source_cache._entries
+    processor._render_source(path, 0.0, 0, 0.0, 1.0)
+    processor._render_source(path, 0.5, 90, 2.0, 1.2)
+    assert built == [1]
+    assert processor.source_cache.hits == 1
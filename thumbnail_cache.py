@@ -0,0 +1,125 @@
+"""
+Derived-preview cache for the admin dashboard.
+
+Camera originals in the buffer folder are 12-25 MB JPEGs; the admin UI only
+ever needs a screen-sized preview of them. Previews are generated once per
+source (keyed by path + mtime + size + width), stored on disk, and evicted
+least-recently-used once the cache grows past its byte budget.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Preview widths we are willing to generate; requests are snapped up to one of these
+# so a handful of cache entries per source covers every client.
+THUMB_WIDTHS = (200, 400, 800, 1600)
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir: str, max_bytes: int, quality: int = 80):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from what is already on disk (access time order)"""
+        found = []
+        for f in os.listdir(self.cache_dir):
+            if not f.endswith(".jpg"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, f))
+            except OSError:
+                continue
+            found.append((stat.st_mtime, f[:-4], stat.st_size))
+        found.sort()
+        for _, key, size in found:
+            self._entries[key] = size
+            self._total_bytes += size
+        logger.info(f"Thumbnail cache: {len(self._entries)} previews "
+                    f"({self._total_bytes / 1024 / 1024:.1f}MB) in {self.cache_dir}")
+
+    @staticmethod
+    def snap_width(width: int) -> int:
+        for w in THUMB_WIDTHS:
+            if width <= w:
+                return w
+        return THUMB_WIDTHS[-1]
+
+    @staticmethod
+    def make_key(source_path: str, width: int) -> str:
+        stat = os.stat(source_path)
+        raw = f"{os.path.abspath(source_path)}|{stat.st_mtime_ns}|{stat.st_size}|{width}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".jpg")
+
+    def get(self, source_path: str, width: int):
+        """
+        Return (cache_path, key) for a preview of source_path at most `width` pixels
+        on its long edge, generating it on first use.
+        """
+        width = self.snap_width(width)
+        key = self.make_key(source_path, width)
+        path = self._path_for(key)
+
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                hit = True
+            else:
+                hit = False
+        if hit:
+            try:
+                os.utime(path)  # Persist recency so LRU order survives restarts
+            except OSError:
+                pass
+            return path, key
+
+        size = self._render(source_path, path, width)
+        with self._lock:
+            old = self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size - old
+            self._evict_locked()
+        return path, key
+
+    def _render(self, source_path: str, dest_path: str, width: int) -> int:
+        with Image.open(source_path) as img:
+            # JPEG DCT scaling: let libjpeg decode at 1/2, 1/4 or 1/8 resolution
+            # instead of inflating all 24+ MP just to throw most of them away.
+            img.draft("RGB", (width, width))
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((width, width), Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+            tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+            img.save(tmp_path, "JPEG", quality=self.quality)
+            os.replace(tmp_path, dest_path)
+        return os.path.getsize(dest_path)
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path_for(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
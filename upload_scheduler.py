@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+上傳排程器 - Live Event Photography
+
+網路斷線恢復後，積壓的檔案要照現場最需要的順序上傳，而不是任意順序：
+  - 優先佇列：manifest 不排隊 (呼叫端直接上傳)，照片依呼叫端給的優先序，
+    sync_to_r2.py 用「最新發布的照片先、同一張照片的小縮圖先於大圖」
+  - 固定數量的上傳槽 (upload_slots)：每個槽一次傳一個檔案
+  - 令牌桶 (token bucket) 限制總上傳頻寬 (max_upload_mbps)，保留會場上行頻寬給操作人員：
+    S3 後端在資料送出時邊傳邊取用令牌，連線本身被放慢；rclone 後端以 --bwlimit 平分給各上傳槽
+
+UploadScheduler 包住原本的上傳後端 (S3Uploader / RcloneUploader)，介面相同，
+另外提供 submit() 讓呼叫端指定優先序並取得 Future，不必等整批上傳完成。
+"""
+
+import time
+import heapq
+import logging
+import itertools
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+
+from r2_uploader import UploaderBackend, _upload_items
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_DEFAULT = (1,)
+
+
+class TokenBucket:
+    """
+    每秒補充 rate 個令牌 (位元組)，最多累積 burst 個；rate <= 0 表示不限速
+    令牌可以預支成負數：取用者睡到欠額補回為止，同時取用的執行緒自然依序排隊
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(int(rate), 64 * 1024)  # 預設可累積 1 秒
+        self.waited = 0.0  # 因限速累計等待的秒數
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount, wait=True):
+        """取用 amount 個令牌，不夠時等待 (wait=False 只記帳不等待，給不能延後的小檔)"""
+        if self.rate <= 0:
+            return
+        while amount > 0:
+            take = min(amount, self.burst)  # 大檔分段取用，不會一次欠下好幾秒
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= take
+                delay = -self._tokens / self.rate if self._tokens < 0 and wait else 0
+            if delay:
+                time.sleep(delay)
+                with self._lock:
+                    self.waited += delay  # 各上傳槽的等待時間加總
+            amount -= take
+
+
+class UploadScheduler(UploaderBackend):
+    """以優先佇列 + 固定上傳槽 + 令牌桶包住上傳後端；priority 為 tuple，越小越先"""
+
+    def __init__(self, backend, slots=4, max_upload_mbps=0):
+        self.backend = backend
+        self.concurrency = max(1, int(slots))
+        self.max_upload_mbps = float(max_upload_mbps or 0)
+        self.bucket = TokenBucket(self.max_upload_mbps * 1_000_000 / 8)
+        if self.max_upload_mbps > 0:
+            backend.limit_bandwidth(self.bucket, self.concurrency)
+        limit = f"，限速 {self.max_upload_mbps:g} Mbps" if self.max_upload_mbps > 0 else ""
+        self.description = f"{backend.description}，{self.concurrency} 個上傳槽{limit}"
+        self._heap = []  # (priority, 序號, 路徑, 物件名稱, Future)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._in_flight = 0
+        self._counters = {"uploaded": 0, "failed": 0, "bytes": 0}
+
+    def submit(self, local_path, name=None, priority=PRIORITY_DEFAULT):
+        """排入上傳佇列，回傳 Future (結果同 upload())"""
+        local_path = Path(local_path)
+        future = Future()
+        with self._cond:
+            heapq.heappush(self._heap, (priority, next(self._seq), local_path, name or local_path.name, future))
+            while len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._worker, name=f"upload-slot-{len(self._threads) + 1}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify()
+        return future
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, local_path, name, future = heapq.heappop(self._heap)
+                self._in_flight += 1
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = self.backend.upload(local_path, name)
+                except Exception as e:
+                    with self._cond:
+                        self._counters["failed"] += 1
+                    future.set_exception(e)
+                else:
+                    with self._cond:
+                        self._counters["uploaded"] += 1
+                        self._counters["bytes"] += result.get("size") or 0
+                    future.set_result(result)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def upload(self, local_path, name=None):
+        return self.submit(local_path, name).result()
+
+    def upload_bytes(self, data, name, content_type=None):
+        """manifest 等小檔：不排隊、不等令牌 (只記入頻寬用量)，永遠最先送出"""
+        self.bucket.consume(len(data), wait=False)
+        return self.backend.upload_bytes(data, name, content_type)
+
+    def upload_many(self, local_paths):
+        """整批排入佇列並等待完成；沒有指定優先序時，最新的檔案先、同時間的小檔先"""
+        futures = {}
+        for path, name in _upload_items(local_paths):
+            try:
+                stat = path.stat()
+                priority = (PRIORITY_DEFAULT[0], -stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                priority = PRIORITY_DEFAULT  # 交給上傳回報失敗
+            futures[name] = self.submit(path, name, priority)
+        results, failed = [], []
+        for name, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.warning(f"上傳失敗 {name}: {e}")
+                failed.append(name)
+        return results, failed
+
+    def delete(self, names, parallelism=None):
+        return self.backend.delete(names, parallelism)
+
+    def list_objects(self, recursive=False):
+        return self.backend.list_objects(recursive)
+
+    def stats(self):
+        """佇列長度、上傳中檔案數、累計上傳量與限速等待時間"""
+        with self._cond:
+            return {"queued": len(self._heap), "in_flight": self._in_flight, **self._counters,
+                    "throttled_s": round(self.bucket.waited, 1)}